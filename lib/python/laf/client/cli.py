@@ -6,7 +6,6 @@ import os
 import socket
 import sys
 import traceback
-import yaml
 
 from laf.client import io
 from laf.client import cmdline
@@ -18,6 +17,7 @@ from laf.server.app import loneinterface
 from laf.server.app import error
 from laf.server.app import remotehandler
 from laf.server.app import localhandler
+from laf.server.app import yamlcodec
 
 __all__ = ['run']
 
@@ -52,7 +52,7 @@ def run(loneclass):
                               ex.lonename, ex.verb,
                               ex.pk, ex.obj,
                               lhost, luser)
-        print(yaml.dump(res, default_flow_style=False))
+        print(yamlcodec.dump(res, default_flow_style=False))
         sys.exit(0)
     #  Create the lone's family configuration object
     try:
@@ -67,7 +67,7 @@ def run(loneclass):
                               args['input'],
                               lhost,
                               luser)
-        print(yaml.dump(res, default_flow_style=False))
+        print(yamlcodec.dump(res, default_flow_style=False))
         sys.exit(0)
     #  Initialize logging
     #  logger.init()
@@ -110,7 +110,7 @@ def run(loneclass):
 
     for result in results:
         if result:
-            print(yaml.dump(result, default_flow_style=False))
+            print(yamlcodec.dump(result, default_flow_style=False))
 
 
 # R0912: too-many-branches), _make_requests]
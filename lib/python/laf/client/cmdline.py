@@ -6,10 +6,10 @@ import traceback
 import re
 import functools
 import argparse
-import yaml
 
 from laf.server.app import utils
 from laf.server.app import cmdutils
+from laf.server.app import yamlcodec
 
 from laf.client import io
 
@@ -117,7 +117,7 @@ def _get_lone_cli_conf(lonename, rootdir):
                                    LONE_CONFIG % {'lonename': lonename})
     if os.path.exists(lone_configfile) and os.path.isfile(lone_configfile):
         f = open(lone_configfile, 'r')
-        lone_config = yaml.load(f.read())
+        lone_config = yamlcodec.load(f.read())
     else:
         lone_config = {}
 
@@ -314,7 +314,7 @@ def _get_yaml_from_cmdline(args):
     rest = []
     for arg in enumerate(args):
         if arg[1].startswith('---'):  # pylint: disable=R1723
-            obj = yaml.load(' '.join(args[arg[0]:]))
+            obj = yamlcodec.load(' '.join(args[arg[0]:]))
             break
         else:
             rest.append(arg[1])
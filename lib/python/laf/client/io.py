@@ -1,7 +1,7 @@
 """Input / Output functions."""
 
 import sys
-import yaml
+from laf.server.app import yamlcodec
 
 __all__ = ['read_stdin']
 
@@ -21,4 +21,4 @@ def read_stdin(message=None, ask_tty=False):
         print(message, file=sys.stderr)
 
     stdin_input = sys.stdin.read()
-    return yaml.load(stdin_input)
+    return yamlcodec.load(stdin_input)
@@ -4,5 +4,6 @@ API exposed for laf clients
 # W0611: unused-import
 # pylint: disable=W0611
 from laf.server.app.loneinterface import LoneAPI, longrunning, journallog
+from laf.server.app.loneinterface import timeout, cache
 from laf.client.cli import run
-from laf.client.loneexception import LoneException
+from laf.client.loneexception import LoneException, LoneTimeout
@@ -7,3 +7,9 @@ class LoneException(Exception):
     """
     Lone exception
     """
+
+
+class LoneTimeout(LoneException):
+    """
+    Lone handler ran out of time
+    """
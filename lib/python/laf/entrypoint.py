@@ -5,12 +5,21 @@ LAF broker startup
 
 import argparse
 import logging
+import os
+import socket
 import sys
+# E0401: Unable to import 'zmq'
+import zmq  # pylint: disable=E0401
 
 from laf.server import logger
 from laf.server import broker
+from laf.server import protocol
+from laf.server import scheduler
+from laf.server import supervisor
 from laf import laf_server_gunicorn
 from laf.server import worker
+from laf.server import zygote
+from laf.server.app import config
 
 _LOG = logging.getLogger()
 
@@ -24,6 +33,10 @@ def laf_worker_start():
         sys.exit('basedir missing')
     basedir = sys.argv[1]
     _LOG.info("input argument basedir: %s", basedir)
+    if os.environ.get('LAF_ZYGOTE'):
+        # Preload the lones and fork the workers for the broker
+        zygote.main(basedir)
+        return
     loneworker = worker.Worker(basedir)
     loneworker.run()
 
@@ -37,7 +50,8 @@ def laf_broker_start():
     parser.add_argument('-b', '--basedir', required=True,
                         help='basedir of family')
     parser.add_argument('-w', '--workers', required=True,
-                        help='number of laf workers')
+                        help='number of laf workers to start with, per pool '
+                        'not sized in etc/laf-server.yml')
     parser.add_argument('-d', '--daemon', default=False,
                         help='start workers as daemon')
     parser.add_argument('--client_socket',
@@ -55,6 +69,98 @@ def laf_broker_start():
                         help='Notification message socket')
     parser.add_argument('--journal_sock',
                         help='journal process socket')
+    parser.add_argument('--queue_size', type=int,
+                        default=broker.DEFAULT_QUEUE_SIZE,
+                        help='requests queued while all workers are busy')
+    parser.add_argument('--queue_timeout', type=float,
+                        default=broker.DEFAULT_QUEUE_TIMEOUT,
+                        help='seconds a request may wait for a worker')
+    parser.add_argument('--kill_grace', type=float,
+                        default=broker.DEFAULT_KILL_GRACE,
+                        help='seconds a worker may overrun a deadline')
+    parser.add_argument('--min_workers', type=int,
+                        help='minimum number of laf workers when scaling')
+    parser.add_argument('--max_workers', type=int,
+                        help='maximum number of laf workers when scaling')
+    parser.add_argument('--preload', action='store_true',
+                        help='load the lones once in a zygote process '
+                        'and fork the laf workers from it')
+    parser.add_argument('--worker_threads', type=int, default=1,
+                        help='requests served at once by each laf worker, '
+                        'above 1 @timeout and LAF-TIMEOUT do not interrupt '
+                        'the handlers, a laf worker is replaced once one '
+                        'overran its deadline by kill_grace')
+    parser.add_argument('--longrunning_procs', type=int,
+                        default=worker.DEFAULT_LONGRUNNING_PROCS,
+                        help='processes of each laf worker running '
+                        '@longrunning handlers, 0 to run them in the worker')
+    parser.add_argument('--longrunning_backlog', type=int,
+                        default=worker.DEFAULT_LONGRUNNING_BACKLOG,
+                        help='@longrunning requests waiting for a process '
+                        'before new ones are rejected')
+    parser.add_argument('--max_requests', type=int, default=0,
+                        help='requests a laf worker serves before it is '
+                        'replaced, 0 for no limit')
+    parser.add_argument('--max_requests_jitter', type=int, default=0,
+                        help='random number of requests up to this added '
+                        'to max_requests of each laf worker')
+    parser.add_argument('--max_worker_age', type=float, default=0,
+                        help='seconds after which a laf worker is '
+                        'replaced, 0 for no limit')
+    parser.add_argument('--max_worker_rss', type=int, default=0,
+                        help='resident memory in MB above which a laf '
+                        'worker is replaced, 0 for no limit')
+    parser.add_argument('--heartbeat_interval', type=float,
+                        default=protocol.HEARTBEAT_INTERVAL,
+                        help='seconds between two heartbeats of the broker '
+                        'and of the laf workers')
+    parser.add_argument('--heartbeat_liveness', type=int,
+                        default=protocol.HEARTBEAT_LIVENESS,
+                        help='heartbeats missed before a laf worker or the '
+                        'broker is declared dead')
+    parser.add_argument('--remote_socket',
+                        help='socket laf workers of other hosts connect to, '
+                        'e.g. tcp://*:5555. Unless --remote_curve_cert or '
+                        '--remote_allow restrict it, any host reaching it '
+                        'may join as a laf worker and read the requests')
+    parser.add_argument('--remote_curve_cert',
+                        help='secret CURVE certificate of the broker, made '
+                        'with zmq.auth.create_certificates, encrypting '
+                        'the remote socket')
+    parser.add_argument('--remote_curve_clients',
+                        help='directory of the public CURVE certificates '
+                        'of the hosts whose laf workers may join')
+    parser.add_argument('--remote_allow', type=broker.parse_hosts,
+                        help='comma separated addresses the laf workers '
+                        'of other hosts may connect from')
+    parser.add_argument('--control_socket',
+                        help='zmq socket taking metrics, resize, drain and '
+                        'reload commands, e.g. ipc://@control.ipc')
+    parser.add_argument('--metrics_port', type=int,
+                        help='port serving the metrics over HTTP at /metrics')
+    parser.add_argument('--drain_timeout', type=float,
+                        default=broker.DEFAULT_DRAIN_TIMEOUT,
+                        help='seconds the broker waits on SIGTERM for the '
+                        'requests to be served before killing the workers')
+    parser.add_argument('--start_timeout', type=float,
+                        default=broker.DEFAULT_START_TIMEOUT,
+                        help='seconds a new laf worker may take to connect '
+                        'before it is killed and replaced')
+    parser.add_argument('--priority_policy',
+                        choices=scheduler.POLICIES,
+                        default=scheduler.STRICT,
+                        help='order in which priority classes are served')
+    parser.add_argument('--priority_weights', type=scheduler.parse_weights,
+                        default=scheduler.DEFAULT_WEIGHTS,
+                        help='weights of the priority classes, e.g. '
+                        'interactive=6,write=3,longrunning=1')
+    parser.add_argument('--reserved_share', type=float,
+                        default=broker.DEFAULT_RESERVED_SHARE,
+                        help='share of workers kept for interactive requests')
+    parser.add_argument('--stats_interval', type=float,
+                        default=broker.DEFAULT_STATS_INTERVAL,
+                        help='seconds between priority class reports, '
+                        '0 to disable')
     args = parser.parse_args()
     _LOG.info("""input argument basedir: %s, workers:%s,
               daemon %s, worker bin:%s, deployment:%s""",
@@ -67,7 +173,141 @@ def laf_broker_start():
                 args.worker_bin,
                 args.deployment,
                 args.notify_sock,
-                args.journal_sock)
+                args.journal_sock,
+                {'queue_size': args.queue_size,
+                 'queue_timeout': args.queue_timeout,
+                 'kill_grace': args.kill_grace,
+                 'min_workers': args.min_workers,
+                 'max_workers': args.max_workers,
+                 'preload': args.preload,
+                 'worker_threads': args.worker_threads,
+                 'longrunning_procs': args.longrunning_procs,
+                 'longrunning_backlog': args.longrunning_backlog,
+                 'max_requests': args.max_requests,
+                 'max_requests_jitter': args.max_requests_jitter,
+                 'max_worker_age': args.max_worker_age,
+                 'max_worker_rss': args.max_worker_rss,
+                 'heartbeat_interval': args.heartbeat_interval,
+                 'heartbeat_liveness': args.heartbeat_liveness,
+                 'remote_socket': args.remote_socket,
+                 'remote_curve_cert': args.remote_curve_cert,
+                 'remote_curve_clients': args.remote_curve_clients,
+                 'remote_allow': args.remote_allow,
+                 'control_socket': args.control_socket,
+                 'metrics_port': args.metrics_port,
+                 'drain_timeout': args.drain_timeout,
+                 'start_timeout': args.start_timeout,
+                 'priority_policy': args.priority_policy,
+                 'priority_weights': args.priority_weights,
+                 'reserved_share': args.reserved_share,
+                 'stats_interval': args.stats_interval})
+
+
+def laf_broker_ctl_start():
+    """
+    Send a command to the control socket of a broker
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--control_socket',
+                        default='ipc://@control.ipc',
+                        help='control socket of the broker')
+    parser.add_argument('--timeout', type=float, default=10,
+                        help='seconds to wait for the answer')
+    parser.add_argument('command', nargs='+',
+                        help='metrics, resize <pool> <workers> '
+                        'or drain <worker>')
+    args = parser.parse_args()
+    context = zmq.Context.instance()
+    control = context.socket(zmq.REQ)
+    control.setsockopt(zmq.LINGER, 0)
+    control.connect(args.control_socket)
+    control.send_multipart([word.encode() for word in args.command])
+    if not control.poll(args.timeout * 1000):
+        sys.exit('no answer from the broker')
+    print(control.recv().decode().rstrip('\n'))
+    control.close()
+
+
+def laf_supervisor_start():
+    """
+    Start the laf workers of a host attached to a remote broker
+    """
+    logger.init()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', '--basedir', required=True,
+                        help='basedir of family')
+    parser.add_argument('-w', '--workers', type=int, required=True,
+                        help='number of laf workers to run')
+    parser.add_argument('--broker', required=True,
+                        help='remote socket of the broker, '
+                        'e.g. tcp://broker:5555')
+    parser.add_argument('--deployment', required=True,
+                        help='Deployment of LAF Server')
+    parser.add_argument('--curve_server_key',
+                        help='public CURVE certificate of the broker, when '
+                        'it encrypts its remote socket')
+    parser.add_argument('--curve_cert',
+                        help='secret CURVE certificate of this host, when '
+                        'the broker only lets known hosts join')
+    parser.add_argument('--pool', default=config.DEFAULT_POOL,
+                        help='worker pool the laf workers join')
+    parser.add_argument('--host', default=socket.gethostname(),
+                        help='name of this host for the broker')
+    parser.add_argument('--worker_bin', default='laf_worker',
+                        help='worker binary')
+    parser.add_argument('--notify_sock',
+                        help='Notification message socket')
+    parser.add_argument('--journal_sock',
+                        help='journal process socket')
+    parser.add_argument('--worker_threads', type=int, default=1,
+                        help='requests served at once by each laf worker')
+    parser.add_argument('--longrunning_procs', type=int,
+                        default=worker.DEFAULT_LONGRUNNING_PROCS,
+                        help='processes of each laf worker running '
+                        '@longrunning handlers, 0 to run them in the worker')
+    parser.add_argument('--heartbeat_interval', type=float,
+                        default=protocol.HEARTBEAT_INTERVAL,
+                        help='seconds between two heartbeats, as set '
+                        'on the broker')
+    parser.add_argument('--heartbeat_liveness', type=int,
+                        default=protocol.HEARTBEAT_LIVENESS,
+                        help='heartbeats missed before the broker is '
+                        'declared dead')
+    parser.add_argument('--max_requests', type=int, default=0,
+                        help='requests a laf worker serves before it is '
+                        'replaced, 0 for no limit')
+    parser.add_argument('--max_worker_age', type=float, default=0,
+                        help='seconds after which a laf worker is '
+                        'replaced, 0 for no limit')
+    parser.add_argument('--max_worker_rss', type=int, default=0,
+                        help='resident memory in MB above which a laf '
+                        'worker is replaced, 0 for no limit')
+    args = parser.parse_args()
+    if not args.host:
+        sys.exit('host name missing')
+    worker_env = {
+        'WORKER_SOCKET': args.broker,
+        'LAF_DEPLOYMENT': args.deployment,
+        'LAF_POOL': args.pool,
+        'LAF_WORKER_HOST': args.host,
+        'LAF_WORKER_THREADS': str(args.worker_threads),
+        'LAF_LONGRUNNING_PROCS': str(args.longrunning_procs),
+        'LAF_HEARTBEAT_INTERVAL': str(args.heartbeat_interval),
+        'LAF_HEARTBEAT_LIVENESS': str(args.heartbeat_liveness),
+        'LAF_MAX_REQUESTS': str(args.max_requests),
+        'LAF_MAX_AGE': str(args.max_worker_age),
+        'LAF_MAX_RSS': str(args.max_worker_rss)
+    }
+    if args.notify_sock:
+        worker_env['NOTIFICATION_SOCK'] = args.notify_sock
+    if args.journal_sock:
+        worker_env['JOURNAL_SOCK'] = args.journal_sock
+    if args.curve_server_key:
+        worker_env['LAF_CURVE_SERVERKEY'] = args.curve_server_key
+    if args.curve_cert:
+        worker_env['LAF_CURVE_CERT'] = args.curve_cert
+    supervisor.Supervisor(args.worker_bin, args.basedir,
+                          args.workers, worker_env).run()
 
 
 def laf_server_gunicorn_start():
@@ -98,5 +338,20 @@ def laf_server_gunicorn_start():
                         help='Validation process socket')
     parser.add_argument('--authorization_sock',
                         help='Authorization process socket')
+    parser.add_argument('--request_timeout', type=float,
+                        help='default request timeout in seconds')
+    parser.add_argument('--wire_codec', choices=protocol.CODECS,
+                        default=protocol.DEFAULT_CODEC,
+                        help='encoding of the requests sent to the workers')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of gunicorn workers')
+    parser.add_argument('--worker_class', default='sync',
+                        choices=('sync', 'gthread', 'gevent'),
+                        help='type of gunicorn workers, gevent workers '
+                        'multiplex their requests over one broker socket')
+    parser.add_argument('--worker_connections', type=int, default=1000,
+                        help='concurrent requests of a gevent worker')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='threads of a gthread worker')
     args = parser.parse_args()
     laf_server_gunicorn.main(args)
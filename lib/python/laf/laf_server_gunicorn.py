@@ -16,10 +16,11 @@ class FlaskApp(Application):
     Load flask application by gunicorn web server
     """
 
-    def __init__(self, app, host, port=None):
+    def __init__(self, app, host, port=None, options=None):
         self.app = app
         self.host = host
         self.port = port
+        self.options = options or dict()
         super(FlaskApp, self).__init__()
 
     def init(self, parser, opts, args):
@@ -28,7 +29,10 @@ class FlaskApp(Application):
         """
         connection_details = '{0}:{1}'.format(self.host, self.port)
         _LOG.info('connection details is %s', connection_details)
-        return {'bind': connection_details}
+        cfg = {key: value for key, value in self.options.items()
+               if value is not None}
+        cfg['bind'] = connection_details
+        return cfg
 
     def load(self):
         """
@@ -50,6 +54,15 @@ def main(args):
                                args.deployment, args.auth_type,
                                args.auth_data,
                                args.validation_sock,
-                               args.authorization_sock)
+                               args.authorization_sock,
+                               args.request_timeout,
+                               args.wire_codec,
+                               args.worker_class == 'gevent')
+    options = {'workers': args.workers,
+               'worker_class': args.worker_class,
+               'threads': args.threads}
+    if args.worker_class == 'gevent':
+        # Requests of the greenlets share one broker socket per worker
+        options['worker_connections'] = args.worker_connections
     sys.argv = sys.argv[:1]
-    FlaskApp(app, args.host, args.port).run()
+    FlaskApp(app, args.host, args.port, options).run()
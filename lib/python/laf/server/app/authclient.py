@@ -3,13 +3,13 @@ Auth client
 """
 
 import http.client
-import json
 import logging
 import requests
 from flask import current_app  # noqa: E402
 import requests_unixsocket  # noqa: E402, pylint: disable=E0401
 requests_unixsocket.monkeypatch()
 from laf.server.app import error
+from laf.server.app import jsoncodec
 _LOG = logging.getLogger(__name__)
 
 
@@ -42,7 +42,7 @@ def authorize(request, version):
                           json=final_req,
                           headers={"Accept": 'application/json',
                                    'Content-Type': 'application/json'})
-    response = json.loads(reply.content.decode())
+    response = jsoncodec.loads(reply.content)
     if reply.status_code != http.client.OK:
         raise error.APIError(response['message'],
                              reply.status_code,
@@ -83,7 +83,7 @@ def obo_authorize(request, version):
                           json=final_req,
                           headers={"Accept": 'application/json',
                                    'Content-Type': 'application/json'})
-    response = json.loads(reply.content.decode())
+    response = jsoncodec.loads(reply.content)
     if reply.status_code != http.client.OK:
         raise error.APIError(response['message'],
                              reply.status_code,
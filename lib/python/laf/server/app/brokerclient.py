@@ -0,0 +1,256 @@
+"""
+Persistent zeromq client used by
+the laf server to talk to the broker
+
+Sync and threaded gunicorn workers use a pool of DEALER sockets, one
+per request in flight. gevent workers share a single DEALER socket
+between all their requests, which are told apart by a correlation id.
+
+A reply streamed by a worker comes in several parts, see replies().
+"""
+
+import itertools
+import logging
+import os
+import struct
+import threading
+# E0401: Unable to import 'zmq'
+import zmq  # pylint: disable=E0401
+
+from laf.server import protocol
+
+try:
+    # E0401: Unable to import 'gevent'
+    import gevent  # pylint: disable=E0401
+    from gevent import queue as gevent_queue  # pylint: disable=E0401
+    from zmq import green as green_zmq  # pylint: disable=E0401
+except ImportError:
+    gevent = None
+
+__all__ = ['BrokerClient', 'MultiplexedBrokerClient', 'BrokerTimeout',
+           'get_client']
+
+_LOG = logging.getLogger(__name__)
+
+# Number of idle sockets kept connected per process
+MAX_IDLE_SOCKETS = 8
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+class BrokerTimeout(Exception):
+    """
+    No reply from the broker in time
+    """
+
+
+class BrokerClient():
+    """
+    Pool of DEALER sockets connected to the broker frontend,
+    a socket serves one request at a time.
+
+    A client belongs to the process that created it: the zmq context
+    is never carried across a fork, see get_client.
+    """
+
+    def __init__(self, url, max_idle=MAX_IDLE_SOCKETS):
+        self.url = url
+        self.max_idle = max_idle
+        self.pid = os.getpid()
+        self.context = zmq.Context()
+        self._idle = list()
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def _new_socket(self):
+        """
+        Create a new DEALER socket connected to the broker
+        """
+        with self._lock:
+            self._count += 1
+            count = self._count
+        socket = self.context.socket(zmq.DEALER)
+        socket.setsockopt(zmq.LINGER, 0)
+        # The broker drops what a client is too slow to take, never
+        # limit the parts of a streamed reply queued here
+        socket.setsockopt(zmq.RCVHWM, 0)
+        socket.identity = (
+            u"client-%d-%d" % (self.pid, count)).encode('ascii')
+        socket.connect(self.url)
+        _LOG.debug('new broker socket %r', socket.identity)
+        return socket
+
+    def acquire(self):
+        """
+        Get an idle socket from the pool or connect a new one
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._new_socket()
+
+    def release(self, socket):
+        """
+        Give a socket back to the pool once its reply was received
+        """
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(socket)
+                return
+        socket.close()
+
+    def discard(self, socket):
+        """
+        Drop a socket which may still get the reply, or the
+        rest of the reply, of a request given up on
+        """
+        _LOG.debug('discarding broker socket %r', socket.identity)
+        socket.close(linger=0)
+
+    def request(self, frames, timeout=None):
+        """
+        Send the frames of a request to the broker and wait for the
+        frames of its reply, at most timeout seconds if given
+        """
+        return next(self.replies(frames, timeout))
+
+    def replies(self, frames, timeout=None):
+        """
+        Send the frames of a request to the broker and yield the
+        frames of the parts of its reply, waiting at most timeout
+        seconds for each part if given
+        """
+        socket = self.acquire()
+        try:
+            socket.send_multipart([b''] + frames, copy=False)
+            while True:
+                if timeout is not None:
+                    if not socket.poll(max(0, int(timeout * 1000))):
+                        raise BrokerTimeout(
+                            'No reply from broker in {0}s'.format(timeout))
+                # [empty][header][payload]
+                reply = socket.recv_multipart(copy=False)[1:]
+                if not protocol.has_more(reply):
+                    break
+                yield reply
+        except BaseException:
+            # A reply may still be on its way to this socket,
+            # never put it back into the pool
+            self.discard(socket)
+            raise
+        self.release(socket)
+        yield reply
+
+    def close(self):
+        """
+        Close all the pooled sockets and the context
+        """
+        with self._lock:
+            idle, self._idle = self._idle, list()
+        for socket in idle:
+            socket.close(linger=0)
+        self.context.term()
+
+
+class MultiplexedBrokerClient():
+    """
+    DEALER socket connected to the broker frontend, shared by all the
+    greenlets of a gevent gunicorn worker. Each request is sent with a
+    correlation id which the broker sends back with the reply.
+    """
+
+    def __init__(self, url):
+        if gevent is None:
+            raise RuntimeError('The multiplexed broker client needs gevent')
+        self.url = url
+        self.pid = os.getpid()
+        self.context = green_zmq.Context()
+        self.socket = self.context.socket(zmq.DEALER)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.setsockopt(zmq.RCVHWM, 0)
+        self.socket.identity = (u"client-%d-mux" % self.pid).encode('ascii')
+        self.socket.connect(url)
+        # Queues of the replies waited for by correlation id
+        self._pending = dict()
+        self._ids = itertools.count()
+        self._reader = gevent.spawn(self._read)
+
+    def _read(self):
+        """
+        Hand the replies of the broker to the requests waiting for them
+        """
+        while True:
+            frames = self.socket.recv_multipart(copy=False)
+            # [correlation id][empty][header][payload]
+            replies = self._pending.get(frames[0].bytes)
+            if replies is None:
+                _LOG.debug('dropping reply of a request given up on')
+                continue
+            replies.put(frames[2:])
+
+    def request(self, frames, timeout=None):
+        """
+        Send the frames of a request to the broker and wait for the
+        frames of its reply, at most timeout seconds if given
+        """
+        return next(self.replies(frames, timeout))
+
+    def replies(self, frames, timeout=None):
+        """
+        Send the frames of a request to the broker and yield the
+        frames of the parts of its reply, waiting at most timeout
+        seconds for each part if given
+        """
+        correlation_id = struct.pack('!Q', next(self._ids))
+        replies = gevent_queue.Queue()
+        self._pending[correlation_id] = replies
+        try:
+            self.socket.send_multipart([correlation_id, b''] + frames,
+                                       copy=False)
+            while True:
+                try:
+                    reply = replies.get(timeout=timeout)
+                except gevent_queue.Empty:
+                    raise BrokerTimeout(
+                        'No reply from broker in {0}s'.format(timeout))
+                if not protocol.has_more(reply):
+                    break
+                yield reply
+        finally:
+            self._pending.pop(correlation_id, None)
+        yield reply
+
+    def close(self):
+        """
+        Close the socket and the context
+        """
+        self._reader.kill()
+        self.socket.close(linger=0)
+        self.context.term()
+
+
+def get_client(url, multiplexed=False):
+    """
+    Get the broker client of the current process, multiplexed
+    when it serves requests in greenlets.
+
+    The client is created lazily so that each gunicorn worker
+    builds its own zmq context after the fork.
+    """
+    global _CLIENT  # pylint: disable=W0603
+    client_class = MultiplexedBrokerClient if multiplexed else BrokerClient
+    client = _CLIENT
+    if client is not None and client.pid == os.getpid() and (
+            client.url == url) and isinstance(client, client_class):
+        return client
+    with _CLIENT_LOCK:
+        if _CLIENT is None or _CLIENT.pid != os.getpid() or (
+                _CLIENT.url != url) or (
+                    not isinstance(_CLIENT, client_class)):
+            # Never terminate a context inherited from the parent
+            # process, just forget about it
+            _CLIENT = client_class(url)
+            _LOG.info('broker client created for %s in pid %d',
+                      url, _CLIENT.pid)
+        return _CLIENT
@@ -5,9 +5,9 @@ import glob
 import json
 import os
 import sys
-import yaml
 from laf.server.app import config
 from laf.server.app import error
+from laf.server.app import yamlcodec
 
 HTTP_VERBS = ['get', 'create', 'delete', 'update']
 
@@ -75,7 +75,7 @@ def get_path_for_request(reqlone,
                                               reqlone, reqverb,
                                               reqpk, reqobj,
                                               luser, lhost)
-                        print(yaml.dump(res, default_flow_style=False))
+                        print(yamlcodec.dump(res, default_flow_style=False))
                         sys.exit(1)
                     if '=' in pathvar:
                         requestpath = requestpath + '/{' + pathpart + '_keys}'
@@ -124,7 +124,7 @@ def is_body_required(basedir,
                               reqlone, reqverb,
                               reqpk, reqobj,
                               luser, lhost)
-        print(yaml.dump(res, default_flow_style=False))
+        print(yamlcodec.dump(res, default_flow_style=False))
         sys.exit(1)
     path_spec = spec['paths'][request_path]
     method = get_http_method(reqpk, reqverb)
@@ -1,13 +1,70 @@
 """
 Load family configuration
 """
+import copy
 import json
 import os
 import logging
 
+from laf.server import cache
+from laf.server import scheduler
+from laf.server.app import jsoncodec
+from laf.server.app import yamlcodec
+
 _LOG = logging.getLogger(__name__)
 
 LAFSVR_FAMILY_FILE = 'etc/family'
+LAFSVR_CONFIG_FILE = 'etc/laf-server.yml'
+# Pool serving the lones which are not assigned to a pool
+DEFAULT_POOL = 'default'
+# Operations of a batch request, and how many are sent at once
+BATCH_MAX_SIZE = 100
+BATCH_PARALLELISM = 8
+# How often the responses are checked against their schema: every
+# time, a sampled share of them, a share of them in the background
+# once answered, or never
+VALIDATE_ALWAYS = 'always'
+VALIDATE_SAMPLED = 'sampled'
+VALIDATE_ASYNC = 'async'
+VALIDATE_OFF = 'off'
+VALIDATION_POLICIES = (VALIDATE_ALWAYS, VALIDATE_SAMPLED, VALIDATE_ASYNC,
+                       VALIDATE_OFF)
+
+# Parsed configuration files by path and parser, with the
+# inode, modification time and size they were parsed at
+_FILES = dict()
+
+
+def read_config_file(path, parse):
+    """
+    Contents of a configuration file as returned by parse, called
+    with the open file. The file is parsed again only once it
+    changed, the contents are shared and must not be modified.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _FILES.get((path, parse))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with open(path) as stream:
+        contents = parse(stream)
+    _FILES[(path, parse)] = (signature, contents)
+    return contents
+
+
+def reload_config_files():
+    """
+    Forget the parsed configuration files,
+    they are parsed again when next read
+    """
+    _FILES.clear()
+
+
+def _read_text(stream):
+    """
+    Text of a file without its trailing whitespace
+    """
+    return stream.read().rstrip()
 
 
 def get_laf_family(basedir):
@@ -15,8 +72,7 @@ def get_laf_family(basedir):
     Get family name from the etc/family file in basedir
     """
     familyfile = os.path.join(basedir, LAFSVR_FAMILY_FILE)
-    with open(familyfile) as fh:
-        family = fh.read().rstrip()
+    family = read_config_file(familyfile, _read_text)
     if family is None:
         raise Exception('Family file etc/family is missing from config')
     return family
@@ -54,10 +110,176 @@ def get_lone_cfg(basedir, options):
         cfgfilename = 'config-{0}.json'.format(family_name)
         config_file = os.path.join(family_config_dir, cfgfilename)
         try:
-            with open(config_file) as infile:
-                family_cfg = json.load(infile)
-                for key, value in family_cfg.items():
-                    lafconfig[key] = value
+            family_cfg = read_config_file(config_file, json.load)
+            for key, value in family_cfg.items():
+                lafconfig[key] = copy.deepcopy(value)
         except FileNotFoundError:
             raise Exception('Invalid deployment for the family')
     return lafconfig
+
+
+def get_server_cfg(basedir):
+    """
+    Get the server configuration from etc/laf-server.yml in basedir
+    """
+    srvconfigfile = os.path.join(basedir, LAFSVR_CONFIG_FILE)
+    with open(srvconfigfile) as stream:
+        return yamlcodec.load(stream) or dict()
+
+
+def get_worker_pools(svr_cfg):
+    """
+    Get the worker pools declared in the server configuration.
+
+    A pool serves a group of lones, e.g.
+
+        pools:
+          slow:
+            lones: [report, export]
+            workers: 2
+            min_workers: 1
+            max_workers: 4
+            threads: 8
+            longrunning_procs: 2
+            max_requests: 1000
+            max_rss: 512
+
+    The lones not assigned to any pool are served by the default pool.
+    """
+    lones = list(svr_cfg.get('lones') or [])
+    pools = dict()
+    assigned = set()
+    for name, pool_cfg in (svr_cfg.get('pools') or dict()).items():
+        name = str(name)
+        if name == DEFAULT_POOL:
+            raise Exception('Pool name {0} is reserved'.format(name))
+        pool_lones = list(pool_cfg.get('lones') or [])
+        for lone in pool_lones:
+            if lone not in lones:
+                raise Exception(
+                    'Pool {0} serves unknown lone {1}'.format(name, lone))
+            if lone in assigned:
+                raise Exception(
+                    'Lone {0} is assigned to several pools'.format(lone))
+            assigned.add(lone)
+        pools[name] = dict(pool_cfg, lones=pool_lones)
+    default_lones = [lone for lone in lones if lone not in assigned]
+    if default_lones or not pools:
+        pools[DEFAULT_POOL] = {'lones': default_lones}
+    return pools
+
+
+def get_lone_priorities(svr_cfg):
+    """
+    Get the priority class of the lones which set one in the
+    server configuration, e.g.
+
+        priorities:
+          report: longrunning
+    """
+    priorities = dict(svr_cfg.get('priorities') or dict())
+    for lone, pclass in priorities.items():
+        if pclass not in scheduler.PRIORITY_CLASSES:
+            raise Exception(
+                'Invalid priority {0} for lone {1}'.format(pclass, lone))
+    return priorities
+
+
+def get_batch_cfg(svr_cfg):
+    """
+    Get the limits of the batch requests of the lones, e.g.
+
+        batch:
+          max_size: 500
+          parallelism: 16
+    """
+    batch_cfg = dict(svr_cfg.get('batch') or dict())
+    max_size = int(batch_cfg.get('max_size', BATCH_MAX_SIZE))
+    parallelism = int(batch_cfg.get('parallelism', BATCH_PARALLELISM))
+    if max_size < 1 or parallelism < 1:
+        raise Exception('Invalid batch configuration {0}'.format(batch_cfg))
+    return {'max_size': max_size, 'parallelism': parallelism}
+
+
+def get_cache_cfg(svr_cfg):
+    """
+    Get the limits of the response cache of the broker, None when
+    the replies of the workers are not cached, e.g.
+
+        cache:
+          max_entries: 10000
+          max_size: 64
+
+    max_size is in MiB. The operations opt in with x-laf-cache or
+    their handlers with @cache.
+    """
+    if 'cache' not in svr_cfg:
+        return None
+    cache_cfg = dict(svr_cfg.get('cache') or dict())
+    if not cache_cfg.pop('enabled', True):
+        return None
+    max_entries = int(cache_cfg.get('max_entries',
+                                    cache.DEFAULT_MAX_ENTRIES))
+    max_size = float(cache_cfg.get('max_size', cache.DEFAULT_MAX_SIZE))
+    if max_entries < 1 or max_size <= 0:
+        raise Exception('Invalid cache configuration {0}'.format(cache_cfg))
+    return {'max_entries': max_entries, 'max_size': max_size}
+
+
+def get_validation_policy(value, default=None):
+    """
+    Response validation policy given as a policy name or as an
+    object with a policy and the rate of the responses checked,
+    the unset rate is the one of the default policy
+    """
+    if isinstance(value, str):
+        value = {'policy': value}
+    policy = dict(default or {'policy': VALIDATE_ALWAYS, 'rate': 1.0})
+    policy.update(value or dict())
+    policy['rate'] = float(policy['rate'])
+    if policy['policy'] not in VALIDATION_POLICIES or not (
+            0 <= policy['rate'] <= 1):
+        raise Exception(
+            'Invalid response validation policy {0}'.format(value))
+    return {'policy': policy['policy'], 'rate': policy['rate']}
+
+
+def get_response_validation_cfg(svr_cfg):
+    """
+    Get how the responses of the lones are validated, e.g.
+
+        response_validation:
+          policy: sampled
+          rate: 0.1
+          lones:
+            report: async
+
+    The policy is always, sampled, async or off, always by default.
+    rate is the share of the responses sampled and async validate.
+    The operations may set their own with x-laf-response-validation.
+    """
+    validation_cfg = dict(svr_cfg.get('response_validation') or dict())
+    lones = validation_cfg.pop('lones', None) or dict()
+    default = get_validation_policy(validation_cfg)
+    return {'default': default,
+            'lones': {lone: get_validation_policy(value, default)
+                      for lone, value in lones.items()}}
+
+
+def get_json_codec(svr_cfg):
+    """
+    Get the name of the JSON codec of the json and ndjson
+    responses, e.g.
+
+        json_codec: orjson
+
+    The default json codec encodes them as json.dumps does, orjson
+    is faster and compact but is only used when it is installed.
+    """
+    name = svr_cfg.get('json_codec') or jsoncodec.JSON
+    if name == jsoncodec.ORJSON and name not in jsoncodec.names():
+        _LOG.warning('orjson is not installed, using the json codec')
+        return jsoncodec.JSON
+    if name not in jsoncodec.names():
+        raise Exception('Invalid JSON codec {0}'.format(name))
+    return name
@@ -5,7 +5,8 @@ Main function to handle requests
 import http.client
 import logging
 import os
-from flask import make_response, g, current_app, send_file
+from flask import make_response, g, current_app, send_file, request
+from laf.server.app import handler
 from laf.server.app import routehandler
 
 _LOG = logging.getLogger(__name__)
@@ -20,10 +21,17 @@ def create_response(resp, status_code):
         resp_msg = 'Task in progress {0}'.format(location.split('/')[2])
         resp = {'status': resp_msg}
     encoder = g.encoder
-    resp = make_response(encoder.encode(resp), status_code)
+    if handler.is_streamed(resp):
+        # Sent in chunks as the workers produce it
+        resp = make_response(encoder.encode_stream(resp), status_code)
+    else:
+        resp = make_response(encoder.encode(resp), status_code)
     if status_code == http.client.ACCEPTED:
         resp.headers['location'] = location
         resp.autocorrect_location_header = False
+    retry_after = getattr(g, 'retry_after', None)
+    if status_code == http.client.SERVICE_UNAVAILABLE and retry_after:
+        resp.headers['Retry-After'] = str(retry_after)
     resp.headers['Content-Type'] = g.best_accept
     return resp
 
@@ -31,7 +39,10 @@ def create_response(resp, status_code):
 def general_handler(lone=None,
                     resp_validator=None,
                     inreq=None,
-                    version=None):
+                    version=None,
+                    timeout=None,
+                    priority=None,
+                    cache=None):
     """
     View function to handle requests
     """
@@ -39,7 +50,25 @@ def general_handler(lone=None,
         lone=lone,
         resp_validator=resp_validator,
         inreq=inreq,
-        version=version)
+        version=version,
+        timeout=timeout,
+        priority=priority,
+        cache=cache)
+    return create_response(resp, status_code)
+
+
+def batch_handler(lone=None,
+                  operations=None):
+    """
+    View function to handle batch requests
+    """
+    inreq = None
+    if request.data.decode():
+        inreq = g.decoder.decode(request.data)
+    (resp, status_code) = routehandler.handle_batch(
+        lone=lone,
+        operations=operations,
+        inreq=inreq)
     return create_response(resp, status_code)
 
 
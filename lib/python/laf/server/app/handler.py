@@ -1,17 +1,22 @@
 """
 Handle each laf request
 """
-import json
+import collections.abc
+import contextlib
 import datetime
 import http.client
 import logging
 import os
+import signal
 import socket
 import struct
 import subprocess
+import threading
 
+from laf.server import protocol
 from laf.server.app import journalclient
-from laf.client.loneexception import LoneException
+from laf.server.app import jsoncodec
+from laf.client.loneexception import LoneException, LoneTimeout
 
 _LOG = logging.getLogger(__name__)
 
@@ -41,10 +46,56 @@ def get_handler(req_obj, lone_obj):
     return handler
 
 
+def get_time_limit(handler, deadline_left=None):
+    """
+    Seconds the handler may run, the handler time limit
+    capped by what is left before the request deadline
+    """
+    limits = [limit for limit in (getattr(handler, 'time_limit', None),
+                                  deadline_left) if limit is not None]
+    if not limits:
+        return None
+    return min(limits)
+
+
+def get_cache_ttl(handler, ttl=None):
+    """
+    Seconds the reply of the handler may be served again,
+    its @cache overrides the ttl of the operation
+    """
+    return getattr(handler, 'cache_ttl', None) or ttl
+
+
+@contextlib.contextmanager
+def time_limit(seconds, txid):
+    """
+    Raise LoneTimeout in the handler once it ran for seconds.
+
+    Relies on SIGALRM so it only applies in the main thread, the
+    handlers of a threaded worker run on past their limit.
+    """
+    if seconds is None or (
+            threading.current_thread() is not threading.main_thread()):
+        yield
+        return
+
+    def _expired(signum, frame):  # pylint: disable=W0613
+        _LOG.error('[%s]: Handler timed out after %ss', txid, seconds)
+        raise LoneTimeout(protocol.TIMEOUT, http.client.GATEWAY_TIMEOUT)
+
+    previous = signal.signal(signal.SIGALRM, _expired)
+    signal.setitimer(signal.ITIMER_REAL, max(seconds, 0.001))
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
 def process_req(configdict, lone_obj, req_obj,
-                authres=None):
+                authres=None, limit=None):
     """
-    Process request
+    Process request, aborting the handler after limit seconds
     """
     with lone_obj.enter_request(req_obj):
         journal(req_obj, configdict,
@@ -62,7 +113,8 @@ def process_req(configdict, lone_obj, req_obj,
         # Call the lone's handler
         try:
             _LOG.debug('[%s]: Request is v3 in handler', req_obj.txid)
-            out = handler(req_obj.pk, **req_obj.obj)
+            with time_limit(limit, req_obj.txid):
+                out = handler(req_obj.pk, **req_obj.obj)
         except LoneException as ex:
             _LOG.exception('[%s]: Lone handling exception', req_obj.txid)
             out, status_code = ex.args  # pylint: disable=E0632
@@ -77,6 +129,11 @@ def process_req(configdict, lone_obj, req_obj,
                     'abort', out, lone_obj)
             return (out, status_code)
         else:
+            if is_streamed(out):
+                # A streamed response is only built once sent, it
+                # is committed once its last element is produced
+                return (stream_in_request(configdict, lone_obj, req_obj,
+                                          out), http.client.OK)
             journal(req_obj, configdict,
                     'commit', out, lone_obj)
             if out is None:
@@ -86,6 +143,63 @@ def process_req(configdict, lone_obj, req_obj,
             return (out, status_code)
 
 
+def is_streamed(out):
+    """
+    Check whether a handler returned an iterator, or
+    a listing whose _elem is an iterator, to stream
+    """
+    if isinstance(out, dict):
+        out = out.get('_elem')
+    return isinstance(out, collections.abc.Iterator)
+
+
+def stream_in_request(configdict, lone_obj, req_obj, out):
+    """
+    The streamed response of a handler, its elements produced
+    in the context of the request and the commit or the abort
+    journaled once the stream ends
+    """
+    if isinstance(out, dict):
+        return dict(out, _elem=_journaled_elems(configdict, lone_obj,
+                                                req_obj, out['_elem']))
+    return _journaled_elems(configdict, lone_obj, req_obj, out)
+
+
+def _journaled_elems(configdict, lone_obj, req_obj, elems):
+    """
+    Produce the elements within the request context, the
+    generator of a handler only runs while it is iterated
+    """
+    count = 0
+    try:
+        with lone_obj.enter_request(req_obj):
+            for elem in elems:
+                count += 1
+                yield elem
+    except LoneException as ex:
+        journal(req_obj, configdict, 'abort', ex.args[0], lone_obj)
+        raise
+    except GeneratorExit:
+        # The stream was not sent to its end
+        journal(req_obj, configdict, 'abort',
+                'Stream closed after {0} elements'.format(count), lone_obj)
+        raise
+    # W0703: broad-except
+    except Exception as err:  # pylint: disable=W0703
+        journal(req_obj, configdict, 'abort', repr(err), lone_obj)
+        raise
+    journal(req_obj, configdict, 'commit', {'streamed': count}, lone_obj)
+
+
+def collect_stream(out):
+    """
+    Read a streamed response whole
+    """
+    if isinstance(out, dict):
+        return dict(out, _elem=list(out['_elem']))
+    return list(out)
+
+
 def journaling_allowed(req_obj, lone_obj):
     """
     Check whether journallog
@@ -158,9 +272,9 @@ def local_journal_write(configdict, msg):
     if 'secondary_journal' in configdict:
         secondary = configdict['secondary_journal']
     adminproid = configdict['remoteid']
-    json_data = json.dumps(msg)
+    json_data = jsoncodec.dumpb(msg)
     msglen = len(json_data)
-    indata = struct.pack('!I{0}s'.format(msglen), msglen, json_data.encode())
+    indata = struct.pack('!I{0}s'.format(msglen), msglen, json_data)
     cmdlist = list()
     cmdlist.append(cmd)
     if primary:
@@ -0,0 +1,165 @@
+"""
+JSON codecs of the server
+
+The codecs are registered by name and created once per process.
+The json codec is the standard library one, its output is the one
+of json.dumps and is what the clients, the journal and the other
+services get. The orjson codec is registered when orjson is
+installed, it writes compact bytes directly and is the fast codec:
+the one of the messages laf exchanges with itself and the one
+every JSON document is decoded with.
+"""
+
+import json
+
+try:
+    # E0401: Unable to import 'orjson'
+    import orjson  # pylint: disable=E0401
+except ImportError:
+    orjson = None
+
+__all__ = ['JSON', 'ORJSON', 'JsonCodec', 'OrjsonCodec', 'register',
+           'get', 'names', 'STANDARD', 'FAST', 'dumps', 'dumpb', 'loads']
+
+JSON = 'json'
+ORJSON = 'orjson'
+
+_CODECS = dict()
+
+# The digits translated to 0, and anything else to x for bytes: a
+# run of 19 zeros is a number which may be an integer beyond 64
+# bits, which orjson would decode as a float
+_DIGITS = bytes(ord('0') if char in b'0123456789' else ord('x')
+                for char in range(256))
+_DIGITS_STR = str.maketrans(dict.fromkeys('123456789', '0'))
+_LONG_NUMBER = '0' * 19
+_LONG_NUMBER_BYTES = _LONG_NUMBER.encode()
+
+
+class JsonCodec():
+    """
+    Standard library codec, with a single encoder and decoder
+    """
+    name = JSON
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder()
+        self._canonical = json.JSONEncoder(sort_keys=True, default=str)
+        self._decoder = json.JSONDecoder()
+
+    def dumps(self, obj, canonical=False):
+        """
+        Encode obj as a string, canonical with its keys sorted and
+        what JSON has no type for as its string, the same string
+        for equal objects
+        """
+        if canonical:
+            return self._canonical.encode(obj)
+        return self._encoder.encode(obj)
+
+    def dumpb(self, obj):
+        """
+        Encode obj as UTF-8 bytes
+        """
+        return self._encoder.encode(obj).encode()
+
+    def loads(self, data):
+        """
+        Decode a document given as a string or as UTF-8 bytes
+        """
+        if not isinstance(data, str):
+            data = bytes(data).decode()
+        return self._decoder.decode(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    orjson codec, compact and without escaping non ASCII
+    characters. What orjson does not handle, such as integers
+    beyond 64 bits or NaN, goes through the standard library,
+    except NaN and infinities which orjson encodes as null.
+    """
+    name = ORJSON
+
+    def dumps(self, obj, canonical=False):
+        """
+        Encode obj as a string, canonical ones by the standard library
+        """
+        if canonical:
+            return super().dumps(obj, canonical)
+        return self.dumpb(obj).decode()
+
+    def dumpb(self, obj):
+        """
+        Encode obj as UTF-8 bytes
+        """
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super().dumpb(obj)
+
+    def loads(self, data):
+        """
+        Decode a document given as a string or as UTF-8 bytes
+        """
+        if isinstance(data, str):
+            long_number = _LONG_NUMBER in data.translate(_DIGITS_STR)
+        else:
+            data = bytes(data)
+            long_number = _LONG_NUMBER_BYTES in data.translate(_DIGITS)
+        if not long_number:
+            try:
+                return orjson.loads(data)
+            except ValueError:
+                pass
+        return super().loads(data)
+
+
+def register(codec):
+    """
+    Register a codec instance under its name, and return it
+    """
+    _CODECS[codec.name] = codec
+    return codec
+
+
+def get(name):
+    """
+    Registered codec of this name
+    """
+    if name not in _CODECS:
+        raise ValueError('Unknown JSON codec {0}, available: {1}'.format(
+            name, ', '.join(names())))
+    return _CODECS[name]
+
+
+def names():
+    """
+    Names of the registered codecs
+    """
+    return sorted(_CODECS)
+
+
+STANDARD = register(JsonCodec())
+FAST = register(OrjsonCodec()) if orjson is not None else STANDARD
+
+
+def dumps(obj):
+    """
+    Encode obj as json.dumps does
+    """
+    return STANDARD.dumps(obj)
+
+
+def dumpb(obj):
+    """
+    Encode obj as json.dumps does, as UTF-8 bytes
+    """
+    return STANDARD.dumpb(obj)
+
+
+def loads(data):
+    """
+    Decode a document given as a string or as UTF-8 bytes
+    """
+    return FAST.loads(data)
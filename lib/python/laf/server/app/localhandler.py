@@ -31,6 +31,8 @@ def local_handler(lone, requests, configdict, luser, lhost):
                                                   lone,
                                                   request,
                                                   major_version)
+        if handler.is_streamed(resp):
+            resp = handler.collect_stream(resp)
         if status_code not in [http.client.OK, http.client.NO_CONTENT]:
             err_object = error.APIError(resp,
                                         status_code,
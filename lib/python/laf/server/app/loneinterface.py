@@ -2,13 +2,14 @@
 Interface module
 for laf lones
 """
+import contextvars
 import importlib
 import inspect
 import logging
 import pydoc
 
 
-__all__ = ["LoneAPI", "longrunning", "journallog"]
+__all__ = ["LoneAPI", "longrunning", "journallog", "timeout", "cache"]
 
 _LOG = logging.getLogger(__name__)
 
@@ -31,6 +32,33 @@ def journallog(handler):
     return handler
 
 
+def timeout(seconds):
+    """
+    Function attribute to declare
+    the time limit of a handler in seconds.
+
+    Workers serving several requests at once can not interrupt
+    a handler: the client gets its 504 and the worker is replaced
+    once the handler overran the kill grace of the broker.
+    """
+    def set_time_limit(handler):
+        handler.time_limit = seconds
+        return handler
+    return set_time_limit
+
+
+def cache(seconds):
+    """
+    Function attribute to declare the replies
+    of a GET handler may be served again for
+    the given number of seconds
+    """
+    def set_cache_ttl(handler):
+        handler.cache_ttl = seconds
+        return handler
+    return set_cache_ttl
+
+
 class LoneAPI():
     """
     Lone API class
@@ -39,13 +67,26 @@ class LoneAPI():
         """
         """
         self._name = self.__class__.format_name()
-        self._request = None
+        # Concurrent requests of a threaded worker each see their own
+        self._request_var = contextvars.ContextVar(
+            '{0}_request'.format(self._name), default=None)
         self._cfg = cfg
         if self.mode == 'server':
             self.services = importlib.import_module(
                 'laf.server.app.services'
             )
 
+    @property
+    def _request(self):
+        """
+        Request being handled in the current context
+        """
+        return self._request_var.get()
+
+    @_request.setter
+    def _request(self, request):
+        self._request_var.set(request)
+
     def enter_request(self, request):
         """
         Takes care of the request context
@@ -7,10 +7,10 @@ import json
 import importlib
 import os
 import sys
-import yaml
 from laf.server.app import routecreator
 from laf.server.app import error
 from laf.server.app import validationutils
+from laf.server.app import yamlcodec
 
 VALIDATION_SOCK = '/tmp/valid.sock'
 HTTP_VERBS = ['get', 'create', 'delete', 'update']
@@ -84,7 +84,7 @@ def get_path_for_request(req, rsrcpara_types, luser, lhost):
                                               req.lone, req.verb,
                                               req.pk, req.obj,
                                               luser, lhost)
-                        print(yaml.dump(res, default_flow_style=False))
+                        print(yamlcodec.dump(res, default_flow_style=False))
                         sys.exit(1)
                     if '=' in pathvar:
                         reqpath = reqpath + '/{' + pathpart + '_keys}'
@@ -146,7 +146,7 @@ def jsonschema_validation(laf_family_base, schemafile, mimetype,
                                   req.lone, req.verb,
                                   req.pk, req.obj,
                                   luser, lhost)
-            print(yaml.dump(res, default_flow_style=False))
+            print(yamlcodec.dump(res, default_flow_style=False))
             sys.exit(1)
         path_spec = spec['paths'][request_path]
         method = get_http_method(req)
@@ -191,7 +191,7 @@ def jsonschema_validation(laf_family_base, schemafile, mimetype,
                                            operationid)
         except error.APIError as err:
             res = err.error_message()
-            print(yaml.dump(res, default_flow_style=False))
+            print(yamlcodec.dump(res, default_flow_style=False))
             sys.exit(1)
         try:
             req_validator.validate(obj)
@@ -201,7 +201,7 @@ def jsonschema_validation(laf_family_base, schemafile, mimetype,
                                   req.lone, req.verb,
                                   req.pk, req.obj,
                                   luser, lhost)
-            print(yaml.dump(res, default_flow_style=False))
+            print(yamlcodec.dump(res, default_flow_style=False))
             sys.exit(1)
         final_obj.pop('primary_key', None)
         req.obj = final_obj
@@ -3,24 +3,40 @@ Process the request
 by send it to laf workers
 """
 
+import hashlib
 import logging
-import os
-import json
 import http.client
+import time
 # E0401: Unable to import 'zmq'
 import zmq  # pylint: disable=E0401
-from flask import current_app
+from flask import current_app, g, request
 from laf.server.app import error
 from laf.server.app import authclient
+from laf.server.app import brokerclient
+from laf.server.app import jsoncodec
+from laf.server import protocol
 
 INTERNAL_LONES = ['_status', '_config', '_lones', '_ping']
 
 _LOG = logging.getLogger(__name__)
 
+# Extra seconds to wait for the broker to report an expired deadline
+DEADLINE_GRACE = 1
+# Cached replies are kept for each caller, or shared by every caller
+USER_SCOPE = 'user'
+SHARED_SCOPE = 'shared'
+CACHE_SCOPES = (USER_SCOPE, SHARED_SCOPE)
 
-def process_request(req_obj, version):
+
+# R0913: Too many arguments
+def process_request(req_obj, version,  # pylint: disable=R0913
+                    timeout=None, priority=None, method=None, cache=None):
     """
-    Process the request
+    Process the request, giving up after timeout seconds if given.
+    The broker queues it according to its priority class.
+    The http method defaults to the one of the current request.
+    The broker may answer a GET with a cached reply, cache is
+    the caching policy of the operation if it declares one.
     """
     if req_obj.lone in INTERNAL_LONES:
         _process_internal_lones(req_obj)
@@ -28,15 +44,14 @@ def process_request(req_obj, version):
         auth_result = None
         if 'authorization_socket' in current_app.config:
             auth_result = authorize(req_obj, version)
-        context = zmq.Context()
-        socket = context.socket(zmq.REQ)
-        socket.identity = (u"client-%d" % (os.getpid())).encode('ascii')
         _LOG.debug(
             '[%s]: frontend url socket is %s',
             req_obj.txid,
             current_app.config['c_socket']
         )
-        socket.connect(current_app.config['c_socket'])
+        client = brokerclient.get_client(
+            current_app.config['c_socket'],
+            current_app.config.get('multiplexed', False))
         final_req = dict()
         req = {
             'lone': req_obj.lone,
@@ -59,24 +74,102 @@ def process_request(req_obj, version):
         final_req['request'] = req
         final_req['auth'] = auth_result
         final_req['version'] = version
+        # The broker routes on the header, it never decodes the request
+        codec = current_app.config.get('wire_codec',
+                                       protocol.DEFAULT_CODEC)
+        header = {'lone': req_obj.lone,
+                  'method': (method or request.method).lower()}
+        if priority is not None:
+            header['priority'] = priority
+        if current_app.config.get('response_cache'):
+            # The broker drops the cached replies a request changes
+            header['pk'] = req_obj.pk
+            if header['method'] == 'get':
+                header['cache'] = cache_key(req_obj, version, cache)
+                if cache is not None and cache['ttl'] is not None:
+                    header['ttl'] = cache['ttl']
+        wait = None
+        if timeout is not None:
+            header['deadline'] = time.time() + timeout
+            wait = timeout + DEADLINE_GRACE
+        replies = client.replies(
+            protocol.encode_message(final_req, codec, **header),
+            timeout=wait)
         try:
-            socket.send(json.dumps(final_req).encode())
+            message = next(replies)
+        except brokerclient.BrokerTimeout:
+            _LOG.error('[%s]: No reply from backend worker in %ss',
+                       req_obj.txid, timeout)
+            raise error.APIError(
+                protocol.TIMEOUT,
+                http.client.GATEWAY_TIMEOUT,
+                req_obj.lone,
+                req_obj.verb,
+                req_obj.pk,
+                req_obj.obj,
+                req_obj.user,
+                req_obj.host,
+                req_obj.txid)
         except zmq.error.ZMQError:
             _LOG.exception(
                 '[%s]: Error in sending request to backend worker',
                 req_obj.txid
             )
-        else:
-            message = socket.recv().decode()
-            _LOG.debug(
-                '[%s]: Reply got from worker is %r',
-                req_obj.txid,
-                message
-            )
-            output = json.loads(message)
+            raise error.APIError(
+                'Error in sending request to backend worker',
+                http.client.INTERNAL_SERVER_ERROR,
+                req_obj.lone,
+                req_obj.verb,
+                req_obj.pk,
+                req_obj.obj,
+                req_obj.user,
+                req_obj.host,
+                req_obj.txid)
+        output = protocol.decode_message(message)
+        _LOG.debug(
+            '[%s]: Reply got from worker is %r',
+            req_obj.txid,
+            output
+        )
+        if 'retry_after' in output:
+            setattr(g, 'retry_after', output['retry_after'])
+        if output.get('stream'):
+            elems = _streamed_elems(replies, req_obj.txid)
+            if output['resp'] is None:
+                return (elems, output['code'])
+            return (dict(output['resp'], _elem=elems), output['code'])
     return (output['resp'], output['code'])
 
 
+def cache_key(req_obj, version, cache=None):
+    """
+    Key of the reply to a GET in the response cache of the broker,
+    the caller is part of it unless the replies are shared
+    """
+    scope = USER_SCOPE if cache is None else cache['scope']
+    fields = [req_obj.lone, version, req_obj.verb, req_obj.pk,
+              req_obj.subhandler, req_obj.path, req_obj.urlvars,
+              req_obj.queryvars]
+    if scope == USER_SCOPE:
+        fields.extend((req_obj.user, req_obj.role, req_obj.obo))
+    data = jsoncodec.STANDARD.dumps(fields, canonical=True)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def _streamed_elems(replies, txid):
+    """
+    Elements of a streamed reply, read from the broker as the
+    response is sent to the client
+    """
+    for message in replies:
+        part = protocol.decode_message(message)
+        yield from part['elem']
+        if 'error' in part:
+            # The status may be sent already, cut the response short
+            raise RuntimeError('[{0}]: Streamed reply failed: {1}'.format(
+                txid, part['error']))
+
+
 def _process_internal_lones(req_obj):
     _LOG.info('internal lone %r', req_obj)
 
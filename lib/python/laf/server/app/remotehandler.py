@@ -15,11 +15,12 @@ import time
 import urllib.parse
 import pkg_resources
 import requests
-import yaml
 # E0401: Unable to import 'requests_kerberos'
 # W0611: Unused HTTPKerberosAuth imported from requests_kerberos
 import requests_kerberos  # pylint: disable=E0401
 from requests_kerberos import HTTPKerberosAuth  # pylint: disable=E0401, W0611
+from laf.server.app import jsoncodec
+from laf.server.app import yamlcodec
 
 _LOG = logging.getLogger(__name__)
 
@@ -253,7 +254,8 @@ def httpreq(loop, future, url, method, req, auth,
                 break
             if '_elem' in resp:
                 if '_next' in resp['_links']:
-                    print(yaml.dump(resp['_elem'], default_flow_style=False))
+                    print(yamlcodec.dump(resp['_elem'],
+                                         default_flow_style=False))
                     url = resp['_links']['_next']['href']
                     if urlpart:
                         url = url + '&' + urlpart
@@ -266,7 +268,7 @@ def httpreq(loop, future, url, method, req, auth,
     else:
         indata = None
         if req.obj:
-            indata = json.dumps(req.obj)
+            indata = jsoncodec.dumps(req.obj)
         print("URL is {0}".format(url))
         try:
             future1 = loop.run_in_executor(
@@ -3,7 +3,7 @@
 import socket
 import getpass
 import uuid
-import yaml
+from laf.server.app import yamlcodec
 
 __all__ = ['Request', 'get_laf_rq_id']
 
@@ -72,7 +72,7 @@ class Request():
         Convert the object to yaml
         """
         if self._yaml is None:
-            self._yaml = yaml.dump(self.obj)
+            self._yaml = yamlcodec.dump(self.obj)
         return self._yaml
 
 
@@ -1,10 +1,13 @@
 """
 Main function to handle requests
 """
+from concurrent import futures
 import http.client
 import logging
 import os
-from flask import request, current_app
+from flask import request, current_app, copy_current_request_context, g
+from laf.server.app import config
+from laf.server.app import handler
 from laf.server.app import services
 from laf.server.app import processing
 from laf.server.app import journalclient
@@ -69,12 +72,15 @@ def request_validation(req_data):
     return (final_req, status_code)
 
 
-def request_handling(req, version):
+# R0913: Too many arguments
+def request_handling(req, version,  # pylint: disable=R0913
+                     timeout=None, priority=None, method=None, cache=None):
     """
     Processing of request
     """
 
-    (resp, status_code) = processing.process_request(req, version)
+    (resp, status_code) = processing.process_request(req, version, timeout,
+                                                     priority, method, cache)
     if status_code not in [http.client.OK,
                            http.client.ACCEPTED,
                            http.client.SERVICE_UNAVAILABLE]:
@@ -149,10 +155,54 @@ def add_pagination_info(url, req_obj, resp, txid):
     return response
 
 
+def get_request_timeout(timeout, final_req):
+    """
+    Timeout of the request in seconds, the LAF-TIMEOUT header
+    overrides the operation and server defaults
+    """
+    if timeout is None:
+        timeout = current_app.config.get('request_timeout')
+    header = request.headers.get('LAF-TIMEOUT', None)
+    if header is not None:
+        try:
+            timeout = float(header)
+        except ValueError:
+            raise error.APIError(
+                'Invalid LAF-TIMEOUT header {0}'.format(header),
+                http.client.BAD_REQUEST,
+                final_req['lone'],
+                final_req['verb'],
+                final_req['pk'],
+                final_req['obj'],
+                final_req['user'],
+                final_req['host'],
+                final_req['txid'])
+    if timeout is not None and timeout <= 0:
+        return None
+    return timeout
+
+
+def _additional_validation(final_req):
+    """
+    Validate the request with the validation process if any
+    """
+    if 'validation_socket' in current_app.config:
+        (final_req, status_code) = request_validation(final_req)
+        if isinstance(final_req, dict) and '_error' in final_req:
+            if status_code is None:
+                status_code = http.client.BAD_REQUEST
+            raise error.APIError(final_req['_error'],
+                                 status_code)
+    return final_req
+
+
 def handle_route(lone=None,
                  version=None,
                  resp_validator=None,
-                 inreq=None):
+                 inreq=None,
+                 timeout=None,
+                 priority=None,
+                 cache=None):
     """
     Handling route request
     """
@@ -161,19 +211,16 @@ def handle_route(lone=None,
     _LOG.info('[%s]: Request user and host %s', user, host)
     final_req = _build_req_data(inreq,
                                 lone)
-    if 'validation_socket' in current_app.config:
-        (final_req, status_code) = request_validation(final_req)
-        if isinstance(final_req, dict) and '_error' in final_req:
-            if status_code is None:
-                status_code = http.client.BAD_REQUEST
-            raise error.APIError(final_req['_error'],
-                                 status_code)
+    timeout = get_request_timeout(timeout, final_req)
+    final_req = _additional_validation(final_req)
     _LOG.info('final request is %r', final_req)
     req_obj = LAFRequest.Request(**final_req)
     _LOG.info('[%s]: Request validated', req_obj.txid)
-    (resp, status_code) = request_handling(req_obj, version)
+    (resp, status_code) = request_handling(req_obj, version, timeout,
+                                           priority, cache=cache)
     if request.method.lower() == 'delete' and status_code == http.client.OK:
         status_code = http.client.NO_CONTENT
+    streamed = handler.is_streamed(resp)
     lonepath = '/{0}'.format(final_req['lone'])
     if (
             request.path == lonepath and
@@ -181,6 +228,8 @@ def handle_route(lone=None,
             status_code != http.client.SERVICE_UNAVAILABLE and
             version == 'v3'
     ):
+        if streamed and not isinstance(resp, dict):
+            resp = {'_elem': resp}
         if isinstance(resp, dict) and '_elem' in resp:
             requrl = request.base_url
             if 'url_prefix' in current_app.config['config']:
@@ -204,11 +253,110 @@ def handle_route(lone=None,
                                  final_req['user'],
                                  final_req['host'],
                                  final_req['txid'])
-    validator.validate_response(resp_validator,
+    if not streamed:
+        # Checking a streamed response would read it whole
+        validator.validate_response(resp_validator,
+                                    resp,
+                                    status_code,
+                                    req_obj.txid)
+    _LOG.info('[%s]: Request Finished', req_obj.txid)
+    return (resp, status_code)
+
+
+def handle_batch(lone=None,
+                 operations=None,
+                 inreq=None):
+    """
+    Handling batch request, its operations are sent to the
+    workers in parallel and each one gets its own status
+    """
+    items = inreq.get('operations') if isinstance(inreq, dict) else None
+    if not isinstance(items, list):
+        raise error.APIError('Batch request should have a list of operations',
+                             http.client.BAD_REQUEST)
+    max_size = current_app.config.get('batch_max_size',
+                                      config.BATCH_MAX_SIZE)
+    if len(items) > max_size:
+        raise error.APIError(
+            'Batch of {0} operations exceeds the limit of {1}'.format(
+                len(items), max_size),
+            http.client.REQUEST_ENTITY_TOO_LARGE)
+    results = list()
+    if items:
+        parallelism = current_app.config.get('batch_parallelism',
+                                             config.BATCH_PARALLELISM)
+        with futures.ThreadPoolExecutor(
+                min(parallelism, len(items))) as executor:
+            jobs = list()
+            for (index, item) in enumerate(items):
+                # Each operation runs in its own copy of the request context
+                run_item = copy_current_request_context(handle_batch_item)
+                jobs.append(executor.submit(run_item, lone, operations,
+                                            index, item))
+            results = [job.result() for job in jobs]
+    _LOG.info('[%s]: Batch of %d operations finished',
+              request.headers.get('LAF-TX-ID', None), len(results))
+    return ({'results': results}, http.client.OK)
+
+
+def handle_batch_item(lone, operations, index, item):
+    """
+    Handling an operation of a batch request, its failure
+    is reported in its result
+    """
+    try:
+        (resp, status_code) = _handle_operation(lone, operations, index,
+                                                item)
+    except error.APIError as err:
+        return {'code': err.status_code, 'resp': err.error_message()}
+    # W0703: broad-except
+    except Exception:  # pylint: disable=W0703
+        _LOG.exception('operation %d of batch request failed', index)
+        return {'code': http.client.INTERNAL_SERVER_ERROR,
+                'resp': {'_error': 'Internal error'}}
+    result = {'code': status_code, 'resp': resp}
+    retry_after = getattr(g, 'retry_after', None)
+    if status_code == http.client.SERVICE_UNAVAILABLE and retry_after:
+        result['retry_after'] = retry_after
+    return result
+
+
+def _handle_operation(lone, operations, index, item):
+    """
+    Validate and process an operation of a batch request
+    """
+    operationid = item.get('operationId') if isinstance(item, dict) else None
+    if operationid not in operations:
+        raise error.APIError(
+            'Unknown operation {0} in batch'.format(operationid),
+            http.client.BAD_REQUEST)
+    for part in ('path', 'query'):
+        if not isinstance(item.get(part) or dict(), dict):
+            raise error.APIError(
+                'Operation {0} should be an object'.format(part),
+                http.client.BAD_REQUEST)
+    operation = operations[operationid]
+    inreq = validator.validate_operation(operation['req_validator'], lone,
+                                         operationid, item)
+    if inreq['txid'] is not None:
+        # Tell the operations of the batch apart in the logs
+        inreq['txid'] = '{0}-{1}'.format(inreq['txid'], index)
+    final_req = _build_req_data(inreq, lone)
+    timeout = get_request_timeout(operation['timeout'], final_req)
+    final_req = _additional_validation(final_req)
+    req_obj = LAFRequest.Request(**final_req)
+    (resp, status_code) = request_handling(req_obj, operation['version'],
+                                           timeout, operation['priority'],
+                                           operation['method'],
+                                           operation['cache'])
+    if operation['method'] == 'delete' and status_code == http.client.OK:
+        status_code = http.client.NO_CONTENT
+    if handler.is_streamed(resp):
+        resp = handler.collect_stream(resp)
+    validator.validate_response(operation['resp_validator'],
                                 resp,
                                 status_code,
                                 req_obj.txid)
-    _LOG.info('[%s]: Request Finished', req_obj.txid)
     return (resp, status_code)
 
 
@@ -0,0 +1,445 @@
+"""
+Compile the Draft4 schemas of the routes into Python functions
+
+The $refs of a schema are resolved once and every keyword turns
+into a few lines of generated code specialised for its values,
+instead of walking the schema for each request. The generated
+code only tells whether an instance is valid: an invalid one is
+validated again by Draft4Validator so that the errors are the
+ones jsonschema reports.
+
+Whenever the generated code is unsure, e.g. a uniqueItems over
+unhashable items, it says invalid and lets Draft4Validator decide.
+"""
+
+import logging
+import numbers
+import re
+from jsonschema import Draft4Validator
+
+__all__ = ['SchemaCompileError', 'CompiledValidator', 'compile_schema',
+           'compile_validator']
+
+_LOG = logging.getLogger(__name__)
+
+# Checks of the Draft4 types, bool is not a number
+TYPE_CHECKS = {
+    'object': 'isinstance(x, dict)',
+    'array': 'isinstance(x, list)',
+    'string': 'isinstance(x, str)',
+    'integer': '(isinstance(x, int) and not isinstance(x, bool))',
+    'number': '(isinstance(x, _Number) and not isinstance(x, bool))',
+    'boolean': 'isinstance(x, bool)',
+    'null': 'x is None',
+}
+
+# Keywords of the schemas jsonschema handles differently from here
+UNSUPPORTED_KEYWORDS = ('id',)
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _is_empty(schema):
+    """
+    Whether a schema accepts everything
+    """
+    return schema is True or (isinstance(schema, dict) and not schema)
+
+
+class SchemaCompileError(Exception):
+    """
+    The schema can not be compiled,
+    Draft4Validator validates it as is
+    """
+
+
+def _enum(instance, values):
+    """
+    Whether a scalar is one of the values, True is not 1
+    """
+    if not isinstance(instance, _SCALARS):
+        return False
+    for value in values:
+        if isinstance(value, bool) or isinstance(instance, bool):
+            if value is instance:
+                return True
+        elif isinstance(value, _SCALARS) and value == instance:
+            return True
+    return False
+
+
+def _unique(items):
+    """
+    Whether the items are unique, False when they can not be
+    told apart cheaply
+    """
+    try:
+        keys = set((isinstance(item, bool), item) for item in items)
+    except TypeError:
+        return False
+    return len(keys) == len(items)
+
+
+def _multiple_of(instance, divisor):
+    """
+    Whether a number is a multiple of the divisor
+    """
+    if isinstance(divisor, float):
+        quotient = instance / divisor
+        try:
+            return int(quotient) == quotient
+        except OverflowError:
+            return False
+    return not instance % divisor
+
+
+class _Compiler():
+    """
+    Source of the functions checking a schema and its subschemas,
+    one function per schema
+    """
+
+    def __init__(self, resolver=None):
+        self.resolver = resolver
+        self.names = dict()
+        # Keep the schemas alive, their ids name their functions
+        self.schemas = list()
+        self.functions = list()
+        self.namespace = {'_Number': numbers.Number, '_enum': _enum,
+                          '_unique': _unique, '_multiple_of': _multiple_of}
+
+    def constant(self, value):
+        """
+        Name of a value in the namespace of the generated code
+        """
+        name = '_c{0}'.format(len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def function(self, schema):
+        """
+        Name of the function checking a schema,
+        its source is generated on first use
+        """
+        name = self.names.get(id(schema))
+        if name is not None:
+            return name
+        name = '_s{0}'.format(len(self.names))
+        self.names[id(schema)] = name
+        self.schemas.append(schema)
+        lines = self.lines(schema)
+        if not lines or not lines[-1].startswith('return '):
+            lines.append('return True')
+        self.functions.append('def {0}(x):\n{1}'.format(
+            name, ''.join('    {0}\n'.format(line) for line in lines)))
+        return name
+
+    def lines(self, schema):
+        """
+        Body of the function checking a schema
+        """
+        if _is_empty(schema):
+            return list()
+        if schema is False:
+            return ['return False']
+        if not isinstance(schema, dict):
+            raise SchemaCompileError('Invalid schema {0!r}'.format(schema))
+        if '$ref' in schema:
+            # Draft4 ignores the keywords next to a $ref
+            return ['return {0}(x)'.format(self.ref(schema['$ref']))]
+        for keyword in UNSUPPORTED_KEYWORDS:
+            if keyword in schema:
+                raise SchemaCompileError(
+                    'Unsupported keyword {0}'.format(keyword))
+        lines = list()
+        lines.extend(self.type_lines(schema))
+        lines.extend(self.combining_lines(schema))
+        # The type already checked needs no checking again
+        types = schema.get('type')
+        if types == 'integer':
+            types = 'number'
+        for (kind, block) in (
+                ('string', self.string_lines(schema)),
+                ('number', self.number_lines(schema)),
+                ('object', self.object_lines(schema)),
+                ('array', self.array_lines(schema))):
+            if block and kind == types:
+                lines.extend(block)
+            elif block:
+                lines.append('if {0}:'.format(TYPE_CHECKS[kind]))
+                lines.extend('    ' + line for line in block)
+        return lines
+
+    def ref(self, ref):
+        """
+        Name of the function checking the schema a $ref points to
+        """
+        if self.resolver is None:
+            raise SchemaCompileError('No resolver for $ref {0}'.format(ref))
+        try:
+            (url, resolved) = self.resolver.resolve(ref)
+        # W0703: broad-except
+        except Exception as err:  # pylint: disable=W0703
+            # Draft4Validator reports it when validating
+            raise SchemaCompileError('Unresolvable $ref {0}: {1}'.format(
+                ref, err))
+        # Refs within the resolved schema are relative to its document
+        self.resolver.push_scope(url)
+        try:
+            return self.function(resolved)
+        finally:
+            self.resolver.pop_scope()
+
+    def regex(self, pattern):
+        """
+        Name of a compiled regular expression
+        """
+        try:
+            return self.constant(re.compile(pattern))
+        except re.error as err:
+            raise SchemaCompileError('Invalid pattern {0}: {1}'.format(
+                pattern, err))
+
+    def type_lines(self, schema):
+        """
+        Checks of the type and enum keywords
+        """
+        lines = list()
+        if 'type' in schema:
+            types = schema['type']
+            if isinstance(types, str):
+                types = [types]
+            if not all(kind in TYPE_CHECKS for kind in types):
+                raise SchemaCompileError('Unknown type {0}'.format(types))
+            lines.append('if not ({0}):'.format(
+                ' or '.join(TYPE_CHECKS[kind] for kind in types) or 'False'))
+            lines.append('    return False')
+        if 'enum' in schema:
+            values = schema['enum']
+            if all(isinstance(value, str) for value in values):
+                lines.append('if not isinstance(x, str) or x not in {0}:'
+                             .format(self.constant(frozenset(values))))
+            else:
+                lines.append('if not _enum(x, {0}):'.format(
+                    self.constant(tuple(values))))
+            lines.append('    return False')
+        return lines
+
+    def combining_lines(self, schema):
+        """
+        Checks of the allOf, anyOf, oneOf and not keywords
+        """
+        lines = list()
+        for subschema in schema.get('allOf', ()):
+            lines.append('if not {0}(x):'.format(self.function(subschema)))
+            lines.append('    return False')
+        if 'anyOf' in schema:
+            lines.append('if not ({0}):'.format(' or '.join(
+                '{0}(x)'.format(self.function(subschema))
+                for subschema in schema['anyOf'])))
+            lines.append('    return False')
+        if 'oneOf' in schema:
+            lines.append('if ({0}) != 1:'.format(' + '.join(
+                '{0}(x)'.format(self.function(subschema))
+                for subschema in schema['oneOf'])))
+            lines.append('    return False')
+        if 'not' in schema:
+            lines.append('if {0}(x):'.format(self.function(schema['not'])))
+            lines.append('    return False')
+        return lines
+
+    def string_lines(self, schema):
+        """
+        Checks of a string
+        """
+        lines = list()
+        if 'minLength' in schema:
+            lines.append('if len(x) < {0}:'.format(int(schema['minLength'])))
+            lines.append('    return False')
+        if 'maxLength' in schema:
+            lines.append('if len(x) > {0}:'.format(int(schema['maxLength'])))
+            lines.append('    return False')
+        if 'pattern' in schema:
+            lines.append('if not {0}.search(x):'.format(
+                self.regex(schema['pattern'])))
+            lines.append('    return False')
+        return lines
+
+    def number_lines(self, schema):
+        """
+        Checks of a number
+        """
+        lines = list()
+        if 'minimum' in schema:
+            operator = '<=' if schema.get('exclusiveMinimum') else '<'
+            lines.append('if x {0} {1}:'.format(
+                operator, self.constant(schema['minimum'])))
+            lines.append('    return False')
+        if 'maximum' in schema:
+            operator = '>=' if schema.get('exclusiveMaximum') else '>'
+            lines.append('if x {0} {1}:'.format(
+                operator, self.constant(schema['maximum'])))
+            lines.append('    return False')
+        if 'multipleOf' in schema:
+            lines.append('if not _multiple_of(x, {0}):'.format(
+                self.constant(schema['multipleOf'])))
+            lines.append('    return False')
+        return lines
+
+    def object_lines(self, schema):
+        """
+        Checks of an object
+        """
+        lines = list()
+        if 'minProperties' in schema:
+            lines.append('if len(x) < {0}:'.format(
+                int(schema['minProperties'])))
+            lines.append('    return False')
+        if 'maxProperties' in schema:
+            lines.append('if len(x) > {0}:'.format(
+                int(schema['maxProperties'])))
+            lines.append('    return False')
+        for name in schema.get('required', ()):
+            lines.append('if {0} not in x:'.format(self.constant(name)))
+            lines.append('    return False')
+        properties = schema.get('properties', dict())
+        for (name, subschema) in properties.items():
+            if _is_empty(subschema):
+                continue
+            key = self.constant(name)
+            lines.append('if {0} in x and not {1}(x[{0}]):'.format(
+                key, self.function(subschema)))
+            lines.append('    return False')
+        patterns = list()
+        for (pattern, subschema) in schema.get(
+                'patternProperties', dict()).items():
+            regex = self.regex(pattern)
+            patterns.append(regex)
+            lines.append('for (k, v) in x.items():')
+            lines.append('    if {0}.search(k) and not {1}(v):'.format(
+                regex, self.function(subschema)))
+            lines.append('        return False')
+        additional = schema.get('additionalProperties', True)
+        if not _is_empty(additional):
+            names = self.constant(frozenset(properties))
+            if additional is False and not patterns:
+                lines.append('if not {0}.issuperset(x):'.format(names))
+                lines.append('    return False')
+            else:
+                extra = 'k not in {0}'.format(names)
+                if patterns:
+                    extra += ' and not ({0})'.format(' or '.join(
+                        '{0}.search(k)'.format(regex) for regex in patterns))
+                if additional is False:
+                    check = 'True'
+                else:
+                    check = 'not {0}(v)'.format(self.function(additional))
+                lines.append('for (k, v) in x.items():')
+                lines.append('    if {0} and {1}:'.format(extra, check))
+                lines.append('        return False')
+        for (name, dependency) in schema.get('dependencies', dict()).items():
+            key = self.constant(name)
+            if isinstance(dependency, list):
+                lines.append('if {0} in x and not all(k in x for k in {1}):'
+                             .format(key, self.constant(tuple(dependency))))
+            else:
+                lines.append('if {0} in x and not {1}(x):'.format(
+                    key, self.function(dependency)))
+            lines.append('    return False')
+        return lines
+
+    def array_lines(self, schema):
+        """
+        Checks of an array
+        """
+        lines = list()
+        if 'minItems' in schema:
+            lines.append('if len(x) < {0}:'.format(int(schema['minItems'])))
+            lines.append('    return False')
+        if 'maxItems' in schema:
+            lines.append('if len(x) > {0}:'.format(int(schema['maxItems'])))
+            lines.append('    return False')
+        if schema.get('uniqueItems'):
+            lines.append('if not _unique(x):')
+            lines.append('    return False')
+        items = schema.get('items', dict())
+        if isinstance(items, list):
+            for (index, subschema) in enumerate(items):
+                lines.append('if len(x) > {0} and not {1}(x[{0}]):'.format(
+                    index, self.function(subschema)))
+                lines.append('    return False')
+            additional = schema.get('additionalItems', True)
+            if additional is False:
+                lines.append('if len(x) > {0}:'.format(len(items)))
+                lines.append('    return False')
+            elif not _is_empty(additional):
+                lines.append('for v in x[{0}:]:'.format(len(items)))
+                lines.append('    if not {0}(v):'.format(
+                    self.function(additional)))
+                lines.append('        return False')
+        elif not _is_empty(items):
+            lines.append('for v in x:')
+            lines.append('    if not {0}(v):'.format(self.function(items)))
+            lines.append('        return False')
+        return lines
+
+
+def compile_schema(schema, resolver=None):
+    """
+    Source and function telling whether an instance is valid
+    against a Draft4 schema, its $refs are resolved by resolver
+    """
+    compiler = _Compiler(resolver)
+    root = compiler.function(schema)
+    source = '\n'.join(compiler.functions)
+    namespace = dict(compiler.namespace)
+    # W0122: exec-used
+    exec(compile(source, '<schema>', 'exec'),  # pylint: disable=W0122
+         namespace)
+    return (source, namespace[root])
+
+
+class CompiledValidator():
+    """
+    Draft4Validator running the generated code of its schema,
+    the invalid instances are validated again by Draft4Validator
+    """
+
+    def __init__(self, schema, resolver=None):
+        self.schema = schema
+        self.validator = Draft4Validator(schema, resolver=resolver)
+        (self.source, self.check) = compile_schema(schema, resolver)
+
+    def is_valid(self, instance):
+        """
+        Whether the instance is valid
+        """
+        return self.check(instance) or self.validator.is_valid(instance)
+
+    def iter_errors(self, instance):
+        """
+        Errors of the instance
+        """
+        if self.check(instance):
+            return iter(())
+        return self.validator.iter_errors(instance)
+
+    def validate(self, instance):
+        """
+        Raise the ValidationError Draft4Validator
+        raises for an invalid instance
+        """
+        if not self.check(instance):
+            self.validator.validate(instance)
+
+
+def compile_validator(schema, resolver=None):
+    """
+    Validator of a schema, a plain Draft4Validator
+    when the schema can not be compiled
+    """
+    try:
+        return CompiledValidator(schema, resolver)
+    except SchemaCompileError as err:
+        _LOG.info('schema not compiled, %s', err)
+        return Draft4Validator(schema, resolver=resolver)
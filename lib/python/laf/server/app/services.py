@@ -2,12 +2,12 @@
 Validation and notification
 """
 import http.client
-import json
 import os
 import struct
 import socket
 import logging
 from flask import current_app
+from laf.server.app import jsoncodec
 
 _LOG = logging.getLogger(__name__)
 NOTIFICATION_SOCK = '/tmp/notify.sock'
@@ -28,15 +28,15 @@ def validate(req):
         status_code = http.client.INTERNAL_SERVER_ERROR
         final_req = {'_error': 'Internal server error'}
         return (final_req, status_code)
-    json_data = json.dumps(req)
+    json_data = jsoncodec.dumpb(req)
     reqlen = len(json_data)
     sock.sendall(struct.pack('!I{0}s'.format(reqlen),
                              reqlen,
-                             json_data.encode()))
+                             json_data))
     length = sock.recv(4)
     outlen = struct.unpack('!I', length)
     line = sock.recv(outlen[0])
-    final_req = json.loads(line.decode())
+    final_req = jsoncodec.loads(line)
     sock.close()
     return (final_req, status_code)
 
@@ -49,7 +49,7 @@ def publish(txid, message):
         return
     server_address = os.environ['NOTIFICATION_SOCK']
     topic = txid
-    body = json.dumps(message)
+    body = jsoncodec.dumps(message)
     msg = topic + body
 
     sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
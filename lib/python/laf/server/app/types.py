@@ -3,8 +3,41 @@ Factory module to create
 mime type
 """
 
-import json
-import yaml
+from laf.server.app import jsoncodec
+from laf.server.app import yamlcodec
+
+# Characters, or bytes, gathered before a chunk of a streamed
+# response is sent
+STREAM_BUFFER = 64 * 1024
+
+
+def _buffered(parts, empty=''):
+    """
+    Gather the parts of a streamed response into chunks,
+    the parts are strings or, with an empty b'', bytes
+    """
+    chunk = list()
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= STREAM_BUFFER:
+            yield empty.join(chunk)
+            chunk = list()
+            size = 0
+    if chunk:
+        yield empty.join(chunk)
+
+
+def _split(msg):
+    """
+    Rest of a streamed listing and its elements,
+    None and the elements for a bare iterator
+    """
+    if isinstance(msg, dict):
+        head = {key: value for key, value in msg.items() if key != '_elem'}
+        return (head, msg['_elem'])
+    return (None, msg)
 
 
 class TypesObj():
@@ -14,30 +47,61 @@ class TypesObj():
     @staticmethod
     def factory(mime_type):
         """
-        Create json or yaml object
+        Json, yaml or ndjson object, the same one for every request
         """
-        if mime_type == 'application/json':
-            return JsonObj()
-        if mime_type == 'application/yaml':
-            return YamlObj()
-        return None
+        return _MIME_OBJS.get(mime_type)
+
+    @staticmethod
+    def use_json_codec(name):
+        """
+        Encode the json and ndjson responses with the
+        registered JSON codec of this name
+        """
+        codec = jsoncodec.get(name)
+        _MIME_OBJS['application/json'] = JsonObj(codec)
+        _MIME_OBJS['application/x-ndjson'] = NdjsonObj(codec)
 
 
 class JsonObj():
     """
-    JSON object
+    JSON object, encoded as bytes
     """
+    def __init__(self, codec=jsoncodec.STANDARD):
+        self.codec = codec
+        # Separator of the elements of a streamed listing
+        self._comma = codec.dumpb([0, 0])[2:-2]
+
     def encode(self, msg):
         """
         json data encode
         """
-        return json.dumps(msg)
+        return self.codec.dumpb(msg)
+
+    def encode_stream(self, msg):
+        """
+        json data encode of a streamed response, chunk by chunk
+        """
+        return _buffered(self._stream_parts(msg), b'')
+
+    def _stream_parts(self, msg):
+        (head, elems) = _split(msg)
+        dumpb = self.codec.dumpb
+        if head is None:
+            closing = b']'
+            yield b'['
+        else:
+            closing = b']}'
+            # The rest of the listing with _elem as its last key
+            yield dumpb(dict(head, _elem=[]))[:-2]
+        for (index, elem) in enumerate(elems):
+            yield self._comma + dumpb(elem) if index else dumpb(elem)
+        yield closing
 
     def decode(self, msg):
         """
         json data decode
         """
-        return json.loads(msg.decode())
+        return jsoncodec.loads(msg)
 
 
 class YamlObj():
@@ -48,10 +112,79 @@ class YamlObj():
         """
         yaml data encode
         """
-        return yaml.dump(msg)
+        return yamlcodec.dump(msg)
+
+    def encode_stream(self, msg):
+        """
+        yaml data encode of a streamed response, chunk by chunk
+        """
+        return _buffered(self._stream_parts(msg))
+
+    @staticmethod
+    def _stream_parts(msg):
+        (head, elems) = _split(msg)
+        if head:
+            yield yamlcodec.dump(head)
+        if head is not None:
+            yield '_elem:'
+        empty = True
+        for elem in elems:
+            if empty and head is not None:
+                yield '\n'
+            # The elements make up a block sequence, which
+            # may start at the indentation of its key
+            yield yamlcodec.dump([elem])
+            empty = False
+        if empty:
+            yield ' []\n' if head is not None else '[]\n'
 
     def decode(self, msg):
         """
         yaml data decode
         """
-        return yaml.load(msg)
+        return yamlcodec.load(msg)
+
+
+class NdjsonObj():
+    """
+    Newline delimited JSON object, a listing is sent
+    as its rest followed by one line per element
+    """
+    def __init__(self, codec=jsoncodec.STANDARD):
+        self.codec = codec
+
+    def encode(self, msg):
+        """
+        ndjson data encode, a listing in the lines it is streamed in
+        """
+        if isinstance(msg, list) or (
+                isinstance(msg, dict) and '_elem' in msg):
+            return b''.join(self._stream_parts(msg))
+        return self.codec.dumpb(msg) + b'\n'
+
+    def encode_stream(self, msg):
+        """
+        ndjson data encode of a streamed response, chunk by chunk
+        """
+        return _buffered(self._stream_parts(msg), b'')
+
+    def _stream_parts(self, msg):
+        (head, elems) = _split(msg)
+        dumpb = self.codec.dumpb
+        if head:
+            yield dumpb(head) + b'\n'
+        for elem in elems:
+            yield dumpb(elem) + b'\n'
+
+    def decode(self, msg):
+        """
+        ndjson data decode, a list of the objects of the lines
+        """
+        return [jsoncodec.loads(line) for line in msg.splitlines()
+                if line.strip()]
+
+
+# Encoders and decoders by mime type, they keep no state
+_MIME_OBJS = {'application/json': JsonObj(),
+              'application/yaml': YamlObj(),
+              'application/x-ndjson': NdjsonObj()}
@@ -3,53 +3,68 @@ Utilities used by jsonschema validation
 """
 import http.client
 import os
-import yaml
 
+from laf.server.app import config
 from laf.server.app import error
+from laf.server.app import yamlcodec
+
+CMCONFIG_FILE = 'etc/cm-config.yml'
+
+
+def parse_cmconfig(stream):
+    """
+    (lone, operation id) pairs of the change management
+    config which need a change management ticket
+    """
+    cmconfig = yamlcodec.load(stream) or dict()
+    operations = set()
+    for lone, operationids in cmconfig.items():
+        if isinstance(operationids, str):
+            operationids = [operationids]
+        for operationid in operationids or ():
+            operations.add((lone, operationid))
+    return frozenset(operations)
 
 
 def check_cmconfig(basedir, req_cm, lone, verb,
                    primarykey, obj, user,
                    host, operationid=None):
     """
-    Check change management config
+    Check change management config, parsed
+    again only once the file changed
     """
     if not operationid:
         operationid = verb
-    cmfile = os.path.join(basedir, 'etc/cm-config.yml')
+    cmfile = os.path.join(basedir, CMCONFIG_FILE)
     try:
-        with open(cmfile) as outfile:
-            try:
-                cmconfig = yaml.load(outfile)
-                if lone in cmconfig:
-                    if operationid in cmconfig[lone]:
-                        if not req_cm:
-                            msg = (
-                                """Please provide a valid change """
-                                """management ticket"""
-                            )
-                            raise error.APIError(
-                                msg,
-                                http.client.BAD_REQUEST,
-                                lone,
-                                verb,
-                                primarykey,
-                                obj,
-                                user,
-                                host)
-            except yaml.YAMLError as _:
-                msg = 'Error loading cm-config.yml file'
-                raise error.APIError(
-                    msg,
-                    http.client.BAD_REQUEST,
-                    lone,
-                    verb,
-                    primarykey,
-                    obj,
-                    user,
-                    host)
+        cm_operations = config.read_config_file(cmfile, parse_cmconfig)
     except FileNotFoundError as _:
         return
+    except yamlcodec.YAMLError as _:
+        msg = 'Error loading cm-config.yml file'
+        raise error.APIError(
+            msg,
+            http.client.BAD_REQUEST,
+            lone,
+            verb,
+            primarykey,
+            obj,
+            user,
+            host)
+    if (lone, operationid) in cm_operations and not req_cm:
+        msg = (
+            """Please provide a valid change """
+            """management ticket"""
+        )
+        raise error.APIError(
+            msg,
+            http.client.BAD_REQUEST,
+            lone,
+            verb,
+            primarykey,
+            obj,
+            user,
+            host)
 
 
 def format_as_index(indices):
@@ -2,16 +2,57 @@
 Validator based on jsonschema
 """
 
+from concurrent import futures
+import copy
 import http.client
 import logging
+import random
+import threading
 import urllib.parse
 import jsonschema
 from flask import request, g, current_app
+from laf.server.app import config
 from laf.server.app import error
 from laf.server.app import validationutils
+from laf.server import metrics
 
 _LOG = logging.getLogger(__name__)
 
+# Responses waiting for their validation in the background at most,
+# the ones coming on top are dropped
+ASYNC_BACKLOG = 100
+
+# Outcome of the response validations, valid, invalid, skipped by
+# sampling or dropped from a full backlog, counted by each server
+# process
+RESPONSE_VALIDATIONS = metrics.Counter(
+    'laf_response_validations_total',
+    'Responses checked against their schema by result',
+    ('lone', 'operation', 'result'))
+_METRICS_LOCK = threading.Lock()
+_ASYNC = {'executor': None, 'backlog': 0}
+_ASYNC_LOCK = threading.Lock()
+
+
+class ResponseValidator():
+    """
+    Schema validator of the responses of an operation, with
+    the validation policy the operation declares if any
+    """
+    __slots__ = ['validator', 'lone', 'operationid', 'policy']
+
+    def __init__(self, validator, lone, operationid, policy=None):
+        self.validator = validator
+        self.lone = lone
+        self.operationid = operationid
+        self.policy = policy
+
+    def validate(self, instance):
+        """
+        Raise a ValidationError for an invalid response
+        """
+        self.validator.validate(instance)
+
 
 def validate_input(req_validator, para_types,
                    lone, verb):
@@ -64,6 +105,31 @@ def validate_input(req_validator, para_types,
         data = decoder.decode(request.data)
     if data:
         obj.update({'body': data})
+    return _validate_obj(req_validator, lone, verb, pk, obj, user, host)
+
+
+def validate_operation(req_validator, lone, verb, operation):
+    """
+    Validate the parameters and requestbody of
+    an operation of a batch request
+    """
+    obj = dict()
+    user = request.environ.get('REMOTE_USER')
+    host = request.environ.get('REMOTE_ADDR')
+    for part in ('path', 'query'):
+        if operation.get(part):
+            obj[part] = dict(operation[part])
+    if operation.get('body'):
+        obj['body'] = operation['body']
+    pk = obj.get('path', dict()).get('primary_key')
+    return _validate_obj(req_validator, lone, verb, pk, obj, user, host)
+
+
+def _validate_obj(req_validator, lone, verb, pk, obj, user, host):
+    """
+    Check the cm and validate the request against its schema,
+    then complete it with the request headers
+    """
     basedir = current_app.config['config']['basedir']
     req_cm = request.headers.get('LAF-CM', None)
     validationutils.check_cmconfig(basedir, req_cm, lone, verb,
@@ -137,7 +203,39 @@ def get_patharg_data(data, valtype, style='simple', explode=True):
 
 def validate_response(resp_validator, response, status_code, txid):
     """
-    Validate response
+    Validate response, according to the validation policy of
+    the operation, else of its lone, else of the server
+    """
+    policy = response_policy(resp_validator)
+    if policy['policy'] == config.VALIDATE_OFF:
+        return
+    if policy['policy'] != config.VALIDATE_ALWAYS and (
+            random.random() >= policy['rate']):
+        _count(resp_validator, 'skipped')
+        return
+    if policy['policy'] == config.VALIDATE_ASYNC:
+        _submit(resp_validator, response, status_code, txid)
+        return
+    _check_response(resp_validator, response, status_code, txid)
+
+
+def response_policy(resp_validator):
+    """
+    Response validation policy of an operation
+    """
+    policy = getattr(resp_validator, 'policy', None)
+    if policy is not None:
+        return policy
+    validation_cfg = current_app.config.get('response_validation')
+    if validation_cfg is None:
+        return {'policy': config.VALIDATE_ALWAYS, 'rate': 1.0}
+    return validation_cfg['lones'].get(getattr(resp_validator, 'lone', None),
+                                       validation_cfg['default'])
+
+
+def _check_response(resp_validator, response, status_code, txid):
+    """
+    Validate a response, a mismatch is logged and counted
     """
     code = str(status_code)
     resp = {
@@ -147,3 +245,64 @@ def validate_response(resp_validator, response, status_code, txid):
         resp_validator.validate(resp)
     except jsonschema.exceptions.ValidationError as err:
         _LOG.info("[%s]: Response validation error %s", txid, err.message)
+        _count(resp_validator, 'invalid')
+    else:
+        _count(resp_validator, 'valid')
+
+
+def _submit(resp_validator, response, status_code, txid):
+    """
+    Validate a copy of a response in the background while the
+    response is sent, so that what is validated is what was returned
+    whatever happens to the response afterwards
+    """
+    with _ASYNC_LOCK:
+        if _ASYNC['backlog'] >= ASYNC_BACKLOG:
+            submitted = False
+        else:
+            if _ASYNC['executor'] is None:
+                # Started in each server process on first use
+                _ASYNC['executor'] = futures.ThreadPoolExecutor(
+                    max_workers=1,
+                    thread_name_prefix='laf-response-validation')
+            _ASYNC['backlog'] += 1
+            submitted = True
+    if not submitted:
+        _count(resp_validator, 'dropped')
+        return
+    _ASYNC['executor'].submit(_check_async, resp_validator,
+                              copy.deepcopy(response), status_code, txid)
+
+
+def _check_async(resp_validator, response, status_code, txid):
+    """
+    Validate a response in the background
+    """
+    try:
+        _check_response(resp_validator, response, status_code, txid)
+    # W0703: broad-except
+    except Exception:  # pylint: disable=W0703
+        _LOG.exception('[%s]: Response validation failed', txid)
+    finally:
+        with _ASYNC_LOCK:
+            _ASYNC['backlog'] -= 1
+
+
+def _count(resp_validator, result):
+    """
+    Count the outcome of a response validation
+    """
+    with _METRICS_LOCK:
+        RESPONSE_VALIDATIONS.inc(
+            lone=getattr(resp_validator, 'lone', None),
+            operation=getattr(resp_validator, 'operationid', None),
+            result=result)
+
+
+def metrics_text():
+    """
+    Response validation metrics of this server
+    process in the Prometheus text format
+    """
+    with _METRICS_LOCK:
+        return metrics.render((RESPONSE_VALIDATIONS,))
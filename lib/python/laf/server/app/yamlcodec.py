@@ -0,0 +1,56 @@
+"""
+YAML codec of the server and of the command line
+
+Only plain data is loaded and dumped, with the libyaml based
+loader and dumper when PyYAML was built with libyaml and the
+pure Python ones otherwise.
+"""
+
+import yaml
+
+try:
+    # E0611: No name 'CSafeLoader' in module 'yaml'
+    from yaml import CSafeLoader as _Loader  # pylint: disable=E0611
+    from yaml import CSafeDumper as _Dumper  # pylint: disable=E0611
+    LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader as _Loader
+    from yaml import SafeDumper as _Dumper
+    LIBYAML = False
+
+__all__ = ['LIBYAML', 'Loader', 'Dumper', 'load', 'dump', 'YAMLError']
+
+YAMLError = yaml.YAMLError
+
+
+# R0901: Too many ancestors
+class Loader(_Loader):  # pylint: disable=R0901
+    """
+    Safe loader, libyaml based when available
+    """
+
+
+# R0901: Too many ancestors
+class Dumper(_Dumper):  # pylint: disable=R0901
+    """
+    Safe dumper, libyaml based when available
+    """
+
+
+# Tuples, e.g. of a lone run locally, are dumped as lists
+Dumper.add_representer(tuple, Dumper.represent_list)
+
+
+def load(stream):
+    """
+    Load a YAML document from a string or a file
+    """
+    return yaml.load(stream, Loader=Loader)
+
+
+def dump(data, stream=None, **kwds):
+    """
+    Dump data as a YAML document, to the stream if given
+    else as the returned string
+    """
+    return yaml.dump(data, stream, Dumper=Dumper, **kwds)
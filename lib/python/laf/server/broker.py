@@ -3,21 +3,310 @@ zeromq loadbalancing pattern to
 handle laf workers
 """
 
+import collections
+import ctypes
+import math
 import os
 import signal
 import logging
-import json
 import http.client
 import subprocess
+import time
 # E0401: Unable to import 'zmq'
 import zmq  # pylint: disable=E0401
+# E0401: Unable to import 'zmq.auth'
+import zmq.auth  # pylint: disable=E0401
+# E0401: Unable to import 'zmq.auth.thread'
+from zmq.auth.thread import ThreadAuthenticator  # pylint: disable=E0401
 # E0401: Unable to import 'zmq.eventloop.ioloop'
 # E0401: Unable to import 'zmq.eventloop.zmqstream'
 from zmq.eventloop.ioloop import IOLoop  # pylint: disable=E0401
+from zmq.eventloop.ioloop import PeriodicCallback  # pylint: disable=E0401
 from zmq.eventloop.zmqstream import ZMQStream  # pylint: disable=E0401
 
+from laf.server import cache
+from laf.server import control
+from laf.server import protocol
+from laf.server import scheduler
+from laf.server import worker
+from laf.server.app import config
+from laf.server.app import jsoncodec
+
 _LOG = logging.getLogger(__name__)
 
+# Default number of requests held while every worker is busy
+DEFAULT_QUEUE_SIZE = 100
+# Default number of seconds a request may wait for a worker
+DEFAULT_QUEUE_TIMEOUT = 10
+# Default number of seconds a worker may overrun a request deadline
+# before it is killed
+DEFAULT_KILL_GRACE = 5
+# Weight of the last request in the service time moving average
+SERVICE_TIME_WEIGHT = 0.1
+# Milliseconds between two checks of the queued and running requests
+SWEEP_INTERVAL = 100
+# Milliseconds between two evaluations of the worker pool size
+SCALE_INTERVAL = 1000
+# Busy ratio above which the pool is under pressure
+SCALE_UP_RATIO = 0.8
+# Busy ratio below which the pool is over sized
+SCALE_DOWN_RATIO = 0.3
+# Consecutive evaluations needed before growing the pool
+SCALE_UP_TICKS = 3
+# Consecutive evaluations needed before shrinking the pool
+SCALE_DOWN_TICKS = 60
+# Default share of the workers kept for interactive requests
+DEFAULT_RESERVED_SHARE = 0.0
+# Default number of seconds between two priority class reports
+DEFAULT_STATS_INTERVAL = 60
+# Default number of seconds a stopping broker waits for the queued
+# and running requests before killing the workers
+DEFAULT_DRAIN_TIMEOUT = 30
+# Seconds before a worker which died young is replaced, doubled
+# while the workers of its pool keep dying young up to the maximum
+RESPAWN_DELAY = 1.0
+RESPAWN_DELAY_MAX = 60.0
+# Seconds a worker has to stay up for the delay to be reset
+STABLE_UPTIME = 10.0
+# Zygotes failing to preload the lones in a row before the workers
+# are started from scratch
+ZYGOTE_MAX_FAILURES = 5
+# Default number of seconds a new worker may take to announce itself
+# before it is killed
+DEFAULT_START_TIMEOUT = 60
+# ZAP domain of the endpoint of the remote workers, the local
+# workers are not authenticated
+REMOTE_DOMAIN = 'laf-remote'
+# Hosts of the tcp endpoints which only local processes reach
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1', '[::1]')
+# prctl option making orphaned descendants children of the caller
+PR_SET_CHILD_SUBREAPER = 36
+# Identities of the workers start with it
+WORKER_PREFIX = b'Worker-'
+
+
+class Job():
+    """
+    A client request going through the broker
+    """
+    __slots__ = ['envelope', 'client_addr', 'header', 'request', 'codec',
+                 'lone', 'pk', 'method', 'cache_key', 'generation',
+                 'pclass', 'deadline', 'enqueued', 'started',
+                 'replied', 'streaming', 'expired', 'killed']
+
+    def __init__(self, envelope, header, request, lone_classes=None):
+        # Routing frames of the client, its address and the correlation
+        # id of the request when the client multiplexes its requests
+        self.envelope = envelope
+        self.client_addr = client_address(envelope)
+        self.header = header
+        self.request = request
+        fields = protocol.decode_header(header)
+        # The broker answers in the codec of the request
+        self.codec = fields['codec']
+        self.lone = fields.get('lone')
+        self.pk = fields.get('pk')
+        self.method = fields.get('method', 'get')
+        # Set by the laf server on a GET when the replies are cached,
+        # generation of the lone data when the request came in
+        self.cache_key = fields.get('cache')
+        self.generation = None
+        self.pclass = scheduler.classify(fields, lone_classes)
+        self.deadline = fields.get('deadline')
+        self.enqueued = time.time()
+        self.started = None
+        # The worker answered the client
+        self.replied = False
+        # The client got part of a streamed reply, the rest is to come
+        self.streaming = False
+        # The broker answered the client on behalf of the worker
+        self.expired = False
+        self.killed = False
+
+    @property
+    def answered(self):
+        """
+        Whether the client already got its answer
+        """
+        return self.replied or self.expired
+
+
+class WorkerPool():
+    """
+    Workers dedicated to a group of lones, with their own queue
+    """
+
+    # R0913: Too many arguments
+    def __init__(self, name, lones, size,  # pylint: disable=R0913
+                 min_workers, max_workers, queue_size,
+                 pending, reserved_share, env=None):
+        self.name = name
+        self.lones = lones
+        self.size = size
+        self.min_workers = min(min_workers, max_workers)
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        # Settings of the workers of the pool
+        self.env = env or dict()
+        # Free worker slots in least recently used order, a worker
+        # appears once per request it can take, and busy workers
+        # mapped to the jobs they are serving by client
+        self.idle = collections.deque()
+        self.busy = dict()
+        # Slots announced by each worker
+        self.slots = dict()
+        # Number of running jobs, in total and of each priority class
+        self.running = 0
+        self.busy_classes = collections.Counter()
+        self.procs = dict()
+        # When each local worker was started
+        self.spawned = dict()
+        # Delay before replacing a worker which died young, and the
+        # number of workers waiting for it to be started
+        self.respawn_delay = 0.0
+        self.respawns = 0
+        # Workers the zygote is asked to fork
+        self.forking = 0
+        # Workers told to stop, they are not replaced when they exit
+        self.draining = set()
+        # Workers which reached a recycling limit, they are drained
+        # once a replacement announced its slots
+        self.retiring = set()
+        # Workers of other hosts, mapped to their host
+        self.remote = dict()
+        # Local workers killed, their restart is counted by why
+        # they were killed rather than as an exit
+        self.killed = set()
+        self.pending = pending
+        self.reserved_share = reserved_share
+        self.service_time = None
+        self.hot = 0
+        self.cold = 0
+
+    def __repr__(self):
+        return 'WorkerPool({0!r})'.format(self.name)
+
+    @property
+    def elastic(self):
+        """
+        Whether the pool may grow or shrink
+        """
+        return self.max_workers > self.min_workers
+
+    def worker_count(self):
+        """
+        Number of local workers which are not being stopped
+        or replaced
+        """
+        return (len(self.procs) + self.respawns + self.forking -
+                len(self.draining) - len(self.retiring))
+
+    def check_stable(self, now):
+        """
+        Reset the respawn delay once a worker stayed up
+        """
+        if self.respawn_delay and any(
+                now - started >= STABLE_UPTIME
+                for started in self.spawned.values()):
+            self.respawn_delay = 0.0
+
+    def capacity(self):
+        """
+        Number of requests the ready workers can serve at once
+        """
+        return sum(slots for laf_worker, slots in self.slots.items()
+                   if laf_worker not in self.draining)
+
+    def occupy(self, laf_worker, job):
+        """
+        Mark a worker slot busy serving a job
+        """
+        self.busy.setdefault(laf_worker, dict())[job.client_addr] = job
+        self.running += 1
+        self.busy_classes[job.pclass] += 1
+
+    def release(self, laf_worker, client_addr):
+        """
+        Free the worker slot serving a client, return its job
+        """
+        jobs = self.busy.get(laf_worker)
+        if jobs is None or client_addr not in jobs:
+            return None
+        job = jobs.pop(client_addr)
+        if not jobs:
+            del self.busy[laf_worker]
+        self.running -= 1
+        self.busy_classes[job.pclass] -= 1
+        return job
+
+    def job(self, laf_worker, client_addr):
+        """
+        Job a worker is serving for a client
+        """
+        return self.busy.get(laf_worker, dict()).get(client_addr)
+
+    def jobs(self):
+        """
+        All the running jobs with their worker
+        """
+        for laf_worker, jobs in self.busy.items():
+            for job in jobs.values():
+                yield (laf_worker, job)
+
+    def remove_idle(self, laf_worker):
+        """
+        Drop the free slots of a worker
+        """
+        if laf_worker in self.idle:
+            self.idle = collections.deque(
+                slot for slot in self.idle if slot != laf_worker)
+
+    def forget(self, laf_worker):
+        """
+        Drop a worker, return the jobs it was serving
+        """
+        self.remove_idle(laf_worker)
+        self.slots.pop(laf_worker, None)
+        jobs = list(self.busy.get(laf_worker, dict()).values())
+        for job in jobs:
+            self.release(laf_worker, job.client_addr)
+        return jobs
+
+    def admit(self, pclass):
+        """
+        Whether a request of a priority class may take a worker,
+        the reserved share of the workers only serves interactive
+        requests
+        """
+        if pclass == scheduler.INTERACTIVE or not self.reserved_share:
+            return True
+        capacity = self.capacity()
+        reserved = int(capacity * self.reserved_share)
+        others = self.running - self.busy_classes[scheduler.INTERACTIVE]
+        return others < capacity - reserved
+
+    def record_service_time(self, job):
+        """
+        Update the moving average of the worker service time
+        """
+        if job.started is None:
+            return
+        elapsed = time.time() - job.started
+        if self.service_time is None:
+            self.service_time = elapsed
+        else:
+            self.service_time += SERVICE_TIME_WEIGHT * (
+                elapsed - self.service_time)
+
+    def retry_after(self):
+        """
+        Estimate in seconds when a rejected client should retry
+        """
+        service_time = self.service_time or 1.0
+        slots = max(self.capacity(), 1)
+        estimate = (len(self.pending) + 1) * service_time / slots
+        return max(1, int(math.ceil(estimate)))
+
 
 class LRUQueue():
     """LRUQueue class using ZMQStream/IOLoop for event dispatching"""
@@ -30,7 +319,8 @@ class LRUQueue():
                 basedir=None,
                 daemon_flag=None,
                 worker_bin=None,
-                deployment=None):
+                deployment=None,
+                options=None):
         _LOG.debug('lruqueue instance called %s', LRUQueue.__instance)
         if LRUQueue.__instance is None:
             LRUQueue.__instance = super().__new__(cls)
@@ -40,19 +330,116 @@ class LRUQueue():
             frontend_socket = context.socket(zmq.ROUTER)
             frontend_socket.bind(frontend_url)
             backend_socket = context.socket(zmq.ROUTER)
+            # A worker connecting again takes its identity back
+            backend_socket.setsockopt(zmq.ROUTER_HANDOVER, 1)
             backend_socket.bind(backend_url)
             LRUQueue.__instance.backend_url = backend_url
             LRUQueue.__instance.frontend = ZMQStream(frontend_socket)
             LRUQueue.__instance.backend = ZMQStream(backend_socket)
+            # Payloads are passed along without being copied
             LRUQueue.__instance.backend.on_recv(
-                LRUQueue.__instance.handle_backend)
+                LRUQueue.__instance.handle_backend, copy=False)
             LRUQueue.__instance.frontend.on_recv(
-                LRUQueue.__instance.handle_frontend)
+                LRUQueue.__instance.handle_frontend, copy=False)
+            # Worker pools by name and by lone they serve,
+            # workers mapped to their pool
+            LRUQueue.__instance.pools = dict()
+            LRUQueue.__instance.lone_pools = dict()
             LRUQueue.__instance.workers = dict()
+            LRUQueue.__instance.worker_env = dict()
             LRUQueue.__instance.basedir = basedir
             LRUQueue.__instance.daemon = daemon_flag
             LRUQueue.__instance.worker_bin = worker_bin
             LRUQueue.__instance.deployment = deployment
+            if options is None:
+                options = dict()
+            LRUQueue.__instance.queue_size = int(
+                options.get('queue_size', DEFAULT_QUEUE_SIZE))
+            LRUQueue.__instance.queue_timeout = float(
+                options.get('queue_timeout', DEFAULT_QUEUE_TIMEOUT))
+            LRUQueue.__instance.kill_grace = float(
+                options.get('kill_grace', DEFAULT_KILL_GRACE))
+            LRUQueue.__instance.min_workers = options.get('min_workers')
+            LRUQueue.__instance.max_workers = options.get('max_workers')
+            LRUQueue.__instance.priority_policy = options.get(
+                'priority_policy', scheduler.STRICT)
+            LRUQueue.__instance.priority_weights = options.get(
+                'priority_weights', scheduler.DEFAULT_WEIGHTS)
+            LRUQueue.__instance.worker_threads = int(
+                options.get('worker_threads', 1))
+            LRUQueue.__instance.longrunning_procs = int(options.get(
+                'longrunning_procs', worker.DEFAULT_LONGRUNNING_PROCS))
+            LRUQueue.__instance.longrunning_backlog = int(options.get(
+                'longrunning_backlog', worker.DEFAULT_LONGRUNNING_BACKLOG))
+            LRUQueue.__instance.reserved_share = float(
+                options.get('reserved_share', DEFAULT_RESERVED_SHARE))
+            LRUQueue.__instance.max_requests = int(
+                options.get('max_requests', 0))
+            LRUQueue.__instance.max_requests_jitter = int(
+                options.get('max_requests_jitter', 0))
+            LRUQueue.__instance.max_worker_age = float(
+                options.get('max_worker_age', 0))
+            LRUQueue.__instance.max_worker_rss = int(
+                options.get('max_worker_rss', 0))
+            # Priority class of the lones which set one
+            LRUQueue.__instance.lone_classes = dict()
+            LRUQueue.__instance.preload = bool(options.get('preload'))
+            LRUQueue.__instance.zygote = None
+            LRUQueue.__instance.zygote_pid = None
+            LRUQueue.__instance.zygote_buffer = b''
+            # Whether the zygote preloaded the lones, and how many
+            # zygotes in a row died before they did
+            LRUQueue.__instance.zygote_ready = False
+            LRUQueue.__instance.zygote_started = None
+            LRUQueue.__instance.zygote_failures = 0
+            # Pools of the workers the zygote is asked to fork
+            LRUQueue.__instance.forks = collections.deque()
+            LRUQueue.__instance.scaler = None
+            LRUQueue.__instance.reporter = None
+            # A rolling reload waits for the new zygote to preload,
+            # why the last one failed if it did
+            LRUQueue.__instance.reloading = False
+            LRUQueue.__instance.reload_error = None
+            # Stopping, new requests are rejected until the
+            # workers are done or the deadline passed
+            LRUQueue.__instance.stopping = False
+            LRUQueue.__instance.stop_deadline = None
+            LRUQueue.__instance.stopper = None
+            LRUQueue.__instance.drain_timeout = float(options.get(
+                'drain_timeout', DEFAULT_DRAIN_TIMEOUT))
+            LRUQueue.__instance.metrics = control.BrokerMetrics()
+            # Replies served again, None when nothing is cached
+            LRUQueue.__instance.cache = None
+            # Hosts whose workers may not join
+            LRUQueue.__instance.drained_hosts = set()
+            # Checks the workers of other hosts, None if anyone may join
+            LRUQueue.__instance.authenticator = None
+            # Last time each worker was heard of
+            LRUQueue.__instance.last_seen = dict()
+            # Local workers which did not announce themselves yet,
+            # mapped to when they were started
+            LRUQueue.__instance.starting = dict()
+            LRUQueue.__instance.start_timeout = float(options.get(
+                'start_timeout', DEFAULT_START_TIMEOUT))
+            LRUQueue.__instance.heartbeat_interval = float(options.get(
+                'heartbeat_interval', protocol.HEARTBEAT_INTERVAL))
+            LRUQueue.__instance.heartbeat_liveness = int(options.get(
+                'heartbeat_liveness', protocol.HEARTBEAT_LIVENESS))
+            LRUQueue.__instance.heartbeat_checked = time.time()
+            LRUQueue.__instance.heartbeater = PeriodicCallback(
+                LRUQueue.__instance.check_heartbeats,
+                LRUQueue.__instance.heartbeat_interval * 1000)
+            LRUQueue.__instance.heartbeater.start()
+            stats_interval = float(
+                options.get('stats_interval', DEFAULT_STATS_INTERVAL))
+            if stats_interval > 0:
+                LRUQueue.__instance.reporter = PeriodicCallback(
+                    LRUQueue.__instance.report_stats,
+                    stats_interval * 1000)
+                LRUQueue.__instance.reporter.start()
+            LRUQueue.__instance.sweeper = PeriodicCallback(
+                LRUQueue.__instance.sweep, SWEEP_INTERVAL)
+            LRUQueue.__instance.sweeper.start()
             _LOG.debug('lruqueue instance new done')
         return LRUQueue.__instance
 
@@ -64,18 +451,79 @@ class LRUQueue():
 
         #  Queue worker address for LRU routing
         _LOG.debug('handle backend %r', msg)
-        worker_addr, _, client_addr = msg[:3]
+        worker_addr, client_addr = msg[0].bytes, msg[2].bytes
+        pool = self.workers.get(worker_addr)
+        if pool is None:
+            pool = self.adopt_worker(worker_addr, msg)
+            if pool is None:
+                return
+        self.last_seen[worker_addr] = time.time()
+        self.starting.pop(worker_addr, None)
 
-        # add worker back to the list of workers
-        if client_addr == b"READY":
-            self.workers[worker_addr] = None
+        if client_addr == protocol.HEARTBEAT:
+            return
+
+        if client_addr == protocol.RETIRE:
+            self.retire_worker(pool, worker_addr)
+            return
+
+        if client_addr == protocol.CHANGED:
+            # A @longrunning change the client got its answer of
+            # long ago, the replies read meanwhile are stale
+            if self.cache is not None:
+                self.cache.invalidate(*protocol.parse_changed(msg))
+            return
+
+        # add worker slots back to the list of free slots
+        if client_addr == protocol.READY:
+            (credits, done, _) = protocol.parse_ready(msg)
+            if done is None:
+                # A new worker announcing its slots, or a worker which
+                # lost us and connected again, its requests are lost
+                self.remove_worker(pool, worker_addr)
+                pool.slots[worker_addr] = credits
+                if pool.retiring and worker_addr not in pool.retiring:
+                    # It replaces a retiring worker
+                    self.drain_worker(pool, pool.retiring.pop())
+            else:
+                job = pool.release(worker_addr, done)
+                if job is not None:
+                    pool.record_service_time(job)
+                    if (self.cache is not None and
+                            job.method in cache.WRITE_METHODS):
+                        # It may have been answered before it was done
+                        self.cache.invalidate(job.lone, job.pk)
+                    if job.started is not None:
+                        self.metrics.service.observe(
+                            time.time() - job.started, lone=job.lone)
+                    self.abandon(job)
+            if worker_addr in pool.draining:
+                if worker_addr not in pool.busy:
+                    self.stop_worker(pool, worker_addr)
+                return
+            for _ in range(credits):
+                if not self.dispatch_pending(pool, worker_addr):
+                    pool.idle.append(worker_addr)
 
         # Third frame is READY or else a client reply address
         # If client reply, send rest back to frontend
-        if client_addr != b"READY":
-            _, reply = msg[3:]
-            _LOG.debug('worker reply %r', reply)
-            self.frontend.send_multipart([client_addr, b'', reply])
+        if client_addr != protocol.READY:
+            # Reply header and payload
+            reply = msg[4:]
+            _LOG.debug('worker reply for %r', client_addr)
+            job = pool.job(worker_addr, client_addr)
+            if job is None or (job.answered and not job.streaming):
+                # The broker gave up on this request already
+                _LOG.info('dropping late reply of %r for %r',
+                          worker_addr, client_addr)
+                return
+            first = not job.replied
+            job.replied = True
+            job.streaming = protocol.has_more(reply)
+            if self.cache is not None:
+                self.cache_reply(job, reply, first)
+            self.frontend.send_multipart(job.envelope + [b''] + reply,
+                                         copy=False)
 
     def handle_frontend(self, msg):
         """
@@ -83,81 +531,1102 @@ class LRUQueue():
         send response from laf worker back to
         laf client
         """
-        # Client request is [address][empty][request]
+        # Client request is [address][correlation id][empty][header]
+        # [request], only multiplexing clients send a correlation id
         _LOG.debug('handle frontend %r', msg)
-        client_addr, _, request = msg
-        #  Dequeue and drop the next worker address
-        res = {k: v for k, v in self.workers.items() if v is None}
-        _LOG.debug('worker count in frontend is %d', len(res))
-        for laf_worker, client in self.workers.items():
-            if client is None:
-                _LOG.debug('current worker is %r',
-                           self.workers[laf_worker])
-                self.workers[laf_worker] = client_addr
-                try:
-                    _LOG.debug('sending to worker id %s', laf_worker)
-                    self.backend.send_multipart(
-                        [laf_worker, b'', client_addr, b'', request])
-                except zmq.ZMQError as err:
-                    _LOG.exception("Error in worker - %r", err)
-                else:
-                    return
-        _LOG.debug('server busy ; worker list is %r', self.workers)
+        envelope = [frame.bytes for frame in msg[:-3]]
+        header, request = msg[-2:]
+        try:
+            job = Job(envelope, header, request, self.lone_classes)
+        except ValueError as err:
+            _LOG.error('invalid request from %r: %s', envelope, err)
+            result = {'resp': {'status': 'Unsupported message'},
+                      'code': http.client.BAD_REQUEST}
+            self.frontend.send_multipart(
+                envelope + [b'', protocol.encode(result, protocol.JSON)])
+            return
+        pool = self.route(job)
+        if pool is None:
+            _LOG.error('no worker pool serves lone %r', job.lone)
+            self.fail(job, 'No worker serves lone {0}'.format(job.lone))
+            return
+        self.metrics.requests.inc(pool=pool.name, lone=job.lone)
+        if self.stopping:
+            self.reject(pool, job, 'Server shutting down')
+            return
+        if self.cache is not None and self.serve_cached(job):
+            return
+        #  Dequeue the least recently used worker of the pool
+        _LOG.debug('idle worker count of %r in frontend is %d',
+                   pool, len(pool.idle))
+        while pool.idle and pool.admit(job.pclass):
+            laf_worker = pool.idle.popleft()
+            if self.dispatch(pool, laf_worker, job):
+                return
+        if len(pool.pending) < pool.queue_size:
+            _LOG.debug('%r busy, queueing %s request; queue depth %d',
+                       pool, job.pclass, pool.pending.depth(job.pclass))
+            pool.pending.append(job)
+            return
+        _LOG.debug('%r busy ; busy workers are %r', pool, pool.busy)
+        self.reject(pool, job, 'Try again server busy')
+
+    def adopt_worker(self, laf_worker, msg):
+        """
+        Pool of an unknown worker: a worker of another host joins
+        the pool it names when it announces itself. None if the
+        worker is not welcome.
+        """
+        if not laf_worker.startswith(WORKER_PREFIX):
+            # Left over on a connection a worker replaced
+            _LOG.debug('dropping message of stale connection %r',
+                       laf_worker)
+            return None
+        host = worker_host(laf_worker)
+        if host is None:
+            # e.g. a worker of a previous broker connecting again
+            _LOG.error('message from unknown worker %r, stopping it',
+                       laf_worker)
+            self.backend.send_multipart([laf_worker, b'', protocol.STOP])
+            return None
+        if msg[2].bytes != protocol.READY:
+            # A remote worker we gave up on, it connects again
+            # once it misses our heartbeats
+            _LOG.debug('dropping message of unknown worker %r', laf_worker)
+            return None
+        (_, done, name) = protocol.parse_ready(msg)
+        if done is not None:
+            return None
+        pool = self.pools.get(name or config.DEFAULT_POOL)
+        if pool is None or host in self.drained_hosts:
+            _LOG.error('worker %r of host %s may not join pool %s, '
+                       'stopping it', laf_worker, host, name)
+            self.backend.send_multipart([laf_worker, b'', protocol.STOP])
+            return None
+        _LOG.info('worker %r of host %s joined pool %s',
+                  laf_worker, host, pool.name)
+        self.workers[laf_worker] = pool
+        pool.remote[laf_worker] = host
+        return pool
+
+    def forget_remote(self, pool, laf_worker):
+        """
+        Forget about a worker of another host, its
+        supervisor restarts it if needed
+        """
+        self.remove_worker(pool, laf_worker)
+        self.workers.pop(laf_worker, None)
+        self.last_seen.pop(laf_worker, None)
+        pool.remote.pop(laf_worker, None)
+        pool.draining.discard(laf_worker)
+        pool.retiring.discard(laf_worker)
+        _LOG.info('worker %r left pool %s', laf_worker, pool.name)
+
+    def serve_cached(self, job):
+        """
+        Answer a request with a reply kept in the cache, a request
+        changing a lone drops the replies about it
+        """
+        if job.method in cache.WRITE_METHODS:
+            self.cache.invalidate(job.lone, job.pk)
+            return False
+        if job.cache_key is None:
+            return False
+        frames = self.cache.get(job.cache_key)
+        if frames is None:
+            job.generation = self.cache.generation(job.lone)
+            return False
+        self.metrics.cache.inc(lone=job.lone, result='hit')
+        self.frontend.send_multipart(job.envelope + [b''] + frames)
+        return True
+
+    def cache_reply(self, job, reply, first):
+        """
+        Keep the reply of a worker the time it said, a change is
+        visible to the client once it got the reply of the change
+        """
+        if job.method in cache.WRITE_METHODS:
+            self.cache.invalidate(job.lone, job.pk)
+            return
+        if job.generation is None or not first or job.streaming:
+            return
+        ttl = protocol.decode_header(reply[0]).get('ttl')
+        if ttl:
+            # Only the replies of cached operations count as misses
+            self.metrics.cache.inc(lone=job.lone, result='miss')
+            self.cache.put(job.cache_key, job.lone, job.pk,
+                           [frame.bytes for frame in reply], float(ttl),
+                           job.generation)
+
+    def clear_cache(self):
+        """
+        Forget the replies kept in the cache
+        """
+        if self.cache is None:
+            return 'Response cache is disabled'
+        self.cache.clear()
+        return 'ok'
+
+    def route(self, job):
+        """
+        Pool of the workers serving the lone of a request
+        """
+        pool = self.lone_pools.get(job.lone)
+        if pool is None:
+            pool = self.pools.get(config.DEFAULT_POOL)
+        return pool
+
+    def dispatch(self, pool, laf_worker, job):
+        """
+        Send a request to an idle laf worker
+        """
+        try:
+            _LOG.debug('sending to worker id %s', laf_worker)
+            self.backend.send_multipart(
+                [laf_worker, b'', job.client_addr, b'',
+                 job.header, job.request], copy=False)
+        except zmq.ZMQError as err:
+            _LOG.exception("Error in worker - %r", err)
+            return False
+        job.started = time.time()
+        pool.pending.record_wait(job, job.started)
+        self.metrics.wait.observe(job.started - job.enqueued, pool=pool.name)
+        pool.occupy(laf_worker, job)
+        return True
+
+    def dispatch_pending(self, pool, laf_worker):
+        """
+        Hand the oldest queued request to a worker
+        which just became ready
+        """
+        self.expire_pending(pool)
+        job = pool.pending.popleft(pool.admit)
+        if job is None:
+            return False
+        if self.dispatch(pool, laf_worker, job):
+            return True
+        pool.pending.appendleft(job)
+        return False
+
+    def sweep(self):
+        """
+        Periodic check of the queued and running requests
+        """
+        for pool in self.pools.values():
+            self.expire_pending(pool)
+            self.expire_busy(pool)
+
+    def expire_pending(self, pool):
+        """
+        Reject queued requests which waited too long for a worker
+        or which are past their deadline
+        """
+        now = time.time()
+        for job in pool.pending.pop_stale(now - self.queue_timeout):
+            _LOG.debug('queued request of %r expired', job.client_addr)
+            self.reject(pool, job, 'Try again server busy')
+        for job in pool.pending.pop_expired(now):
+            pool.pending.stats[job.pclass].expired += 1
+            self.expire(job)
+
+    def expire_busy(self, pool):
+        """
+        Answer the clients whose worker overran the deadline,
+        kill the worker if it does not give up in time. A worker
+        serving other requests is replaced first.
+        """
+        now = time.time()
+        for laf_worker, job in list(pool.jobs()):
+            if job.deadline is None or job.replied or job.killed:
+                continue
+            if not job.expired and now >= job.deadline:
+                self.expire(job)
+            if job.expired and now >= job.deadline + self.kill_grace:
+                job.killed = True
+                self.metrics.overruns.inc(lone=job.lone)
+                if pool.slots.get(laf_worker, 1) > 1:
+                    # Killing it would fail the other requests it
+                    # serves, it is replaced and killed once only
+                    # requests which overran are left
+                    _LOG.error('worker %r overran deadline, retiring it',
+                               laf_worker)
+                    self.retire_worker(pool, laf_worker, 'deadline')
+                    continue
+                _LOG.error('worker %r overran deadline, killing it',
+                           laf_worker)
+                self.kill_worker(pool, laf_worker, 'deadline')
+        for laf_worker in pool.draining:
+            jobs = pool.busy.get(laf_worker)
+            if jobs and all(job.killed for job in jobs.values()):
+                self.kill_worker(pool, laf_worker)
+
+    def check_heartbeats(self):
+        """
+        Send a heartbeat to the workers and give up on those which
+        missed theirs
+        """
+        now = time.time()
+        limit = self.heartbeat_interval * self.heartbeat_liveness
+        if now - self.heartbeat_checked > limit:
+            # The broker itself was stalled, the workers are not to blame
+            _LOG.error('broker missed %.1fs of heartbeats',
+                       now - self.heartbeat_checked)
+            self.last_seen = dict.fromkeys(self.last_seen, now)
+            self.starting = dict.fromkeys(self.starting, now)
+        self.heartbeat_checked = now
+        for pool in self.pools.values():
+            pool.check_stable(now)
+        if (self.zygote is not None and not self.zygote_ready and
+                now - self.zygote_started > self.start_timeout):
+            _LOG.error('zygote did not preload the lones within %ss, '
+                       'killing it', self.start_timeout)
+            self.zygote_started = math.inf
+            self.zygote.kill()
+        for laf_worker, started in list(self.starting.items()):
+            pool = self.workers.get(laf_worker)
+            if pool is None:
+                del self.starting[laf_worker]
+            elif now - started > self.start_timeout:
+                # It hangs before its first READY, it is
+                # replaced once reaped
+                _LOG.error('worker %r did not start within %ss, killing it',
+                           laf_worker, self.start_timeout)
+                del self.starting[laf_worker]
+                self.kill_worker(pool, laf_worker, 'start_timeout')
+        for laf_worker, seen in list(self.last_seen.items()):
+            pool = self.workers.get(laf_worker)
+            if pool is None:
+                del self.last_seen[laf_worker]
+            elif now - seen > limit:
+                self.worker_lost(pool, laf_worker)
+            else:
+                self.backend.send_multipart(
+                    [laf_worker, b'', protocol.HEARTBEAT])
+
+    def worker_lost(self, pool, laf_worker):
+        """
+        Fail the requests of a worker which went silent and kill it,
+        it is replaced once reaped
+        """
+        if laf_worker in pool.remote:
+            _LOG.error('worker %r of host %s missed its heartbeats',
+                       laf_worker, pool.remote[laf_worker])
+            # Its supervisor starts a new one
+            self.metrics.restarts.inc(pool=pool.name, reason='heartbeat')
+            self.forget_remote(pool, laf_worker)
+            return
+        _LOG.error('worker %r missed its heartbeats, killing it',
+                   laf_worker)
+        del self.last_seen[laf_worker]
+        self.remove_worker(pool, laf_worker)
+        self.kill_worker(pool, laf_worker, 'heartbeat')
+
+    def expire(self, job):
+        """
+        Send gateway timeout to the client of an expired request
+        """
+        _LOG.info('GATEWAY TIMEOUT for %r', job.client_addr)
+        self.metrics.timeouts.inc(lone=job.lone)
+        job.expired = True
+        result = {'resp': protocol.TIMEOUT,
+                  'code': http.client.GATEWAY_TIMEOUT}
+        self.answer(job, result)
+
+    def fail(self, job, status):
+        """
+        Send internal server error to the client of a request
+        """
+        message = {'status': status}
+        result = {'resp': message,
+                  'code': http.client.INTERNAL_SERVER_ERROR}
+        self.answer(job, result)
+
+    def abandon(self, job):
+        """
+        Answer the client of a request its worker gave up on,
+        ending the streamed reply it is reading if any
+        """
+        if self.cache is not None and job.method in cache.WRITE_METHODS:
+            # The change may have gone through
+            self.cache.invalidate(job.lone, job.pk)
+        if not job.answered:
+            self.fail(job, 'internal server error')
+        elif job.streaming:
+            job.streaming = False
+            self.answer(job, {'elem': list(),
+                              'error': 'internal server error'})
+
+    def answer(self, job, result):
+        """
+        Send a reply of the broker itself to the client of a request
+        """
+        self.frontend.send_multipart(
+            job.envelope + [b''] + protocol.encode_message(result,
+                                                           job.codec))
+
+    def kill_worker(self, pool, laf_worker, reason=None):
+        """
+        Kill a local worker, it is replaced once reaped. Its
+        replacement is counted under the reason given if any.
+        """
+        if laf_worker in pool.remote:
+            return
+        pid = worker_pid(laf_worker)
+        if pid not in pool.procs:
+            return
+        if reason is not None and pid not in pool.killed:
+            pool.killed.add(pid)
+            self.metrics.restarts.inc(pool=pool.name, reason=reason)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def reject(self, pool, job, status):
+        """
+        Send service unavailable to the client
+        """
         _LOG.info('SERVICE UNAVAILABLE')
-        message = {'status': 'Try again server busy'}
-        result = {'resp': message, 'code': http.client.SERVICE_UNAVAILABLE}
-        final_result = json.dumps(result).encode()
-        self.frontend.send_multipart([client_addr, b'', final_result])
+        pool.pending.stats[job.pclass].rejected += 1
+        self.metrics.rejected.inc(pool=pool.name)
+        message = {'status': status}
+        result = {'resp': message,
+                  'code': http.client.SERVICE_UNAVAILABLE,
+                  'retry_after': pool.retry_after()}
+        self.answer(job, result)
+
+    def report_stats(self):
+        """
+        Log the queue depth and wait time of every priority class
+        """
+        for pool in self.pools.values():
+            for pclass, stats in pool.pending.report().items():
+                if not (stats['depth'] or stats['dispatched'] or
+                        stats['rejected'] or stats['expired']):
+                    continue
+                _LOG.info('pool %s class %s: depth %d, dispatched %d, '
+                          'wait avg %.3fs max %.3fs, rejected %d, '
+                          'expired %d', pool.name, pclass,
+                          stats['depth'], stats['dispatched'],
+                          stats['wait_avg'], stats['wait_max'],
+                          stats['rejected'], stats['expired'])
+
+    def add_pool(self, name, pool_cfg, n_workers):
+        """
+        Create a worker pool from its configuration, the command line
+        sizes apply to the pools which do not set their own
+        """
+        size = int(pool_cfg.get('workers', n_workers))
+        min_workers = pool_cfg.get('min_workers', self.min_workers)
+        max_workers = pool_cfg.get('max_workers', self.max_workers)
+        if min_workers is None:
+            min_workers = size
+        if max_workers is None:
+            max_workers = max(size, int(min_workers))
+        pending = scheduler.PendingQueue(self.priority_policy,
+                                         self.priority_weights)
+        pool = WorkerPool(name, pool_cfg['lones'], size,
+                          int(min_workers), int(max_workers),
+                          int(pool_cfg.get('queue_size', self.queue_size)),
+                          pending,
+                          float(pool_cfg.get('reserved_share',
+                                             self.reserved_share)),
+                          self.pool_env(pool_cfg))
+        self.pools[name] = pool
+        for lone in pool.lones:
+            self.lone_pools[lone] = pool
+        return pool
+
+    def pool_env(self, pool_cfg):
+        """
+        Environment of the workers of a pool
+        """
+        return {
+            'LAF_WORKER_THREADS': str(int(pool_cfg.get(
+                'threads', self.worker_threads))),
+            'LAF_LONGRUNNING_PROCS': str(int(pool_cfg.get(
+                'longrunning_procs', self.longrunning_procs))),
+            'LAF_LONGRUNNING_BACKLOG': str(int(pool_cfg.get(
+                'longrunning_backlog', self.longrunning_backlog))),
+            'LAF_MAX_REQUESTS': str(int(pool_cfg.get(
+                'max_requests', self.max_requests))),
+            'LAF_MAX_REQUESTS_JITTER': str(int(pool_cfg.get(
+                'max_requests_jitter', self.max_requests_jitter))),
+            'LAF_MAX_AGE': str(float(pool_cfg.get(
+                'max_age', self.max_worker_age))),
+            'LAF_MAX_RSS': str(int(pool_cfg.get(
+                'max_rss', self.max_worker_rss)))
+        }
+
+    def start_workers(self, n_workers, pools_cfg=None):
+        """
+        Start the initial workers of every pool, enable autoscaling
+        when a pool may grow or shrink
+        """
+        if pools_cfg is None:
+            pools_cfg = {config.DEFAULT_POOL: {'lones': []}}
+        if self.preload:
+            set_subreaper()
+            self.start_zygote()
+        for name, pool_cfg in pools_cfg.items():
+            pool = self.add_pool(name, pool_cfg, n_workers)
+            size = min(max(pool.size, pool.min_workers), pool.max_workers)
+            _LOG.info('starting %d workers in pool %s for lones %s',
+                      size, name, ', '.join(pool.lones) or '-')
+            for _ in range(size):
+                self.spawn_worker(pool)
+            if pool.elastic:
+                _LOG.info('autoscaling pool %s between %d and %d workers',
+                          name, pool.min_workers, pool.max_workers)
+        if any(pool.elastic for pool in self.pools.values()):
+            self.scaler = PeriodicCallback(self.autoscale, SCALE_INTERVAL)
+            self.scaler.start()
+
+    def autoscale(self):
+        """
+        Resize every elastic pool
+        """
+        for pool in self.pools.values():
+            if pool.elastic:
+                self.scale_pool(pool)
+
+    def scale_pool(self, pool):
+        """
+        Grow a pool while requests queue up or most workers are
+        busy, shrink it by draining idle workers when it is quiet
+        """
+        total = pool.worker_count()
+        busy_ratio = pool.running / max(pool.capacity(), 1)
+        if pool.pending or busy_ratio >= SCALE_UP_RATIO:
+            pool.hot += 1
+            pool.cold = 0
+        elif busy_ratio <= SCALE_DOWN_RATIO:
+            pool.cold += 1
+            pool.hot = 0
+        else:
+            pool.hot = 0
+            pool.cold = 0
+        if pool.hot >= SCALE_UP_TICKS and total < pool.max_workers:
+            step = min(pool.max_workers - total, max(1, total // 4))
+            _LOG.info('scaling up pool %s from %d to %d workers, '
+                      'queue depth %d, running requests %d',
+                      pool.name, total, total + step, len(pool.pending),
+                      pool.running)
+            for _ in range(step):
+                self.spawn_worker(pool)
+            pool.hot = 0
+        elif (pool.cold >= SCALE_DOWN_TICKS and
+              total > pool.min_workers and pool.idle):
+            laf_worker = pool.idle.popleft()
+            _LOG.info('scaling down pool %s from %d to %d workers, '
+                      'draining %r', pool.name, total, total - 1,
+                      laf_worker)
+            self.drain_worker(pool, laf_worker)
+            pool.cold = 0
+
+    def retire_worker(self, pool, laf_worker, reason='recycled'):
+        """
+        Replace a worker which reached a recycling limit. It keeps
+        serving until its replacement is ready so that recycling
+        never reduces the capacity of the pool.
+        """
+        if (laf_worker in pool.retiring or laf_worker in pool.draining or
+                self.stopping):
+            return
+        _LOG.info('%s worker %r of pool %s', reason, laf_worker, pool.name)
+        self.metrics.restarts.inc(pool=pool.name, reason=reason)
+        if laf_worker in pool.remote:
+            # Its supervisor starts a new one once it exited
+            self.drain_worker(pool, laf_worker)
+            return
+        pool.retiring.add(laf_worker)
+        self.spawn_worker(pool)
+
+    def reload(self):
+        """
+        Rolling reload: replace every local worker by a new one
+        running the current code of the lones. The old workers
+        serve until their replacements are ready.
+        """
+        if self.stopping:
+            return 'Broker is stopping'
+        if self.preload:
+            # The new workers are forked once the new zygote
+            # preloaded the lones, the old one exits. A zygote
+            # which failed before gets another chance.
+            _LOG.info('reloading, starting a new zygote')
+            self.reloading = True
+            self.reload_error = None
+            self.zygote_failures = 0
+            forks = self.stop_zygote() if self.zygote is not None else []
+            self.start_zygote()
+            for pool in forks:
+                self.spawn_worker(pool)
+            return 'ok'
+        self.reload_error = None
+        self.retire_all()
+        return 'ok'
+
+    def status(self):
+        """
+        State of the broker: ok, stopping, reloading or why the last
+        reload failed
+        """
+        if self.stopping:
+            return 'stopping'
+        if self.reloading:
+            return 'reloading'
+        return self.reload_error or 'ok'
+
+    def retire_all(self):
+        """
+        Replace the local workers running when a reload was asked
+        """
+        self.reloading = False
+        _LOG.info('reloading the workers')
+        for pool in self.pools.values():
+            for pid in list(pool.procs):
+                laf_worker = u'Worker-{0}'.format(pid).encode()
+                self.retire_worker(pool, laf_worker, 'reloaded')
+
+    def shutdown(self):
+        """
+        Stop taking requests, serve the queued and running ones,
+        then stop the workers and exit. Asked twice, the workers
+        are killed right away.
+        """
+        if self.stopping:
+            _LOG.warning('stopping now')
+            self.stop_deadline = time.time()
+            self.check_stopped()
+            return
+        _LOG.info('stopping once the requests are served, at most %ss',
+                  self.drain_timeout)
+        self.stopping = True
+        self.stop_deadline = time.time() + self.drain_timeout
+        if self.scaler is not None:
+            self.scaler.stop()
+        self.stopper = PeriodicCallback(self.check_stopped, SWEEP_INTERVAL)
+        self.stopper.start()
+        self.check_stopped()
+
+    def check_stopped(self):
+        """
+        Stop the workers of a stopping broker once the requests are
+        served, exit once they are gone
+        """
+        overdue = time.time() >= self.stop_deadline
+        serving = any(pool.pending or pool.running
+                      for pool in self.pools.values())
+        if serving and not overdue:
+            return
+        for pool in self.pools.values():
+            for job in pool.pending.pop_stale(math.inf):
+                self.reject(pool, job, 'Server shutting down')
+            laf_workers = [u'Worker-{0}'.format(pid).encode()
+                           for pid in pool.procs]
+            laf_workers.extend(pool.remote)
+            for laf_worker in laf_workers:
+                if laf_worker not in pool.draining:
+                    self.drain_worker(pool, laf_worker)
+                if overdue:
+                    self.kill_worker(pool, laf_worker)
+        if any(pool.procs or pool.forking for pool in self.pools.values()):
+            return
+        _LOG.info('workers stopped, broker exiting')
+        self.stopper.stop()
+        if self.zygote is not None:
+            self.stop_zygote()
+        IOLoop.current().stop()
+
+    def resize_pool(self, name, n_workers):
+        """
+        Start or stop workers until a pool has n_workers, the
+        autoscaling bounds are widened to include it
+        """
+        pool = self.pools.get(name)
+        if pool is None:
+            return 'Unknown pool {0}'.format(name)
+        if n_workers < 0:
+            return 'Invalid number of workers {0}'.format(n_workers)
+        pool.size = n_workers
+        pool.min_workers = min(pool.min_workers, n_workers)
+        pool.max_workers = max(pool.max_workers, n_workers)
+        total = pool.worker_count()
+        _LOG.info('resizing pool %s from %d to %d workers',
+                  name, total, n_workers)
+        for _ in range(n_workers - total):
+            self.spawn_worker(pool)
+        if total > n_workers:
+            # Idle workers first, only the local ones
+            stopping = set(pool.draining) | set(pool.retiring)
+            candidates = [laf_worker for laf_worker in pool.slots
+                          if laf_worker not in stopping and
+                          laf_worker not in pool.remote]
+            candidates.sort(key=lambda laf_worker: laf_worker in pool.busy)
+            for laf_worker in candidates[:total - n_workers]:
+                self.drain_worker(pool, laf_worker)
+        return 'ok'
+
+    def replace_worker(self, laf_worker):
+        """
+        Start a new worker in place of a worker, which
+        is stopped once it served its requests. Workers
+        of other hosts are only stopped.
+        """
+        pool = self.workers.get(laf_worker)
+        if pool is None:
+            return 'Unknown worker {0}'.format(laf_worker.decode())
+        if laf_worker in pool.draining:
+            return 'Worker {0} is already draining'.format(
+                laf_worker.decode())
+        _LOG.info('draining worker %r of pool %s', laf_worker, pool.name)
+        if laf_worker in pool.retiring:
+            # Its replacement is already starting
+            pool.retiring.discard(laf_worker)
+        elif laf_worker not in pool.remote:
+            self.metrics.restarts.inc(pool=pool.name, reason='drained')
+            self.spawn_worker(pool)
+        self.drain_worker(pool, laf_worker)
+        return 'ok'
+
+    def drain_host(self, host):
+        """
+        Stop the workers of a host once idle, and keep its
+        workers from joining again
+        """
+        self.drained_hosts.add(host)
+        count = 0
+        for pool in self.pools.values():
+            for laf_worker, worker_host_name in list(pool.remote.items()):
+                if (worker_host_name == host and
+                        laf_worker not in pool.draining):
+                    self.drain_worker(pool, laf_worker)
+                    count += 1
+        _LOG.info('draining %d workers of host %s', count, host)
+        return 'ok'
+
+    def undrain_host(self, host):
+        """
+        Let the workers of a drained host join again
+        """
+        if host not in self.drained_hosts:
+            return 'Host {0} is not drained'.format(host)
+        self.drained_hosts.discard(host)
+        _LOG.info('workers of host %s may join again', host)
+        return 'ok'
+
+    def bind_remote(self, url, curve_cert=None, curve_clients=None,
+                    allow=None):
+        """
+        Let workers of other hosts connect on another endpoint. With
+        the secret CURVE certificate of the broker they must know its
+        public key and, given a directory of certificates, hold one of
+        them. Given allowed addresses they must connect from one.
+        """
+        socket = self.backend.socket
+        # The options only apply to the endpoints bound from now on
+        if curve_clients or allow:
+            self.authenticator = ThreadAuthenticator(socket.context)
+            self.authenticator.start()
+            if allow:
+                self.authenticator.allow(*allow)
+            if curve_cert:
+                self.authenticator.configure_curve(
+                    domain=REMOTE_DOMAIN,
+                    location=curve_clients or zmq.auth.CURVE_ALLOW_ANY)
+            socket.zap_domain = REMOTE_DOMAIN.encode()
+        if curve_cert:
+            (public, secret) = zmq.auth.load_certificate(curve_cert)
+            if secret is None:
+                raise ValueError('{0} holds no secret key'.format(
+                    curve_cert))
+            socket.curve_publickey = public
+            socket.curve_secretkey = secret
+            socket.curve_server = True
+        elif not allow and not is_loopback(url):
+            _LOG.warning('any host reaching %s may join as a worker and '
+                         'read the requests', url)
+        socket.bind(url)
+        _LOG.info('remote workers may connect on %s', url)
+
+    def metrics_text(self):
+        """
+        Metrics of the broker in the Prometheus text format
+        """
+        return self.metrics.collect(self.pools.values(), self.cache)
+
+    def drain_worker(self, pool, laf_worker):
+        """
+        Stop dispatching to a worker and stop it once it is idle
+        """
+        pool.draining.add(laf_worker)
+        pool.remove_idle(laf_worker)
+        if laf_worker not in pool.busy:
+            self.stop_worker(pool, laf_worker)
+
+    def stop_worker(self, pool, laf_worker):
+        """
+        Ask an idle worker to exit
+        """
+        pool.remove_idle(laf_worker)
+        _LOG.info('stopping worker %r', laf_worker)
+        self.backend.send_multipart([laf_worker, b'', protocol.STOP])
+        if laf_worker in pool.remote:
+            # It is not our child, its exit goes unnoticed
+            self.forget_remote(pool, laf_worker)
+
+    def spawn_worker(self, pool):
+        """
+        Start a new laf worker process in a pool, return its pid or
+        None when the zygote forks it and tells its pid later
+        """
+        worker_env = dict(self.worker_env, LAF_POOL=pool.name)
+        worker_env.update(pool.env)
+        if self.zygote is not None and self.fork_worker(pool, worker_env):
+            return None
+        proc = subprocess.Popen([self.worker_bin, self.basedir],
+                                env=worker_env,
+                                shell=False)
+        self.add_worker(pool, proc.pid, proc)
+        return proc.pid
+
+    def add_worker(self, pool, pid, proc=None):
+        """
+        Track a new local worker, proc is None for
+        a worker forked by the zygote
+        """
+        pool.procs[pid] = proc
+        pool.spawned[pid] = time.time()
+        laf_worker = u'Worker-{0}'.format(pid).encode()
+        self.workers[laf_worker] = pool
+        self.starting[laf_worker] = time.time()
+        _LOG.info('started worker with pid %d in pool %s',
+                  pid, pool.name)
+
+    def start_zygote(self):
+        """
+        Start the zygote which preloads the lones and forks the workers
+        """
+        self.zygote = subprocess.Popen(
+            [self.worker_bin, self.basedir],
+            env=dict(self.worker_env, LAF_ZYGOTE='1'),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            shell=False)
+        self.zygote_pid = self.zygote.pid
+        self.zygote_buffer = b''
+        self.zygote_ready = False
+        self.zygote_started = time.time()
+        IOLoop.current().add_handler(self.zygote.stdout.fileno(),
+                                     self.handle_zygote, IOLoop.READ)
+        _LOG.info('started zygote with pid %d', self.zygote.pid)
+
+    def stop_zygote(self):
+        """
+        Forget about the zygote, workers are started from scratch
+        until a new one is started. Return the pools of the workers
+        it did not fork yet.
+        """
+        IOLoop.current().remove_handler(self.zygote.stdout.fileno())
+        self.zygote.stdin.close()
+        self.zygote.stdout.close()
+        self.zygote = None
+        forks = list(self.forks)
+        self.forks.clear()
+        for pool in forks:
+            pool.forking -= 1
+        return forks
+
+    def fork_worker(self, pool, worker_env):
+        """
+        Ask the zygote to fork a worker, False if the zygote is gone.
+        The zygote answers once it forked the worker, the first
+        answer waits for it to preload the lones.
+        """
+        command = {'cmd': 'spawn', 'env': worker_env}
+        try:
+            self.zygote.stdin.write(jsoncodec.FAST.dumpb(command) + b'\n')
+            self.zygote.stdin.flush()
+        except OSError:
+            _LOG.error('zygote is gone, starting worker from scratch')
+            return False
+        self.forks.append(pool)
+        pool.forking += 1
+        return True
+
+    def read_zygote(self):
+        """
+        Read the next events of the zygote, None once it is gone
+        """
+        data = os.read(self.zygote.stdout.fileno(), 65536)
+        if not data:
+            return None
+        self.zygote_buffer += data
+        events = list()
+        while b'\n' in self.zygote_buffer:
+            line, self.zygote_buffer = self.zygote_buffer.split(b'\n', 1)
+            events.append(jsoncodec.FAST.loads(line))
+        return events
+
+    def handle_zygote(self, fd, _):
+        """
+        Events of the zygote
+        """
+        _LOG.debug('zygote event on fd %d', fd)
+        events = self.read_zygote()
+        if events is None:
+            # Replaced once reaped
+            _LOG.error('lost the zygote')
+            for pool in self.stop_zygote():
+                self.spawn_worker(pool)
+            return
+        for event in events:
+            self.zygote_event(event)
+
+    def zygote_event(self, event):
+        """
+        Handle an event of the zygote
+        """
+        if event['event'] == 'spawned':
+            # Forks are answered in the order they were asked
+            pool = self.forks.popleft()
+            pool.forking -= 1
+            self.add_worker(pool, event['pid'])
+        elif event['event'] == 'exited':
+            self.worker_exited(event['pid'])
+        elif event['event'] == 'ready':
+            _LOG.info('zygote preloaded the lones')
+            self.zygote_ready = True
+            self.zygote_failures = 0
+            if self.reloading:
+                self.retire_all()
+        else:
+            _LOG.error('unexpected zygote event %r', event)
+
+    def zygote_died(self):
+        """
+        Start a new zygote in place of one which died, later and later
+        while they die before preloading the lones. After
+        ZYGOTE_MAX_FAILURES of them the workers are started from scratch.
+        """
+        if self.zygote is not None:
+            for pool in self.stop_zygote():
+                self.spawn_worker(pool)
+        if self.stopping:
+            return
+        if self.zygote_ready:
+            # The workers it forked keep running, the broker
+            # reaps them as their subreaper
+            _LOG.error('zygote %d died, starting a new one', self.zygote_pid)
+            self.start_zygote()
+            return
+        if self.reloading:
+            # The running workers are kept, the next zygote only
+            # forks the workers started from now on
+            self.reloading = False
+            self.reload_error = ('Reload failed: zygote {0} died before '
+                                 'preloading the lones'.format(
+                                     self.zygote_pid))
+            _LOG.error('reload failed, keeping the running workers')
+        self.zygote_failures += 1
+        if self.zygote_failures >= ZYGOTE_MAX_FAILURES:
+            _LOG.error('zygote failed to preload the lones %d times, '
+                       'starting the workers from scratch',
+                       self.zygote_failures)
+            return
+        delay = min(RESPAWN_DELAY * 2 ** (self.zygote_failures - 1),
+                    RESPAWN_DELAY_MAX)
+        _LOG.error('zygote %d failed to preload the lones, starting a new '
+                   'one in %.0fs', self.zygote_pid, delay)
+        self.zygote_pid = None
+        IOLoop.current().call_later(delay, self.restart_zygote)
+
+    def restart_zygote(self):
+        """
+        Start a zygote again after it failed
+        """
+        if self.zygote is None and not self.stopping:
+            self.start_zygote()
+
+    def reap_workers(self):
+        """
+        Collect the dead laf workers and replace them
+        """
+        while True:
+            try:
+                (pid, _) = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            _LOG.debug('dead process pid is %r', pid)
+            if pid == self.zygote_pid:
+                self.zygote_died()
+                continue
+            self.worker_exited(pid)
+
+    def worker_exited(self, pid):
+        """
+        Forget about a dead worker and replace it
+        unless it was being stopped
+        """
+        laf_worker = u'Worker-{0}'.format(pid).encode()
+        pool = self.workers.pop(laf_worker, None)
+        if pool is None:
+            return
+        self.last_seen.pop(laf_worker, None)
+        self.starting.pop(laf_worker, None)
+        pool.procs.pop(pid, None)
+        started = pool.spawned.pop(pid, None)
+        killed = pid in pool.killed
+        pool.killed.discard(pid)
+        self.remove_worker(pool, laf_worker)
+        if laf_worker in pool.draining:
+            pool.draining.discard(laf_worker)
+            _LOG.info('worker %r stopped', laf_worker)
+        elif laf_worker in pool.retiring:
+            # Its replacement is already starting
+            pool.retiring.discard(laf_worker)
+            _LOG.info('retiring worker %r died', laf_worker)
+        elif not self.stopping:
+            self.respawn(pool, started, killed)
+
+    def respawn(self, pool, started, killed=False):
+        """
+        Replace a worker which exited on its own, later and later
+        while the workers of its pool die young, e.g. when a lone
+        fails to import. The restart of a worker we killed was
+        counted already.
+        """
+        if started is None or time.time() - started >= STABLE_UPTIME:
+            pool.respawn_delay = 0.0
+            if not killed:
+                self.metrics.restarts.inc(pool=pool.name, reason='exited')
+            self.spawn_worker(pool)
+            return
+        pool.respawn_delay = min(max(pool.respawn_delay * 2, RESPAWN_DELAY),
+                                 RESPAWN_DELAY_MAX)
+        if not killed:
+            self.metrics.restarts.inc(pool=pool.name, reason='crashloop')
+        _LOG.error('worker of pool %s died after %.1fs, replacing it '
+                   'in %.0fs', pool.name, time.time() - started,
+                   pool.respawn_delay)
+        pool.respawns += 1
+        IOLoop.current().call_later(pool.respawn_delay,
+                                    self.spawn_delayed, pool)
+
+    def spawn_delayed(self, pool):
+        """
+        Start a worker in place of one which died young
+        """
+        pool.respawns -= 1
+        if not self.stopping:
+            self.spawn_worker(pool)
+
+    def remove_worker(self, pool, laf_worker):
+        """
+        Forget about a worker, failing the requests
+        it was serving if any
+        """
+        for job in pool.forget(laf_worker):
+            self.abandon(job)
+        _LOG.debug('idle workers of %r are %r, busy workers are %r',
+                   pool, pool.idle, pool.busy)
+
+
+def worker_pid(laf_worker):
+    """
+    Process id of a worker from its identity
+    """
+    return int(laf_worker.decode().rsplit('-', 1)[1])
+
+
+def client_address(envelope):
+    """
+    Address of a client request from its routing frames, unique
+    among the requests in flight
+    """
+    if len(envelope) == 1:
+        return envelope[0]
+    return b''.join(bytes((len(frame),)) + frame for frame in envelope)
+
+
+def worker_host(laf_worker):
+    """
+    Host of a worker of another host from its identity,
+    None for a local worker
+    """
+    name = laf_worker[len(WORKER_PREFIX):].decode()
+    if '-' not in name:
+        return None
+    return name.rsplit('-', 1)[0]
+
+
+def parse_hosts(spec):
+    """
+    Parse addresses given as host,host
+    """
+    return [host.strip() for host in spec.split(',') if host.strip()]
+
+
+def is_loopback(url):
+    """
+    Whether only the processes of this host reach an endpoint
+    """
+    if not url.startswith('tcp://'):
+        return True
+    return url[len('tcp://'):].rsplit(':', 1)[0] in LOOPBACK_HOSTS
+
+
+def set_subreaper():
+    """
+    Become the parent of the workers whose zygote died so that
+    their exit is still noticed, only supported on linux
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) != 0:
+            raise OSError(ctypes.get_errno(), 'prctl failed')
+    except (AttributeError, OSError) as err:
+        _LOG.warning('can not become subreaper of the workers: %s', err)
 
 
 def signal_handler(signum, _):
     """
     When a laf worker dies, it
     has to be removed from worker list.
-    Spawn a new worker process
+    Spawn a new worker process.
+    SIGHUP reloads the workers, SIGTERM stops the broker
+    once the requests are served.
     """
+    # Do not touch the queue from within the signal handler,
+    # let the event loop do the work
     if signum == signal.SIGCHLD:
-        pwait = os.waitpid(-1, os.WNOHANG)
-        _LOG.debug('dead process pid is %r', pwait[0])
-        queue = LRUQueue()
-        workername = 'Worker-{0}'.format(pwait[0])
-        client_addr = queue.workers[workername.encode()]
-        if client_addr is not None:
-            message = {'status': 'internal server error'}
-            result = {'resp': message,
-                      'code': http.client.INTERNAL_SERVER_ERROR}
-            final_result = json.dumps(result).encode()
-            queue.frontend.send_multipart([client_addr, b'', final_result])
-        queue.workers.pop(workername.encode())
-        _LOG.debug('signal handler worker list is %r',
-                   queue.workers)
-        worker_env = {
-            'WORKER_SOCKET': queue.backend_url,
-            'LAF_DEPLOYMENT': queue.deployment
-        }
-        if 'NOTIFICATION_SOCK' in os.environ:
-            worker_env['NOTIFICATION_SOCK'] = os.environ[
-                'NOTIFICATION_SOCK']
-        if 'JOURNAL_SOCK' in os.envrion:
-            worker_env['JOURNAL_SOCK'] = os.environ[
-                'JOURNAL_SOCK']
-            subprocess.Popen([queue.worker_bin, queue.basedir],
-                             env=queue.worker_env, shell=False)
+        IOLoop.current().add_callback_from_signal(LRUQueue().reap_workers)
+    elif signum == signal.SIGHUP:
+        IOLoop.current().add_callback_from_signal(LRUQueue().reload)
+    elif signum == signal.SIGTERM:
+        IOLoop.current().add_callback_from_signal(LRUQueue().shutdown)
 
 
 def main(basedir, n_workers, daemon_flag,
          client_socket, worker_socket,
          worker_bin, deployment, notify_socket,
-         journal_socket):
+         journal_socket, options=None):
     """main method"""
     # create queue with the sockets
     signal.signal(signal.SIGCHLD, signal_handler)
-    LRUQueue(worker_socket, client_socket,
-             basedir, daemon_flag, worker_bin,
-             deployment)
+    signal.signal(signal.SIGHUP, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    queue = LRUQueue(worker_socket, client_socket,
+                     basedir, daemon_flag, worker_bin,
+                     deployment, options)
     worker_env = {
         'WORKER_SOCKET': worker_socket,
-        'LAF_DEPLOYMENT': deployment
+        'LAF_DEPLOYMENT': deployment,
+        'LAF_HEARTBEAT_INTERVAL': str(queue.heartbeat_interval),
+        'LAF_HEARTBEAT_LIVENESS': str(queue.heartbeat_liveness)
     }
     if notify_socket:
         os.environ['NOTIFICATION_SOCK'] = notify_socket
@@ -165,10 +1634,23 @@ def main(basedir, n_workers, daemon_flag,
     if journal_socket:
         os.environ['JOURNAL_SOCK'] = journal_socket
         worker_env['JOURNAL_SOCK'] = journal_socket
-    for _ in range(int(n_workers)):
-        subprocess.Popen([worker_bin, basedir],
-                         env=worker_env,
-                         shell=False)
+    queue.worker_env = worker_env
+    svr_cfg = config.get_server_cfg(basedir)
+    queue.lone_classes = config.get_lone_priorities(svr_cfg)
+    cache_cfg = config.get_cache_cfg(svr_cfg)
+    if cache_cfg is not None:
+        queue.cache = cache.ResponseCache(cache_cfg['max_entries'],
+                                          cache_cfg['max_size'])
+    queue.start_workers(int(n_workers), config.get_worker_pools(svr_cfg))
+    if options and options.get('remote_socket'):
+        queue.bind_remote(options['remote_socket'],
+                          options.get('remote_curve_cert'),
+                          options.get('remote_curve_clients'),
+                          options.get('remote_allow'))
+    if options and options.get('control_socket'):
+        control.ControlSocket(queue, options['control_socket'])
+    if options and options.get('metrics_port'):
+        control.serve_metrics(queue, int(options['metrics_port']))
 
     # start reactor
     IOLoop.instance().start()
@@ -0,0 +1,138 @@
+"""
+Replies of the workers to idempotent requests kept by the broker
+
+A GET opts in with the cache key the laf server computes from the
+request, the reply of the worker tells how long it may be served
+again. Requests changing a lone drop the replies of the same
+primary key and the listings of the lone.
+"""
+
+import collections
+import logging
+import time
+
+__all__ = ['WRITE_METHODS', 'DEFAULT_MAX_ENTRIES', 'DEFAULT_MAX_SIZE',
+           'ResponseCache']
+
+_LOG = logging.getLogger(__name__)
+
+# Methods of the requests invalidating the cached replies
+WRITE_METHODS = ('post', 'put', 'patch', 'delete')
+# Default number of replies kept
+DEFAULT_MAX_ENTRIES = 10000
+# Default size in MiB of the replies kept
+DEFAULT_MAX_SIZE = 64
+
+
+class CacheEntry():
+    """
+    A reply kept in the cache
+    """
+    __slots__ = ['frames', 'size', 'expires', 'tag']
+
+    def __init__(self, frames, expires, tag):
+        self.frames = frames
+        self.size = sum(len(frame) for frame in frames)
+        self.expires = expires
+        # Lone and primary key the reply is about
+        self.tag = tag
+
+
+class ResponseCache():
+    """
+    Least recently used replies, bounded in number and in size
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_size=DEFAULT_MAX_SIZE):
+        self.max_entries = max_entries
+        self.max_bytes = int(max_size * 1024 * 1024)
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        # Cache keys by lone and primary key
+        self.tags = dict()
+        # Bumped by every change of a lone, and for every lone by a
+        # clear, a reply to a request sent before is not kept
+        self.generations = collections.Counter()
+        self.clears = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def generation(self, lone):
+        """
+        Generation of the data of a lone
+        """
+        return (self.clears, self.generations[lone])
+
+    def get(self, key):
+        """
+        Frames of the reply kept for a key, None if there is none
+        or it expired
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.time():
+            self.drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry.frames
+
+    # R0913: Too many arguments
+    def put(self, key, lone, pk,  # pylint: disable=R0913
+            frames, ttl, generation):
+        """
+        Keep the frames of a reply for ttl seconds, unless the lone
+        changed since the request was received
+        """
+        if generation != self.generation(lone):
+            return False
+        entry = CacheEntry(frames, time.time() + ttl, (lone, pk))
+        if entry.size > self.max_bytes:
+            return False
+        self.drop(key)
+        self.entries[key] = entry
+        self.size += entry.size
+        self.tags.setdefault(entry.tag, set()).add(key)
+        while (len(self.entries) > self.max_entries or
+               self.size > self.max_bytes):
+            self.drop(next(iter(self.entries)))
+        return True
+
+    def drop(self, key):
+        """
+        Forget the reply kept for a key
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        keys = self.tags[entry.tag]
+        keys.discard(key)
+        if not keys:
+            del self.tags[entry.tag]
+
+    def invalidate(self, lone, pk=None):
+        """
+        Forget the replies about a primary key of a lone and its
+        listings, or about the whole lone without a primary key
+        """
+        self.generations[lone] += 1
+        if pk is None:
+            tags = [tag for tag in self.tags if tag[0] == lone]
+        else:
+            tags = [(lone, pk), (lone, None)]
+        for tag in tags:
+            for key in list(self.tags.get(tag, ())):
+                self.drop(key)
+
+    def clear(self):
+        """
+        Forget every reply
+        """
+        self.clears += 1
+        self.entries.clear()
+        self.tags.clear()
+        self.size = 0
+        _LOG.info('response cache cleared')
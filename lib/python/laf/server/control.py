@@ -0,0 +1,200 @@
+"""
+Metrics and control socket of the broker
+
+The control socket is a zmq REP socket taking one command per
+request, its words as frames:
+
+    metrics                  Prometheus text exposition of the metrics
+    resize <pool> <workers>  Start or stop workers of a pool
+    drain <worker>           Replace a worker and stop it once idle
+    drain_host <host>        Stop the workers of a host once idle
+    undrain_host <host>      Let the workers of a host join again
+    reload                   Replace every local worker, as on SIGHUP
+    status                   ok, stopping, reloading or why the last
+                             reload failed
+    clear_cache              Forget the replies of the response cache
+
+Commands other than metrics are answered with a json object whose
+status is ok or tells what went wrong.
+
+The metrics can also be scraped over HTTP at /metrics.
+"""
+
+import collections
+import logging
+# E0401: Unable to import 'tornado'
+from tornado import web  # pylint: disable=E0401
+# E0401: Unable to import 'zmq'
+import zmq  # pylint: disable=E0401
+# E0401: Unable to import 'zmq.eventloop.zmqstream'
+from zmq.eventloop.zmqstream import ZMQStream  # pylint: disable=E0401
+
+from laf.server import metrics
+from laf.server.app import jsoncodec
+
+__all__ = ['BrokerMetrics', 'ControlSocket', 'serve_metrics']
+
+_LOG = logging.getLogger(__name__)
+
+
+class BrokerMetrics():
+    """
+    Metrics of the broker
+    """
+
+    def __init__(self):
+        self.requests = metrics.Counter(
+            'laf_broker_requests_total',
+            'Requests received by lone', ('pool', 'lone'))
+        self.rejected = metrics.Counter(
+            'laf_broker_rejected_total',
+            'Requests rejected with 503 because the pool was busy',
+            ('pool',))
+        self.timeouts = metrics.Counter(
+            'laf_broker_timeouts_total',
+            'Requests the broker answered with 504 past their deadline',
+            ('lone',))
+        self.overruns = metrics.Counter(
+            'laf_broker_overruns_total',
+            'Requests still running past their deadline and the kill grace',
+            ('lone',))
+        self.restarts = metrics.Counter(
+            'laf_broker_worker_restarts_total',
+            'Workers replaced by reason', ('pool', 'reason'))
+        self.wait = metrics.Histogram(
+            'laf_broker_dispatch_wait_seconds',
+            'Time requests waited for a worker', ('pool',))
+        self.service = metrics.Histogram(
+            'laf_broker_service_seconds',
+            'Time workers took to serve requests', ('lone',))
+        self.workers = metrics.Gauge(
+            'laf_broker_workers',
+            'Workers by state', ('pool', 'state'))
+        self.slots = metrics.Gauge(
+            'laf_broker_slots',
+            'Request slots of the ready workers by state', ('pool', 'state'))
+        self.remote_workers = metrics.Gauge(
+            'laf_broker_remote_workers',
+            'Workers of other hosts', ('pool', 'host'))
+        self.queue_depth = metrics.Gauge(
+            'laf_broker_queue_depth',
+            'Requests waiting for a worker', ('pool', 'priority'))
+        self.cache = metrics.Counter(
+            'laf_broker_cache_requests_total',
+            'Cacheable requests by lone and result', ('lone', 'result'))
+        self.cache_entries = metrics.Gauge(
+            'laf_broker_cache_entries',
+            'Replies kept in the response cache')
+        self.cache_bytes = metrics.Gauge(
+            'laf_broker_cache_bytes',
+            'Size of the replies kept in the response cache')
+
+    def collect(self, pools, response_cache=None):
+        """
+        Text exposition of the metrics, the gauges
+        are read from the worker pools and the cache
+        """
+        for gauge in (self.workers, self.slots, self.remote_workers,
+                      self.queue_depth):
+            gauge.clear()
+        for pool in pools:
+            states = dict.fromkeys(
+                ('starting', 'idle', 'busy', 'draining'), 0)
+            for laf_worker in pool.slots:
+                if laf_worker in pool.draining:
+                    states['draining'] += 1
+                elif laf_worker in pool.busy:
+                    states['busy'] += 1
+                else:
+                    states['idle'] += 1
+            announced = len(pool.slots) - len(pool.remote)
+            states['starting'] = max(len(pool.procs) - announced, 0)
+            for state, count in states.items():
+                self.workers.set(count, pool=pool.name, state=state)
+            self.slots.set(len(pool.idle), pool=pool.name, state='idle')
+            self.slots.set(pool.running, pool=pool.name, state='busy')
+            hosts = collections.Counter(pool.remote.values())
+            for host, count in hosts.items():
+                self.remote_workers.set(count, pool=pool.name, host=host)
+            for pclass in pool.pending.queues:
+                self.queue_depth.set(pool.pending.depth(pclass),
+                                     pool=pool.name, priority=pclass)
+        collected = [
+            self.requests, self.rejected, self.timeouts, self.restarts,
+            self.wait, self.service, self.workers, self.slots,
+            self.remote_workers, self.queue_depth]
+        if response_cache is not None:
+            self.cache_entries.set(len(response_cache))
+            self.cache_bytes.set(response_cache.size)
+            collected.extend((self.cache, self.cache_entries,
+                              self.cache_bytes))
+        return metrics.render(collected)
+
+
+class ControlSocket():
+    """
+    Commands sent to the broker on its control socket
+    """
+
+    def __init__(self, queue, url):
+        self.queue = queue
+        socket = zmq.Context.instance().socket(zmq.REP)
+        socket.bind(url)
+        self.stream = ZMQStream(socket)
+        self.stream.on_recv(self.handle)
+        _LOG.info('broker control socket listening on %s', url)
+
+    def handle(self, msg):
+        """
+        Execute a command and send its answer
+        """
+        words = [frame.decode() for frame in msg]
+        _LOG.debug('control command %r', words)
+        if words == ['metrics']:
+            self.stream.send(self.queue.metrics_text().encode())
+            return
+        try:
+            status = self.execute(words)
+        # W0703: broad-except
+        except Exception as err:  # pylint: disable=W0703
+            _LOG.exception('control command %r failed', words)
+            status = str(err)
+        self.stream.send(jsoncodec.dumpb({'status': status}))
+
+    def execute(self, words):
+        """
+        Execute a command, return its status
+        """
+        if len(words) == 3 and words[0] == 'resize':
+            return self.queue.resize_pool(words[1], int(words[2]))
+        if len(words) == 2 and words[0] == 'drain':
+            return self.queue.replace_worker(words[1].encode())
+        if len(words) == 2 and words[0] == 'drain_host':
+            return self.queue.drain_host(words[1])
+        if len(words) == 2 and words[0] == 'undrain_host':
+            return self.queue.undrain_host(words[1])
+        if words == ['reload']:
+            return self.queue.reload()
+        if words == ['status']:
+            return self.queue.status()
+        if words == ['clear_cache']:
+            return self.queue.clear_cache()
+        return 'Unknown command {0}'.format(' '.join(words))
+
+
+def serve_metrics(queue, port, address=''):
+    """
+    Serve the metrics over HTTP at /metrics
+    """
+    class MetricsHandler(web.RequestHandler):
+        """
+        Prometheus scrape endpoint
+        """
+        # W0221: Parameters differ from overridden method
+        def get(self):  # pylint: disable=W0221
+            self.set_header('Content-Type', metrics.CONTENT_TYPE)
+            self.write(queue.metrics_text())
+
+    application = web.Application([('/metrics', MetricsHandler)])
+    application.listen(port, address)
+    _LOG.info('broker metrics served on port %d', port)
@@ -15,16 +15,22 @@ from flask_cors import CORS  # pylint: disable=E0401
 import flask_accept  # pylint: disable=E0401
 # E0401: Unable to import 'flask_swagger_ui'
 from flask_swagger_ui import get_swaggerui_blueprint  # pylint: disable=E0401
-from jsonschema import Draft4Validator, RefResolver
-import yaml
+from jsonschema import RefResolver
 from laf.server.app import config
 from laf.server.app.error import APIError
 from laf.server.app import generalhandler
+from laf.server.app import jsoncodec
+from laf.server.app import processing
 from laf.server.app import routecreator
+from laf.server.app import schemacompiler
 from laf.server.app import types
 from laf.server.app import error
 from laf.server.app import validator
 from laf.server.app import wsgiplugin
+from laf.server.app import yamlcodec
+from laf.server import metrics
+from laf.server import protocol
+from laf.server import scheduler
 # W0611: unused-import
 import laf.server.gunicornpatch  # pylint: disable=W0611
 _LOG = logging.getLogger(__name__)
@@ -32,7 +38,10 @@ LAFSVR_CONFIG_FILE = 'etc/laf-server.yml'
 APP = Flask(__name__)
 CORS(APP)
 MIME_REGEX = re.compile(r'^application/(.+)\+(yaml|json)$')
-DEFAULT_MIME_TYPES = ['application/yaml', 'application/json']
+DEFAULT_MIME_TYPES = ['application/yaml', 'application/json',
+                      'application/x-ndjson']
+# Listings of the latest version can be read one element per line
+NDJSON_MIME_TYPE = 'application/x-ndjson'
 
 
 def get_latest_schema(basedir, family, lone):
@@ -59,7 +68,10 @@ def lone_latest_version(basedir, family, lone):
 
 def setup_config(app, basedir, c_socket, deployment,
                  validation_socket,
-                 authorization_socket):
+                 authorization_socket,
+                 request_timeout=None,
+                 wire_codec=None,
+                 multiplexed=False):
     """
     Set laf client config
     """
@@ -80,20 +92,29 @@ def setup_config(app, basedir, c_socket, deployment,
             app.config['validation_socket'] = validation_socket
         app.config['c_socket'] = c_socket
         app.config['deployment'] = deployment
+        app.config['request_timeout'] = request_timeout
+        app.config['wire_codec'] = wire_codec or protocol.DEFAULT_CODEC
+        app.config['multiplexed'] = multiplexed
     return laf_config
 
 
 def setup_app(app, basedir,
               client_socket, deployment,
               validation_socket,
-              authorization_socket):
+              authorization_socket,
+              request_timeout=None,
+              wire_codec=None,
+              multiplexed=False):
     """
     set up laf client
     """
     return setup_config(app, basedir,
                         client_socket, deployment,
                         validation_socket,
-                        authorization_socket)
+                        authorization_socket,
+                        request_timeout,
+                        wire_codec,
+                        multiplexed)
 
 
 def create_register_blueprint(lone_bprint,
@@ -118,6 +139,16 @@ def create_register_blueprint(lone_bprint,
         _LOG.debug("path route is %s", path_route)
         operationid = action['operationId']
         _LOG.debug("operation id is %s", operationid)
+        timeout = action.get('x-laf-timeout')
+        priority = action.get('x-laf-priority')
+        if priority is not None and (
+                priority not in scheduler.PRIORITY_CLASSES):
+            raise Exception('Invalid x-laf-priority {0} for {1} {2}'.format(
+                priority, method, path))
+        cache = get_cache_policy(action, method, path)
+        validation = action.get('x-laf-response-validation')
+        if validation is not None:
+            validation = config.get_validation_policy(validation)
         kwargs = dict()
         kwargs = routecreator.generate_kwargs(action, resolver)
         _LOG.debug('kwargs after generation %r', kwargs)
@@ -128,10 +159,12 @@ def create_register_blueprint(lone_bprint,
         resp_obj = routecreator.generate_resp_obj(mime_types[0],
                                                   kwargs['responses'])
         _LOG.debug('resp obj is %r', resp_obj)
-        req_validator = Draft4Validator(schema_obj,
-                                        resolver=resolver)
-        resp_validator = Draft4Validator(resp_obj,
-                                         resolver=resolver)
+        # Compiled once, the routes validate with generated code
+        req_validator = schemacompiler.compile_validator(schema_obj,
+                                                         resolver)
+        resp_validator = validator.ResponseValidator(
+            schemacompiler.compile_validator(resp_obj, resolver),
+            lone, operationid, validation)
         para_types = dict()
         for para_name, para_value in kwargs['parameters']['path'].items():
             (_, ptype) = routecreator.get_parameter_types(
@@ -142,6 +175,17 @@ def create_register_blueprint(lone_bprint,
                 para_value, resolver)
             para_types[para_name] = ptype
         _LOG.debug("para types is %r", para_types)
+        lone_bprint[lone]['operations'].setdefault(version, dict())[
+            operationid] = {'method': method.lower(),
+                            'version': major_version,
+                            'req_validator': req_validator,
+                            'resp_validator': resp_validator,
+                            'timeout': timeout,
+                            'priority': priority,
+                            'cache': cache}
+        for mime_type in mime_types:
+            lone_bprint[lone]['mime_versions'][mime_type] = version
+        lone_bprint[lone]['latest_version'] = latest_version
         add_the_rule(lone_bprint,
                      path_route,
                      method,
@@ -153,7 +197,33 @@ def create_register_blueprint(lone_bprint,
                      mime_types=mime_types,
                      req_validator=req_validator,
                      resp_validator=resp_validator,
-                     para_types=para_types)
+                     para_types=para_types,
+                     timeout=timeout,
+                     priority=priority,
+                     cache=cache)
+
+
+def get_cache_policy(action, method, path):
+    """
+    How the broker caches the replies of an operation declaring
+    x-laf-cache, the seconds they are kept, and x-laf-cache-scope
+    """
+    if 'x-laf-cache' not in action and 'x-laf-cache-scope' not in action:
+        return None
+    ttl = action.get('x-laf-cache')
+    scope = action.get('x-laf-cache-scope', processing.USER_SCOPE)
+    if method.lower() != 'get':
+        raise Exception('Only GET may be cached, not {0} {1}'.format(
+            method, path))
+    if ttl is not None and (
+            isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or
+            ttl <= 0):
+        raise Exception('Invalid x-laf-cache {0} for {1} {2}'.format(
+            ttl, method, path))
+    if scope not in processing.CACHE_SCOPES:
+        raise Exception('Invalid x-laf-cache-scope {0} for {1} {2}'.format(
+            scope, method, path))
+    return {'ttl': ttl, 'scope': scope}
 
 
 def add_the_rule(lone_bprint,
@@ -167,7 +237,10 @@ def add_the_rule(lone_bprint,
                  mime_types=None,
                  req_validator=None,
                  resp_validator=None,
-                 para_types=None):
+                 para_types=None,
+                 timeout=None,
+                 priority=None,
+                 cache=None):
     """
     Based on openapi schema add new url rule to blueprint
     """
@@ -184,7 +257,10 @@ def add_the_rule(lone_bprint,
                                            operationid),
             lone=lone,
             resp_validator=resp_validator,
-            version=major_version)
+            version=major_version,
+            timeout=timeout,
+            priority=priority,
+            cache=cache)
     key = '{0}##{1}'.format(path_route, method.lower())
     if key in lone_bprint[lone] and lone_bprint[lone][key]:
         _LOG.info(
@@ -194,11 +270,11 @@ def add_the_rule(lone_bprint,
         acceptor = lone_bprint[lone][key]
         acceptor.support(*mime_types)(handler_view_func)
         if version == latest_version and method.lower() == 'get':
-            acceptor.support('*/*')(handler_view_func)
+            acceptor.support('*/*', NDJSON_MIME_TYPE)(handler_view_func)
     else:
         acceptor = flask_accept.accept(*mime_types)(handler_view_func)
         if version == latest_version and method.lower() == 'get':
-            acceptor.support('*/*')(handler_view_func)
+            acceptor.support('*/*', NDJSON_MIME_TYPE)(handler_view_func)
         lone_bprint[lone][key] = acceptor
         _LOG.info(
             "Add accept type %r for new route path:%s and method %s",
@@ -212,6 +288,29 @@ def add_the_rule(lone_bprint,
                                 view_func=acceptor)
 
 
+def add_batch_rule(lone_bprint, lone):
+    """
+    Add the route of the batch requests of a lone
+    """
+    lone_routes = lone_bprint[lone]
+
+    def batch_view_func():
+        """
+        batch view function, the operations are the ones
+        of the version asked for by the accept header
+        """
+        version = lone_routes['mime_versions'].get(
+            g.best_accept, lone_routes['latest_version'])
+        return generalhandler.batch_handler(
+            lone=lone,
+            operations=lone_routes['operations'].get(version, dict()))
+    lone_routes['blueprint'].add_url_rule('/{0}/_batch'.format(lone),
+                                          strict_slashes=False,
+                                          methods=['POST'],
+                                          endpoint='_batch',
+                                          view_func=batch_view_func)
+
+
 def get_mime_types(responses):
     """
     List of allowed mime types
@@ -294,7 +393,10 @@ def create_app(basedir, client_socket,
                auth_type,
                auth_data,
                validation_socket,
-               authorization_socket):
+               authorization_socket,
+               request_timeout=None,
+               wire_codec=None,
+               multiplexed=False):
     """
     creating a flask app
     """
@@ -302,13 +404,14 @@ def create_app(basedir, client_socket,
     authentication_data = dict()
     if auth_data:
         with open(auth_data) as stream:
-            authentication_data = yaml.load(stream)
+            authentication_data = yamlcodec.load(stream)
     APP.wsgi_app = authentication_plugin.make_middleware(
         APP.wsgi_app, **authentication_data)
 
     lafcfg = setup_app(APP, basedir,
                        client_socket, deployment,
-                       validation_socket, authorization_socket)
+                       validation_socket, authorization_socket,
+                       request_timeout, wire_codec, multiplexed)
     openapi_dir = os.path.join(basedir, 'apischemas', 'openapi')
     lone_bprint = dict()
     for openapi_file in os.listdir(openapi_dir):
@@ -319,17 +422,29 @@ def create_app(basedir, client_socket,
             lone = openapi_file.split('.')[-4]
             if lone not in lone_bprint:
                 lone_bprint[lone] = {
-                    'blueprint': Blueprint(lone, __name__)
+                    'blueprint': Blueprint(lone, __name__),
+                    'operations': dict(),
+                    'mime_versions': dict(),
+                    'latest_version': None
                 }
             add_lone_path(apifile, lafcfg['family'], major_version,
                           lone_bprint, version, basedir, lone)
     for lonename, loneval in lone_bprint.items():
         if lone_bprint[lonename]['blueprint'] is not None:
+            add_batch_rule(lone_bprint, lonename)
             APP.register_blueprint(loneval['blueprint'])
     # register api doc paths
     srvconfigfile = os.path.join(basedir, LAFSVR_CONFIG_FILE)
     with open(srvconfigfile) as stream:
-        svr_cfg = yaml.load(stream)
+        svr_cfg = yamlcodec.load(stream)
+        batch_cfg = config.get_batch_cfg(svr_cfg)
+        APP.config['batch_max_size'] = batch_cfg['max_size']
+        APP.config['batch_parallelism'] = batch_cfg['parallelism']
+        APP.config['response_cache'] = (
+            config.get_cache_cfg(svr_cfg) is not None)
+        APP.config['response_validation'] = (
+            config.get_response_validation_cfg(svr_cfg))
+        types.TypesObj.use_json_codec(config.get_json_codec(svr_cfg))
         if 'lones' in svr_cfg:
             for lone in svr_cfg['lones']:
                 register_api_docs(lone,
@@ -344,10 +459,23 @@ def create_app(basedir, client_socket,
                              view_func=generalhandler.task_status_function)
     prefix_status = '/status'
     APP.register_blueprint(status_blue, url_prefix=prefix_status)
+    APP.add_url_rule('/_metrics',
+                     methods=['GET'],
+                     endpoint='metrics',
+                     view_func=metrics_function)
 
     return APP
 
 
+def metrics_function():
+    """
+    Metrics of this server process in the Prometheus text format
+    """
+    resp = make_response(validator.metrics_text())
+    resp.headers['Content-Type'] = metrics.CONTENT_TYPE
+    return resp
+
+
 def setup_mime(mime_type):
     """
     set up mime
@@ -367,7 +495,7 @@ def handle_api_error(err):
     if encoder:
         response = encoder.encode(resp)
     if isinstance(resp, dict):
-        response = json.dumps(resp)
+        response = jsoncodec.dumpb(resp)
     else:
         response = resp
     resp = make_response(response, err.status_code)
@@ -381,6 +509,9 @@ def before_request():  # pylint: disable=W0612, R0912
     """
     Check mime types
     """
+    if request.endpoint == 'metrics':
+        # Scraped in the Prometheus text format whatever is accepted
+        return
     headers = request.headers
     encoder = None
     _LOG.debug('accept header is %r', headers['Accept'])
@@ -0,0 +1,157 @@
+"""
+Metrics of the broker, exposed in the Prometheus text format
+"""
+
+import bisect
+import math
+
+__all__ = ['CONTENT_TYPE', 'DEFAULT_BUCKETS', 'Counter', 'Gauge',
+           'Histogram', 'render']
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds of the histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    """
+    Escape a label value
+    """
+    return (str(value).replace('\\', r'\\')
+            .replace('\n', r'\n').replace('"', r'\"'))
+
+
+def _format_value(value):
+    """
+    Format a sample value
+    """
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _sample(name, labels, value):
+    """
+    Line of a sample
+    """
+    if labels:
+        name += '{' + ','.join('{0}="{1}"'.format(label, _escape(val))
+                               for label, val in labels) + '}'
+    return '{0} {1}'.format(name, _format_value(value))
+
+
+class Metric():
+    """
+    A metric with one value per combination of its labels
+    """
+    kind = 'untyped'
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.values = dict()
+
+    def key(self, labels):
+        """
+        Values of the labels of a sample
+        """
+        return tuple(str(labels[label]) for label in self.labelnames)
+
+    def clear(self):
+        """
+        Drop every sample
+        """
+        self.values.clear()
+
+    def samples(self):
+        """
+        (name, labels, value) of every sample
+        """
+        for key, value in sorted(self.values.items()):
+            yield (self.name, tuple(zip(self.labelnames, key)), value)
+
+    def lines(self):
+        """
+        Lines of the metric in the text format
+        """
+        yield '# HELP {0} {1}'.format(self.name, self.doc)
+        yield '# TYPE {0} {1}'.format(self.name, self.kind)
+        for name, labels, value in self.samples():
+            yield _sample(name, labels, value)
+
+
+class Counter(Metric):
+    """
+    A value which only goes up
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        Increase the counter of a label combination
+        """
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value which goes up and down
+    """
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        """
+        Set the value of a label combination
+        """
+        self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """
+        Count a value in the histogram of a label combination
+        """
+        key = self.key(labels)
+        state = self.values.get(key)
+        if state is None:
+            # Count of each bucket, the last one is +Inf, and the sum
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self):
+        for key, (counts, total) in sorted(self.values.items()):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       labels + (('le', _format_value(float(bound))),),
+                       cumulative)
+            yield (self.name + '_sum', labels, total)
+            yield (self.name + '_count', labels, cumulative)
+
+
+def render(metrics):
+    """
+    Text exposition of metrics
+    """
+    lines = list()
+    for metric in metrics:
+        lines.extend(metric.lines())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,194 @@
+"""
+Messages exchanged between the laf server,
+the broker and the laf workers
+
+A request or a reply is sent as two frames, a small header
+holding the routing fields and the payload. The broker only
+ever looks at the header, the payload goes through untouched.
+
+The header frame starts with the protocol version and the codec
+of the header, the header names the codec of the payload. msgpack
+is used when it is installed, json otherwise. A header which is a
+bare json object is a version 0 header with a json payload.
+
+A reply may be streamed in several parts, the header of every
+part but the last one has more set.
+"""
+
+import time
+
+try:
+    # E0401: Unable to import 'msgpack'
+    import msgpack  # pylint: disable=E0401
+except ImportError:
+    msgpack = None
+
+from laf.server.app import jsoncodec
+
+__all__ = ['READY', 'STOP', 'RETIRE', 'HEARTBEAT', 'HEARTBEAT_INTERVAL',
+           'HEARTBEAT_LIVENESS', 'VERSION', 'JSON', 'MSGPACK', 'CODECS',
+           'DEFAULT_CODEC', 'encode', 'decode', 'encode_header',
+           'decode_header', 'encode_message', 'decode_message',
+           'has_more', 'ready', 'parse_ready', 'time_left', 'TIMEOUT',
+           'CHANGED', 'changed', 'parse_changed']
+
+# Worker to broker, the worker waits for a request
+READY = b'READY'
+# Broker to worker, the worker has to exit
+STOP = b'STOP'
+# Worker to broker, the worker reached a limit and wants to be stopped
+RETIRE = b'RETIRE'
+# Both ways, the sender is alive
+HEARTBEAT = b'HEARTBEAT'
+# Worker to broker, a change answered before it was done completed
+CHANGED = b'CHANGED'
+
+# Default number of seconds between two heartbeats
+HEARTBEAT_INTERVAL = 1.0
+# Default number of heartbeats missed before the peer is declared dead
+HEARTBEAT_LIVENESS = 3
+
+# Reply of a request which ran out of time, whether the handler,
+# the worker, the broker or the server gave up on it
+TIMEOUT = 'Request timed out'
+
+VERSION = 1
+JSON = 'json'
+MSGPACK = 'msgpack'
+CODECS = (JSON, MSGPACK) if msgpack is not None else (JSON,)
+DEFAULT_CODEC = MSGPACK if msgpack is not None else JSON
+
+# Codec of the header, second byte of the header frame
+_CODEC_IDS = {JSON: b'j', MSGPACK: b'm'}
+_ID_CODECS = {ord(codec_id): codec for codec, codec_id in _CODEC_IDS.items()}
+
+
+def _buffer(frame):
+    """
+    Contents of a frame without copying it, frames received
+    with copy=False are zmq.Frame objects
+    """
+    if isinstance(frame, (bytes, bytearray, memoryview)):
+        return memoryview(frame)
+    return frame.buffer
+
+
+def encode(obj, codec=DEFAULT_CODEC):
+    """
+    Encode a payload
+    """
+    if codec == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+    return jsoncodec.FAST.dumpb(obj)
+
+
+def decode(frame, codec=DEFAULT_CODEC):
+    """
+    Decode a payload
+    """
+    data = _buffer(frame)
+    if codec == MSGPACK:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    return jsoncodec.FAST.loads(data)
+
+
+def encode_header(header, codec=DEFAULT_CODEC):
+    """
+    Encode the routing header of a message, the payload
+    is encoded with the same codec
+    """
+    header = dict(header, codec=codec)
+    return (bytes((VERSION,)) + _CODEC_IDS[codec] +
+            encode(header, codec))
+
+
+def decode_header(frame):
+    """
+    Decode the routing header of a message
+    """
+    data = _buffer(frame)
+    if len(data) and data[0] == ord('{'):
+        # Version 0, a json header and a json payload
+        header = jsoncodec.FAST.loads(data)
+        header.setdefault('codec', JSON)
+        return header
+    if len(data) < 2 or data[0] != VERSION or data[1] not in _ID_CODECS:
+        raise ValueError('Unsupported message header')
+    return decode(data[2:], _ID_CODECS[data[1]])
+
+
+def encode_message(obj, codec=DEFAULT_CODEC, **header):
+    """
+    Frames of a message, its header and its payload
+    """
+    return [encode_header(header, codec), encode(obj, codec)]
+
+
+def decode_message(frames):
+    """
+    Decode the payload of a message from its frames,
+    a single frame is a version 0 json message
+    """
+    if len(frames) == 1:
+        return decode(frames[0], JSON)
+    header = decode_header(frames[0])
+    return decode(frames[1], header['codec'])
+
+
+def has_more(frames):
+    """
+    Whether more parts of a streamed reply follow
+    the one of these frames
+    """
+    return len(frames) > 1 and bool(decode_header(frames[0]).get('more'))
+
+
+def ready(credits=1, done=None, pool=None):
+    """
+    Frames telling the broker a worker can take credits more
+    requests, done is the client whose request just completed.
+    A worker announcing itself names its pool.
+    """
+    frames = [b'', READY, str(credits).encode()]
+    if done is not None:
+        frames.append(done)
+    elif pool is not None:
+        frames.extend((b'', pool.encode()))
+    return frames
+
+
+def parse_ready(frames):
+    """
+    Credits, completed client and pool of the READY frames
+    received by the broker, which start with the worker address
+    """
+    credits = int(frames[3].bytes) if len(frames) > 3 else 1
+    done = frames[4].bytes if len(frames) > 4 else None
+    pool = frames[5].bytes.decode() if len(frames) > 5 else None
+    return (credits, done or None, pool)
+
+
+def changed(lone, pk=None):
+    """
+    Frames telling the broker a change of a lone, of the object
+    of primary key pk if given, completed
+    """
+    return [b'', CHANGED, encode_header({'lone': lone, 'pk': pk})]
+
+
+def parse_changed(frames):
+    """
+    Lone and primary key of the CHANGED frames received by
+    the broker, which start with the worker address
+    """
+    header = decode_header(frames[3])
+    return (header['lone'], header.get('pk'))
+
+
+def time_left(deadline):
+    """
+    Seconds left before the deadline, None if there is no deadline
+    """
+    if deadline is None:
+        return None
+    return deadline - time.time()
@@ -0,0 +1,218 @@
+"""
+Priority classes of the requests queued in the broker
+and the order in which they are handed to the workers
+"""
+
+import collections
+import logging
+
+__all__ = ['INTERACTIVE', 'WRITE', 'LONGRUNNING', 'PRIORITY_CLASSES',
+           'STRICT', 'WEIGHTED', 'POLICIES', 'DEFAULT_WEIGHTS',
+           'classify', 'parse_weights', 'PendingQueue']
+
+_LOG = logging.getLogger(__name__)
+
+# Cheap reads, somebody is usually waiting for them
+INTERACTIVE = 'interactive'
+# Requests changing data
+WRITE = 'write'
+# Heavyweight requests, e.g. @longrunning handlers
+LONGRUNNING = 'longrunning'
+# Highest priority first
+PRIORITY_CLASSES = (INTERACTIVE, WRITE, LONGRUNNING)
+
+# Always serve the highest priority class first
+STRICT = 'strict'
+# Share the workers between the classes according to their weight
+WEIGHTED = 'weighted'
+POLICIES = (STRICT, WEIGHTED)
+
+DEFAULT_WEIGHTS = {INTERACTIVE: 6, WRITE: 3, LONGRUNNING: 1}
+
+READ_METHODS = ('get', 'head', 'options')
+
+
+def classify(fields, lone_classes=None):
+    """
+    Priority class of a request from its header: the class set on
+    the operation, else the class of the lone, else the HTTP method
+    """
+    pclass = fields.get('priority')
+    if pclass in PRIORITY_CLASSES:
+        return pclass
+    if lone_classes:
+        pclass = lone_classes.get(fields.get('lone'))
+        if pclass in PRIORITY_CLASSES:
+            return pclass
+    if fields.get('method', 'get') in READ_METHODS:
+        return INTERACTIVE
+    return WRITE
+
+
+def parse_weights(spec):
+    """
+    Parse class weights given as class=weight,class=weight
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    if not spec:
+        return weights
+    for item in spec.split(','):
+        pclass, _, weight = item.partition('=')
+        pclass = pclass.strip()
+        if pclass not in PRIORITY_CLASSES:
+            raise ValueError('Unknown priority class {0}'.format(pclass))
+        weights[pclass] = int(weight)
+        if weights[pclass] < 1:
+            raise ValueError(
+                'Weight of {0} has to be positive'.format(pclass))
+    return weights
+
+
+class ClassStats():
+    """
+    Counters of a priority class
+    """
+    __slots__ = ['dispatched', 'wait_total', 'wait_max',
+                 'rejected', 'expired']
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Start counting again
+        """
+        self.dispatched = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.rejected = 0
+        self.expired = 0
+
+
+class PendingQueue():
+    """
+    Requests waiting for a worker, one FIFO per priority class.
+
+    Jobs need a pclass and an enqueued attribute.
+    """
+
+    def __init__(self, policy=STRICT, weights=None):
+        if policy not in POLICIES:
+            raise ValueError('Unknown priority policy {0}'.format(policy))
+        self.policy = policy
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.queues = collections.OrderedDict(
+            (pclass, collections.deque()) for pclass in PRIORITY_CLASSES)
+        self.stats = dict(
+            (pclass, ClassStats()) for pclass in PRIORITY_CLASSES)
+        # Smooth weighted round robin credit of each class
+        self.credit = dict((pclass, 0) for pclass in PRIORITY_CLASSES)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for queue in self.queues.values():
+            yield from queue
+
+    def depth(self, pclass):
+        """
+        Number of requests of a class waiting
+        """
+        return len(self.queues[pclass])
+
+    def append(self, job):
+        """
+        Queue a request behind the others of its class
+        """
+        self.queues[job.pclass].append(job)
+        self.size += 1
+
+    def appendleft(self, job):
+        """
+        Put back a request in front of its class
+        """
+        self.queues[job.pclass].appendleft(job)
+        self.size += 1
+
+    def popleft(self, admit=None):
+        """
+        Take the next request to dispatch, None if there is none.
+        admit tells whether a class may be dispatched right now.
+        """
+        ready = [pclass for pclass, queue in self.queues.items()
+                 if queue and (admit is None or admit(pclass))]
+        if not ready:
+            return None
+        if self.policy == STRICT:
+            pclass = ready[0]
+        else:
+            total = 0
+            for ready_class in ready:
+                self.credit[ready_class] += self.weights[ready_class]
+                total += self.weights[ready_class]
+            pclass = max(ready, key=lambda ready_class: (
+                self.credit[ready_class]))
+            self.credit[pclass] -= total
+        self.size -= 1
+        return self.queues[pclass].popleft()
+
+    def pop_stale(self, enqueued_before):
+        """
+        Remove and return the requests queued before a time
+        """
+        stale = list()
+        for queue in self.queues.values():
+            while queue and queue[0].enqueued < enqueued_before:
+                stale.append(queue.popleft())
+        self.size -= len(stale)
+        return stale
+
+    def pop_expired(self, now):
+        """
+        Remove and return the requests past their deadline
+        """
+        expired = list()
+        for pclass, queue in self.queues.items():
+            if not any(job.deadline is not None and job.deadline <= now
+                       for job in queue):
+                continue
+            kept = collections.deque()
+            for job in queue:
+                if job.deadline is not None and job.deadline <= now:
+                    expired.append(job)
+                else:
+                    kept.append(job)
+            self.queues[pclass] = kept
+        self.size -= len(expired)
+        return expired
+
+    def record_wait(self, job, now):
+        """
+        Account for the time a request waited before its dispatch
+        """
+        stats = self.stats[job.pclass]
+        wait = now - job.enqueued
+        stats.dispatched += 1
+        stats.wait_total += wait
+        stats.wait_max = max(stats.wait_max, wait)
+
+    def report(self):
+        """
+        Queue depth and wait time statistics of every class since
+        the previous report
+        """
+        report = dict()
+        for pclass, stats in self.stats.items():
+            report[pclass] = {
+                'depth': len(self.queues[pclass]),
+                'dispatched': stats.dispatched,
+                'wait_avg': (stats.wait_total / stats.dispatched
+                             if stats.dispatched else 0.0),
+                'wait_max': stats.wait_max,
+                'rejected': stats.rejected,
+                'expired': stats.expired
+            }
+            stats.reset()
+        return report
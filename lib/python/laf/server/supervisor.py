@@ -0,0 +1,148 @@
+"""
+Supervisor of the laf workers of a host attached to a remote broker
+
+The supervisor starts the workers pointed at the broker and restarts
+those which crash or ask to be recycled. Workers the broker stopped,
+e.g. when draining the host, are not restarted; the supervisor exits
+once all its workers are gone.
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import time
+
+from laf.server import broker
+from laf.server import worker
+
+__all__ = ['Supervisor']
+
+_LOG = logging.getLogger(__name__)
+
+# Seconds between two checks for dead workers while a restart
+# is delayed
+WAIT_INTERVAL = 0.1
+
+
+class Supervisor():
+    """
+    Keep the laf workers of a host running
+    """
+
+    def __init__(self, worker_bin, basedir, n_workers, env):
+        self.worker_bin = worker_bin
+        self.basedir = basedir
+        self.n_workers = n_workers
+        self.env = env
+        # Workers mapped to their process and start time
+        self.procs = dict()
+        self.stopping = False
+        # Delay before restarting a worker which died young, doubled
+        # while the workers keep dying young as the broker does, and
+        # when the delayed restarts are due
+        self.restart_delay = 0.0
+        self.restarts = list()
+
+    def start_worker(self):
+        """
+        Start a laf worker
+        """
+        proc = subprocess.Popen([self.worker_bin, self.basedir],
+                                env=dict(os.environ, **self.env),
+                                shell=False)
+        self.procs[proc.pid] = (proc, time.time())
+        _LOG.info('started worker with pid %d', proc.pid)
+
+    def stop(self, signum, _):
+        """
+        Stop the workers, then exit
+        """
+        _LOG.info('got signal %d, stopping the workers', signum)
+        self.stopping = True
+        for proc, _ in self.procs.values():
+            try:
+                proc.terminate()
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        """
+        Start the workers and restart them until they are stopped
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        _LOG.info('starting %d workers of pool %s for broker %s',
+                  self.n_workers, self.env.get('LAF_POOL'),
+                  self.env.get('WORKER_SOCKET'))
+        for _ in range(self.n_workers):
+            self.start_worker()
+        while self.procs or self.restarts:
+            self.start_due()
+            (pid, status) = self.wait()
+            if pid not in self.procs:
+                continue
+            (proc, started) = self.procs.pop(pid)
+            # Reaped already, the Popen object must not wait for it
+            proc.returncode = status
+            if self.stopping:
+                continue
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                _LOG.info('worker %d was stopped by the broker', pid)
+                continue
+            if (os.WIFEXITED(status) and
+                    os.WEXITSTATUS(status) == worker.EXIT_RECYCLED):
+                _LOG.info('worker %d was recycled, restarting it', pid)
+            else:
+                _LOG.error('worker %d died with status %d', pid, status)
+                if self.restart_later(started):
+                    continue
+            self.start_worker()
+        _LOG.info('all workers stopped, supervisor exiting')
+
+    def restart_later(self, started):
+        """
+        Delay the restart of a worker which died young, later and
+        later while the workers keep dying young, e.g. when a lone
+        fails to import. Return whether the restart is delayed.
+        """
+        lived = time.time() - started
+        if lived >= broker.STABLE_UPTIME:
+            self.restart_delay = 0.0
+            return False
+        self.restart_delay = min(
+            max(self.restart_delay * 2, broker.RESPAWN_DELAY),
+            broker.RESPAWN_DELAY_MAX)
+        _LOG.error('worker died after %.1fs, restarting it in %.0fs',
+                   lived, self.restart_delay)
+        self.restarts.append(time.time() + self.restart_delay)
+        return True
+
+    def start_due(self):
+        """
+        Start the workers whose delayed restart is due
+        """
+        if self.stopping:
+            self.restarts = list()
+            return
+        now = time.time()
+        for due in [due for due in self.restarts if due <= now]:
+            self.restarts.remove(due)
+            self.start_worker()
+
+    def wait(self):
+        """
+        Wait for a worker to exit, return its pid and status
+        or a pid of 0 once a delayed restart is due
+        """
+        if not self.restarts:
+            return os.wait()
+        while True:
+            try:
+                (pid, status) = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                (pid, status) = (0, 0)
+            left = min(self.restarts) - time.time()
+            if pid or left <= 0 or self.stopping:
+                return (pid, status)
+            time.sleep(min(WAIT_INTERVAL, left))
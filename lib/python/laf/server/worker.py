@@ -2,15 +2,26 @@
 LAF worker process
 """
 
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+import ctypes
 import http.client
-import json
 import logging
+import multiprocessing
 import os
+import random
+import resource
+import signal
 import sys
-import yaml
+import threading
+import time
 # E0401: Unable to import 'zmq'
 import zmq  # pylint: disable=E0401
+# E0401: Unable to import 'zmq.auth'
+import zmq.auth  # pylint: disable=E0401
 
+from laf.server import cache
+from laf.server import protocol
 from laf.server.app import config, loneinterface
 from laf.server.app import handler
 from laf.server.app import request
@@ -20,70 +31,604 @@ _LOG = logging.getLogger(__name__)
 LAF_LONE_PATH = 'bin'
 
 LONE_MODULE_PATH = 'lib/python'
-LAFSVR_CONFIG_FILE = 'etc/laf-server.yml'
+
+# Default number of processes running @longrunning handlers
+DEFAULT_LONGRUNNING_PROCS = 2
+# Default number of @longrunning requests waiting for a process
+DEFAULT_LONGRUNNING_BACKLOG = 10
+
+# Seconds to wait before connecting again to a silent broker,
+# doubled after each attempt up to the maximum. The wait is kept
+# within half the time the broker waits for our heartbeats, a
+# broker which stalled would otherwise kill us while we wait.
+RECONNECT_INTERVAL = 1.0
+RECONNECT_INTERVAL_MAX = 32.0
+
+# Elements sent per part of a streamed response
+STREAM_CHUNK = 1000
+
+# Exit status of a worker stopped after it asked to be recycled,
+# a supervisor starts a new one in its place
+EXIT_RECYCLED = 3
+
+# Worker inherited by the forked long running processes
+_WORKER = None
+
+# prctl option signalling the caller once its parent died
+PR_SET_PDEATHSIG = 1
+
+# Seconds between the checks of a long running process that its
+# worker is alive, where prctl is missing
+PARENT_POLL_INTERVAL = 1.0
+
+
+def _longrunning_init(parent):
+    """
+    Tie a long running process to its worker: it is killed once
+    the worker dies, however the worker died
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL, 0, 0, 0) != 0:
+            raise OSError(ctypes.get_errno(), 'prctl failed')
+    except (AttributeError, OSError):
+        threading.Thread(target=_watch_parent, args=(parent,),
+                         name='parent', daemon=True).start()
+    if os.getppid() != parent:
+        # The worker died before prctl took effect
+        os._exit(1)
+
+
+def _watch_parent(parent):
+    """
+    Exit once the worker is gone, we are then adopted by another process
+    """
+    while os.getppid() == parent:
+        time.sleep(PARENT_POLL_INTERVAL)
+    os._exit(1)
+
+
+def _run_longrunning(req_obj, auth_result, limit):
+    """
+    Run a @longrunning handler in a long running process,
+    the handler journals its own commit or abort
+    """
+    return _WORKER.run_whole(req_obj, auth_result, limit)
+
+
+def rss_bytes():
+    """
+    Resident memory of this process, its peak where /proc is missing
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # ru_maxrss is in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def curve_keys(server_cert, cert=None):
+    """
+    Public and secret CURVE keys of this worker and public key of
+    the broker, read from their certificates. Without a certificate
+    of its own the worker makes up its keys.
+    """
+    if not server_cert:
+        return None
+    (server_key, _) = zmq.auth.load_certificate(server_cert)
+    if cert:
+        (public, secret) = zmq.auth.load_certificate(cert)
+        if secret is None:
+            raise ValueError('{0} holds no secret key'.format(cert))
+    else:
+        (public, secret) = zmq.curve_keypair()
+    return (public, secret, server_key)
 
 
 class Worker():
     """ LAF Worker"""
-    def __init__(self, basedir):
+    def __init__(self, basedir, preloaded=None):
         self.deployment = os.environ['LAF_DEPLOYMENT']
         self.w_socket_url = os.environ['WORKER_SOCKET']
         self.basedir = basedir
+        # Config and lones loaded by the zygote before forking us
+        self.preloaded = preloaded
+        # Pool the broker started this worker for, all lones if unset
+        self.pool = os.environ.get('LAF_POOL')
+        # Host of a worker attached to a remote broker
+        self.host = os.environ.get('LAF_WORKER_HOST')
+        # CURVE keys of this worker and of a remote broker, None
+        # when the broker does not encrypt its endpoint
+        self.curve_keys = curve_keys(os.environ.get('LAF_CURVE_SERVERKEY'),
+                                     os.environ.get('LAF_CURVE_CERT'))
+        # Number of requests served at once, each in its own thread
+        self.threads = max(1, int(os.environ.get('LAF_WORKER_THREADS', 1)))
+        self.worker_config = None
+        # Processes running the @longrunning handlers, 0 runs them in
+        # the request slot and the slot stays taken until they return
+        self.longrunning_procs = int(os.environ.get(
+            'LAF_LONGRUNNING_PROCS', DEFAULT_LONGRUNNING_PROCS))
+        self.longrunning_backlog = int(os.environ.get(
+            'LAF_LONGRUNNING_BACKLOG', DEFAULT_LONGRUNNING_BACKLOG))
+        self.longrunning_pool = None
+        self.longrunning = set()
+        # The long running processes died, the worker is replaced
+        self.longrunning_broken = False
+        # Recycling limits, 0 disables a limit. The jitter spreads the
+        # restarts of the workers started together.
+        self.max_requests = int(os.environ.get('LAF_MAX_REQUESTS', 0))
+        if self.max_requests > 0:
+            self.max_requests += random.randint(
+                0, int(os.environ.get('LAF_MAX_REQUESTS_JITTER', 0)))
+        self.max_age = float(os.environ.get('LAF_MAX_AGE', 0))
+        # In megabytes
+        self.max_rss = int(os.environ.get('LAF_MAX_RSS', 0))
+        self.started = time.time()
+        self.requests = 0
+        self.retiring = False
+        # The recycling limits are checked at least once per heartbeat
+        self.heartbeat_interval = float(os.environ.get(
+            'LAF_HEARTBEAT_INTERVAL', protocol.HEARTBEAT_INTERVAL))
+        self.heartbeat_liveness = int(os.environ.get(
+            'LAF_HEARTBEAT_LIVENESS', protocol.HEARTBEAT_LIVENESS))
+        self.heartbeat_sent = None
+        self.broker_seen = None
+        self.reconnect_max = min(
+            RECONNECT_INTERVAL_MAX,
+            self.heartbeat_interval * self.heartbeat_liveness / 2)
+        self.reconnect_delay = min(RECONNECT_INTERVAL, self.reconnect_max)
+        # Whether the main thread is serving a request
+        self.serving = False
 
     def run(self):
         """
         Worker run logic
         """
         #  Wait for next request from client
-        _LOG.info('Worker starting with pid %s', os.getpid())
-        laf_worker_config = self.setup_config(self.basedir,
-                                              self.deployment)
+        _LOG.info('Worker starting with pid %s in pool %s, %d slots',
+                  os.getpid(), self.pool, self.threads)
+        self.worker_config = self.setup_config(self.basedir, self.deployment)
+        self.start_longrunning()
         context = zmq.Context()
-        socket = context.socket(zmq.DEALER)
-        socket.identity = (u"Worker-%d" % (os.getpid())).encode()
-        socket.connect(self.w_socket_url)
-        # Tell the broker we are ready for work
-        socket.send_multipart([b'', b'READY'])
-        long_running = False
-
         try:
             while True:
-                # pylint: disable=E0632
-                _, address, _, req = socket.recv_multipart()
-                _LOG.debug("%s: %s\n",
-                           socket.identity.decode(),
-                           req.decode())
-                # actual laf work
-                final_req = json.loads(req.decode())
-                req_obj = request.Request(**final_req['request'])
-                auth_result = final_req['auth']
-                lone_obj = laf_worker_config['lones'][req_obj.lone]
-                req_handler = handler.get_handler(req_obj, lone_obj)
-                if handler.is_async_request(req_handler, lone_obj.mode):
-                    long_running = True
-                    location = '/status/{0}'.format(req_obj.rqid)
-                    result = {'resp': location, 'code': http.client.ACCEPTED}
-                    final_result = json.dumps(result).encode()
-                    socket.send_multipart([b'', address, b'', final_result])
-                (resp, code) = handler.process_req(
-                    laf_worker_config['config'],
-                    lone_obj,
-                    req_obj,
-                    auth_result)
-                if not long_running:
-                    result = {'resp': resp, 'code': code}
-                    final_result = json.dumps(result).encode()
-                    socket.send_multipart([b'', address, b'', final_result])
-                long_running = False
-                socket.send_multipart([b'', b'READY'])
+                socket = self.connect(context)
+                if self.threads > 1:
+                    stopped = self.run_threaded(context, socket)
+                else:
+                    stopped = self.run_single(socket)
+                if stopped:
+                    break
+                socket.close(linger=0)
+                _LOG.error('Worker %s lost the broker, reconnecting in '
+                           '%.1fs', os.getpid(), self.reconnect_delay)
+                time.sleep(self.reconnect_delay)
+                self.reconnect_delay = min(self.reconnect_delay * 2,
+                                           self.reconnect_max)
         except zmq.ContextTerminated:
             # context terminated so quit silently
             sys.exit(1)
+        _LOG.info('Worker stopping with pid %s', os.getpid())
+        socket.close()
+        context.term()
+        if self.longrunning_pool is not None:
+            # Let the long running requests complete
+            self.longrunning_pool.shutdown(wait=True)
+        if self.retiring:
+            sys.exit(EXIT_RECYCLED)
+
+    def connect(self, context):
+        """
+        Connect to the broker and tell it how many requests we can take
+        """
+        socket = context.socket(zmq.DEALER)
+        if self.host:
+            socket.identity = (u"Worker-%s-%d" % (
+                self.host, os.getpid())).encode()
+        else:
+            socket.identity = (u"Worker-%d" % (os.getpid())).encode()
+        if self.curve_keys is not None:
+            (socket.curve_publickey, socket.curve_secretkey,
+             socket.curve_serverkey) = self.curve_keys
+        socket.connect(self.w_socket_url)
+        socket.send_multipart(protocol.ready(self.threads, pool=self.pool))
+        self.heartbeat_sent = self.broker_seen = time.time()
+        return socket
+
+    def heartbeat(self, socket, received):
+        """
+        Send our heartbeat when it is due and tell whether the broker
+        is alive, received is whether it just sent us something
+        """
+        now = time.time()
+        if received:
+            self.broker_seen = now
+            self.reconnect_delay = min(RECONNECT_INTERVAL,
+                                       self.reconnect_max)
+        if now - self.heartbeat_sent >= self.heartbeat_interval:
+            socket.send_multipart([b'', protocol.HEARTBEAT])
+            self.heartbeat_sent = now
+        return (now - self.broker_seen <=
+                self.heartbeat_interval * self.heartbeat_liveness)
+
+    def start_longrunning(self):
+        """
+        Start the processes running the @longrunning handlers. They
+        are forked before any other thread exists and inherit the
+        loaded lones. They are forked by the main thread, their
+        parent death signal fires when the worker exits.
+        """
+        global _WORKER  # pylint: disable=W0603
+        if self.longrunning_procs <= 0:
+            return
+        _WORKER = self
+        self.longrunning_pool = futures.ProcessPoolExecutor(
+            max_workers=self.longrunning_procs,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_longrunning_init, initargs=(os.getpid(),))
+        futures.wait([self.longrunning_pool.submit(os.getpid)
+                      for _ in range(self.longrunning_procs)])
+
+    def submit_longrunning(self, req_obj, auth_result, limit):
+        """
+        Hand a @longrunning request to the long running processes,
+        return its future or None if too many are waiting already
+        or the processes died
+        """
+        if self.longrunning_broken or len(self.longrunning) >= (
+                self.longrunning_procs + self.longrunning_backlog):
+            return None
+        try:
+            future = self.longrunning_pool.submit(
+                _run_longrunning, req_obj, auth_result, limit)
+        except BrokenProcessPool:
+            # Forking them again from this threaded process is unsafe,
+            # the broker starts a new worker instead
+            _LOG.error('long running processes died')
+            self.longrunning_broken = True
+            return None
+        self.longrunning.add(future)
+        future.add_done_callback(self.longrunning_done)
+        return future
+
+    def longrunning_done(self, future):
+        """
+        Forget about a completed @longrunning request
+        """
+        self.longrunning.discard(future)
+        if future.cancelled():
+            return
+        err = future.exception()
+        if err is not None:
+            _LOG.error('long running request failed: %r', err)
+        if isinstance(err, BrokenProcessPool):
+            self.longrunning_broken = True
+
+    @staticmethod
+    def changed(fields, send):
+        """
+        Tell the broker a @longrunning change completed, it drops
+        the replies it kept about the lone
+        """
+        try:
+            send(protocol.changed(fields['lone'], fields.get('pk')))
+        except zmq.ZMQError as err:
+            # We lost the broker meanwhile
+            _LOG.error('could not tell the broker of a change of %s: %s',
+                       fields['lone'], err)
+
+    def run_single(self, socket):
+        """
+        Serve one request at a time in the main thread, where the time
+        limits of the handlers apply. Return whether the broker stopped
+        us, False if it went silent.
+
+        While a request is served a thread sends the heartbeats, the
+        socket is handed over to it under a lock.
+        """
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def send(frames):
+            with lock:
+                socket.send_multipart(frames, copy=False)
+
+        def pulse():
+            # Stops beating when this process can not run python code
+            while not done.wait(self.heartbeat_interval):
+                with lock:
+                    if self.serving:
+                        socket.send_multipart([b'', protocol.HEARTBEAT])
+
+        pulser = threading.Thread(target=pulse, name='heartbeat',
+                                  daemon=True)
+        pulser.start()
+        try:
+            while True:
+                received = bool(socket.poll(self.heartbeat_interval * 1000))
+                if received:
+                    frames = socket.recv_multipart(copy=False)
+                    command = frames[1].bytes
+                    if command == protocol.STOP:
+                        return True
+                    if command != protocol.HEARTBEAT:
+                        self.requests += 1
+                        with lock:
+                            self.serving = True
+                        try:
+                            self.serve(frames, send)
+                        finally:
+                            with lock:
+                                self.serving = False
+                if not self.heartbeat(socket, received):
+                    return False
+                self.check_recycle(socket)
+        finally:
+            done.set()
+            pulser.join()
+
+    def run_threaded(self, context, socket):
+        """
+        Serve up to self.threads requests at once. zmq sockets are
+        not thread safe, the threads hand their replies to the main
+        thread which alone talks to the broker. Return whether the
+        broker stopped us, False if it went silent.
+        """
+        replies_url = 'inproc://replies'
+        replies = context.socket(zmq.PULL)
+        replies.bind(replies_url)
+        local = threading.local()
+        senders = list()
+        senders_lock = threading.Lock()
+
+        def send(frames):
+            sender = getattr(local, 'sender', None)
+            if sender is None:
+                sender = context.socket(zmq.PUSH)
+                sender.setsockopt(zmq.LINGER, 0)
+                sender.connect(replies_url)
+                local.sender = sender
+                with senders_lock:
+                    senders.append(sender)
+            sender.send_multipart(frames, copy=False)
+
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        poller.register(replies, zmq.POLLIN)
+        executor = futures.ThreadPoolExecutor(max_workers=self.threads)
+        stopped = False
+        try:
+            while True:
+                events = dict(poller.poll(self.heartbeat_interval * 1000))
+                if replies in events:
+                    socket.send_multipart(
+                        replies.recv_multipart(copy=False), copy=False)
+                if socket in events:
+                    frames = socket.recv_multipart(copy=False)
+                    command = frames[1].bytes
+                    if command == protocol.STOP:
+                        stopped = True
+                        break
+                    if command != protocol.HEARTBEAT:
+                        self.requests += 1
+                        executor.submit(self.serve, frames, send)
+                if not self.heartbeat(socket, socket in events):
+                    break
+                self.check_recycle(socket)
+        finally:
+            executor.shutdown(wait=True)
+            # Forward what the last requests sent
+            while replies.poll(0):
+                socket.send_multipart(
+                    replies.recv_multipart(copy=False), copy=False)
+            for sender in senders:
+                sender.close()
+            replies.close()
+        return stopped
+
+    def recycle_reason(self):
+        """
+        Why this worker should be replaced, None while it is
+        within its limits
+        """
+        if self.longrunning_broken:
+            return 'long running processes died'
+        if self.max_requests and self.requests >= self.max_requests:
+            return 'served {0} requests'.format(self.requests)
+        if self.max_age and time.time() - self.started >= self.max_age:
+            return 'older than {0}s'.format(self.max_age)
+        if self.max_rss:
+            rss = rss_bytes() // (1024 * 1024)
+            if rss >= self.max_rss:
+                return 'using {0}MB of memory'.format(rss)
+        return None
+
+    def check_recycle(self, socket):
+        """
+        Ask the broker to replace this worker once it reached one of
+        its limits, it keeps serving until the broker stops it
+        """
+        if self.retiring:
+            return
+        reason = self.recycle_reason()
+        if reason is None:
+            return
+        _LOG.info('Worker %s retiring, %s', os.getpid(), reason)
+        self.retiring = True
+        socket.send_multipart([b'', protocol.RETIRE])
+
+    def serve(self, frames, send):
+        """
+        Handle a request from the broker, send() its reply and
+        tell the broker the slot is free again
+        """
+        # pylint: disable=E0632
+        _, address, _, header, req = frames
+        address = address.bytes
+        _LOG.debug("request from %r\n", address)
+        try:
+            self.handle(address, header, req, send)
+        # W0703: broad-except
+        except Exception:  # pylint: disable=W0703
+            # Never lose the slot, the broker fails the request once
+            # the slot is free again
+            _LOG.exception('Error serving request from %r', address)
+        send(protocol.ready(done=address))
+
+    def handle(self, address, header, req, send):
+        """
+        actual laf work
+        """
+        laf_worker_config = self.worker_config
+        fields = protocol.decode_header(header)
+        # Reply in the codec of the request
+        codec = fields['codec']
+        final_req = protocol.decode(req, codec)
+        req_obj = request.Request(**final_req['request'])
+        auth_result = final_req['auth']
+        deadline = fields.get('deadline')
+        lone_obj = laf_worker_config['lones'].get(req_obj.lone)
+        req_handler = None
+        if lone_obj is not None:
+            req_handler = handler.get_handler(req_obj, lone_obj)
+        left = protocol.time_left(deadline)
+        if lone_obj is None:
+            # Routed to the wrong pool, do not die over it
+            _LOG.error('[%s]: Lone %s is not served by pool %s',
+                       req_obj.txid, req_obj.lone, self.pool)
+            (resp, code) = ({'status': 'internal server error'},
+                            http.client.INTERNAL_SERVER_ERROR)
+        elif left is not None and left <= 0:
+            # The broker already answered the client
+            _LOG.info('[%s]: Request expired before processing',
+                      req_obj.txid)
+            (resp, code) = (protocol.TIMEOUT, http.client.GATEWAY_TIMEOUT)
+        elif handler.is_async_request(req_handler, lone_obj.mode) and (
+                self.longrunning_pool is not None):
+            # The request itself is sent along, its rqid is the one
+            # the client polls the status of
+            future = self.submit_longrunning(
+                req_obj, auth_result, handler.get_time_limit(req_handler))
+            if future is None:
+                status = ('Long running processes unavailable'
+                          if self.longrunning_broken
+                          else 'Too many long running requests')
+                _LOG.error('[%s]: %s', req_obj.txid, status)
+                (resp, code) = ({'status': status},
+                                http.client.SERVICE_UNAVAILABLE)
+            else:
+                if fields.get('method') in cache.WRITE_METHODS:
+                    future.add_done_callback(
+                        lambda _: self.changed(fields, send))
+                location = '/status/{0}'.format(req_obj.rqid)
+                result = {'resp': location, 'code': http.client.ACCEPTED}
+                send([b'', address, b''] + protocol.encode_message(
+                    result, codec))
+                _LOG.info('[%s]: Long running request submitted',
+                          req_obj.txid)
+                return
+        elif handler.is_async_request(req_handler, lone_obj.mode):
+            location = '/status/{0}'.format(req_obj.rqid)
+            result = {'resp': location, 'code': http.client.ACCEPTED}
+            send([b'', address, b''] + protocol.encode_message(
+                result, codec))
+            # The client got its answer, only the handler's own
+            # time limit applies from now on
+            self.run_whole(req_obj, auth_result,
+                           handler.get_time_limit(req_handler))
+            return
+        else:
+            (resp, code) = handler.process_req(
+                laf_worker_config['config'],
+                lone_obj,
+                req_obj,
+                auth_result,
+                handler.get_time_limit(req_handler, left))
+            if code == http.client.OK and handler.is_streamed(resp):
+                self.stream(address, resp, codec, send, req_obj.txid,
+                            handler.get_time_limit(
+                                req_handler, protocol.time_left(deadline)))
+                return
+        result = {'resp': resp, 'code': code}
+        reply = dict()
+        if fields.get('cache') is not None and code == http.client.OK:
+            # The broker serves the reply again until it expires
+            ttl = handler.get_cache_ttl(req_handler, fields.get('ttl'))
+            if ttl:
+                reply['ttl'] = ttl
+        send([b'', address, b''] + protocol.encode_message(result, codec,
+                                                           **reply))
+
+    def run_whole(self, req_obj, auth_result, limit):
+        """
+        Run a handler whose response nobody reads, a streamed
+        one is produced whole so that it is journaled
+        """
+        laf_worker_config = self.worker_config
+        (resp, code) = handler.process_req(
+            laf_worker_config['config'],
+            laf_worker_config['lones'][req_obj.lone],
+            req_obj,
+            auth_result,
+            limit)
+        if code == http.client.OK and handler.is_streamed(resp):
+            try:
+                with handler.time_limit(limit, req_obj.txid):
+                    resp = handler.collect_stream(resp)
+            # W0703: broad-except
+            except Exception as err:  # pylint: disable=W0703
+                # Already journaled as aborted
+                _LOG.exception('[%s]: Streamed response failed',
+                               req_obj.txid)
+                (resp, code) = (repr(err),
+                                http.client.INTERNAL_SERVER_ERROR)
+        return (resp, code)
+
+    def stream(self, address, resp, codec, send, txid, limit=None):
+        """
+        Send the elements of a streamed response in parts, the
+        first part holds the rest of a listing. The elements are
+        produced within the time limit of the handler.
+        """
+        if isinstance(resp, dict):
+            elems = resp['_elem']
+            head = {key: value for key, value in resp.items()
+                    if key != '_elem'}
+        else:
+            (elems, head) = (resp, None)
+        result = {'resp': head, 'code': http.client.OK, 'stream': True}
+        send([b'', address, b''] + protocol.encode_message(
+            result, codec, more=True))
+        chunk = list()
+        part = {'elem': chunk}
+        try:
+            with handler.time_limit(limit, txid):
+                for elem in elems:
+                    chunk.append(elem)
+                    if len(chunk) >= STREAM_CHUNK:
+                        send([b'', address, b''] + protocol.encode_message(
+                            part, codec, more=True))
+                        chunk = list()
+                        part = {'elem': chunk}
+        # W0703: broad-except
+        except Exception as err:  # pylint: disable=W0703
+            # Too late for an error status, the client
+            # learns the response is incomplete
+            _LOG.exception('[%s]: Streamed response failed', txid)
+            part['error'] = repr(err)
+        send([b'', address, b''] + protocol.encode_message(part, codec))
 
     def setup_config(self, basedir, deployment):
         """
         Load laf worker config
         """
+        if self.preloaded is not None:
+            lones = self.preloaded['lones']
+            worker_config = dict(self.preloaded)
+            worker_config['lones'] = dict(
+                (lone, lones[lone]) for lone in self.pool_lones(basedir))
+            return worker_config
         worker_config = dict()
         options = {'mode': 'server', 'deployment': deployment}
         laf_config = config.get_lone_cfg(basedir, options)
@@ -102,21 +647,26 @@ class Worker():
 
     def load_lones(self, basedir, laf_config):
         """
-        Load laf lones
+        Load the laf lones served by the pool of this worker
         """
-        srvconfigfile = os.path.join(basedir, LAFSVR_CONFIG_FILE)
         laf_lonepath = os.path.join(basedir, LAF_LONE_PATH)
         laf_lonelib = os.path.join(basedir, LONE_MODULE_PATH)
         sys.path.append(laf_lonepath)
         sys.path.append(laf_lonelib)
         loaded_module = dict()
 
-        # May throw an exception if invalid configfile (i.e. unreadable)
-        with open(srvconfigfile) as stream:
-            svr_cfg = yaml.load(stream)
-            if 'lones' in svr_cfg:
-                for lone in svr_cfg['lones']:
-                    loaded_module[lone] = loneinterface.load_lone_from_module(
-                        lone, laf_config)
-                    _LOG.info('loaded lone is %s', lone)
+        for lone in self.pool_lones(basedir):
+            loaded_module[lone] = loneinterface.load_lone_from_module(
+                lone, laf_config)
+            _LOG.info('loaded lone is %s', lone)
         return loaded_module
+
+    def pool_lones(self, basedir):
+        """
+        Names of the lones served by the pool of this worker
+        """
+        # May throw an exception if invalid configfile (i.e. unreadable)
+        svr_cfg = config.get_server_cfg(basedir)
+        if self.pool is None:
+            return svr_cfg.get('lones') or []
+        return config.get_worker_pools(svr_cfg)[self.pool]['lones']
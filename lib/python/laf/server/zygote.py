@@ -0,0 +1,150 @@
+"""
+Zygote of the laf workers
+
+The zygote loads the configuration and every lone once, then
+forks the workers the broker asks for. The workers share the
+preloaded pages copy-on-write instead of each one importing and
+loading everything again.
+
+The broker talks to the zygote over its stdin and stdout, one
+json message per line:
+
+    broker -> zygote  {"cmd": "spawn", "env": {...}}
+    zygote -> broker  {"event": "ready"}
+                      {"event": "spawned", "pid": 123}
+                      {"event": "exited", "pid": 123, "status": 0}
+"""
+
+import gc
+import logging
+import os
+import select
+import signal
+import sys
+
+from laf.server import worker
+from laf.server.app import jsoncodec
+
+__all__ = ['Zygote', 'main']
+
+_LOG = logging.getLogger(__name__)
+
+# Seconds between two checks for dead workers
+REAP_INTERVAL = 0.2
+
+
+class Zygote():
+    """
+    Preload the lones and fork the workers
+    """
+
+    def __init__(self, basedir, commands=0, events=1):
+        self.basedir = basedir
+        self.commands = commands
+        self.events = events
+        self.preloaded = None
+        self.buffer = b''
+        self.children = set()
+
+    def send(self, **event):
+        """
+        Send an event to the broker
+        """
+        os.write(self.events, jsoncodec.FAST.dumpb(event) + b'\n')
+
+    def preload(self):
+        """
+        Load the configuration and every lone, then freeze the loaded
+        objects so the garbage collector does not touch their pages
+        """
+        gc.disable()
+        self.preloaded = worker.Worker(self.basedir).setup_config(
+            self.basedir, os.environ['LAF_DEPLOYMENT'])
+        gc.collect()
+        gc.freeze()
+        _LOG.info('zygote preloaded lones %s',
+                  ', '.join(self.preloaded['lones']))
+
+    def run(self):
+        """
+        Serve the broker until it goes away
+        """
+        self.preload()
+        self.send(event='ready')
+        while True:
+            readable, _, _ = select.select([self.commands], [], [],
+                                           REAP_INTERVAL)
+            self.reap()
+            if not readable:
+                continue
+            data = os.read(self.commands, 65536)
+            if not data:
+                _LOG.info('broker went away, zygote exiting')
+                return
+            self.buffer += data
+            while b'\n' in self.buffer:
+                line, self.buffer = self.buffer.split(b'\n', 1)
+                self.handle(jsoncodec.FAST.loads(line))
+
+    def handle(self, command):
+        """
+        Execute a command of the broker
+        """
+        if command['cmd'] == 'spawn':
+            pid = self.spawn(command.get('env', dict()))
+            self.send(event='spawned', pid=pid)
+        else:
+            _LOG.error('zygote got unknown command %r', command)
+
+    def spawn(self, env):
+        """
+        Fork a worker with env added to its environment
+        """
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            _LOG.info('zygote forked worker %d', pid)
+            return pid
+        # In the worker, which must never return into the zygote loop
+        code = 1
+        try:
+            # Keep the broker pipes for the zygote alone
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, self.commands)
+            os.dup2(sys.stderr.fileno(), self.events)
+            os.close(devnull)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            os.environ.update(env)
+            gc.enable()
+            worker.Worker(self.basedir, self.preloaded).run()
+            code = 0
+        except SystemExit as err:
+            code = err.code if isinstance(err.code, int) else 1
+        # W0703: broad-except
+        except Exception:  # pylint: disable=W0703
+            _LOG.exception('worker %d failed', os.getpid())
+        finally:
+            logging.shutdown()
+            os._exit(code)  # pylint: disable=W0212
+        return None
+
+    def reap(self):
+        """
+        Report the dead workers to the broker
+        """
+        while self.children:
+            try:
+                (pid, status) = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.children.discard(pid)
+            self.send(event='exited', pid=pid, status=status)
+
+
+def main(basedir):
+    """
+    Run the zygote
+    """
+    Zygote(basedir).run()
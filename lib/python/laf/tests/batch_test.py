@@ -0,0 +1,119 @@
+"""Batch requests, their operations run in parallel
+"""
+
+import http.client
+import threading
+import unittest
+from unittest import mock
+
+import flask
+
+from laf.server.app import error
+from laf.server.app import routehandler
+
+OPERATIONS = {'getUser': {}, 'updateUser': {}}
+
+
+def _operation(lone, operations, index, item):  # pylint: disable=W0613
+    """Answer an operation as its path says.
+    """
+    # Each operation gets its own copy of the request context
+    assert flask.request.headers['LAF-TX-ID'] == 'tx'
+    outcome = item['path']['outcome']
+    if outcome == 'busy':
+        flask.g.retry_after = 3
+        return ({'_error': 'busy'}, http.client.SERVICE_UNAVAILABLE)
+    if outcome == 'missing':
+        raise error.APIError('Not found', http.client.NOT_FOUND)
+    if outcome == 'crash':
+        raise RuntimeError('crashed')
+    return ({'index': index, 'thread': threading.get_ident()},
+            http.client.OK)
+
+
+def _item(outcome, operationid='getUser'):
+    return {'operationId': operationid, 'path': {'outcome': outcome}}
+
+
+class BatchTest(unittest.TestCase):
+    """Operations of a batch get a result each, in order.
+    """
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.config['batch_parallelism'] = 4
+
+    def _batch(self, inreq):
+        with self.app.test_request_context(headers={'LAF-TX-ID': 'tx'}):
+            return routehandler.handle_batch('users', OPERATIONS, inreq)
+
+    def test_results(self):
+        """Each operation reports its own outcome.
+        """
+        items = [_item('ok'), _item('busy'), _item('missing'),
+                 _item('crash'), _item('ok')]
+        with mock.patch.object(routehandler, '_handle_operation',
+                               _operation), self.assertLogs(
+                                   routehandler.__name__, 'ERROR'):
+            (resp, code) = self._batch({'operations': items})
+        self.assertEqual(code, http.client.OK)
+        results = resp['results']
+        self.assertEqual([result['code'] for result in results],
+                         [200, 503, 404, 500, 200])
+        self.assertEqual([results[0]['resp']['index'],
+                          results[4]['resp']['index']], [0, 4])
+        self.assertEqual(results[1]['retry_after'], 3)
+        self.assertNotIn('retry_after', results[0])
+        self.assertEqual(results[2]['resp'], {'_error': 'Not found'})
+        self.assertEqual(results[3]['resp'], {'_error': 'Internal error'})
+
+    def test_parallel(self):
+        """Operations run in the threads of the batch.
+        """
+        items = [_item('ok') for _ in range(8)]
+        with mock.patch.object(routehandler, '_handle_operation',
+                               _operation):
+            (resp, _) = self._batch({'operations': items})
+        threads = {result['resp']['thread'] for result in resp['results']}
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertLessEqual(len(threads), 4)
+
+    def test_empty(self):
+        """An empty batch has no results.
+        """
+        self.assertEqual(self._batch({'operations': []}),
+                         ({'results': []}, http.client.OK))
+
+    def test_invalid(self):
+        """Batches which are not a list of operations are refused.
+        """
+        for inreq in (None, [], {}, {'operations': {'a': 1}}):
+            with self.subTest(inreq=inreq):
+                with self.assertRaises(error.APIError) as caught:
+                    self._batch(inreq)
+                self.assertEqual(caught.exception.status_code,
+                                 http.client.BAD_REQUEST)
+
+    def test_too_large(self):
+        """Batches beyond the size limit are refused.
+        """
+        self.app.config['batch_max_size'] = 2
+        with self.assertRaises(error.APIError) as caught:
+            self._batch({'operations': [_item('ok')] * 3})
+        self.assertEqual(caught.exception.status_code,
+                         http.client.REQUEST_ENTITY_TOO_LARGE)
+
+    def test_unknown_operation(self):
+        """Operations the lone does not have fail on their own.
+        """
+        items = [_item('ok', 'deleteUser'), {'operationId': 'getUser',
+                                             'path': 'a'}]
+        (resp, _) = self._batch({'operations': items})
+        self.assertEqual([result['code'] for result in resp['results']],
+                         [400, 400])
+        self.assertEqual(resp['results'][0]['resp'],
+                         {'_error': 'Unknown operation deleteUser in batch'})
+
+
+if __name__ == '__main__':
+    unittest.main()
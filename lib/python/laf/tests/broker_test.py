@@ -0,0 +1,557 @@
+"""Broker dispatching the requests of the clients to the workers
+"""
+
+import http.client
+import itertools
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+from unittest import mock
+
+import zmq
+import zmq.auth
+
+from laf.server import broker
+from laf.server import cache
+from laf.server import protocol
+from laf.server import worker
+
+
+def _frames(*parts):
+    return [zmq.Frame(part) for part in parts]
+
+
+def _count(counter, **labels):
+    return counter.values.get(counter.key(labels), 0)
+
+
+class BrokerTestCase(unittest.TestCase):
+    """Broker talking to fake clients and workers.
+    """
+
+    options = dict()
+
+    def setUp(self):
+        self.now = 1000.0
+        for (target, name, value) in (
+                (broker.time, 'time', lambda: self.now),
+                (broker.os, 'kill', mock.DEFAULT),
+                (broker.subprocess, 'Popen', mock.DEFAULT),
+                (broker, 'IOLoop', mock.DEFAULT)):
+            patcher = mock.patch.object(target, name, value)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        pids = itertools.count(1000)
+        self.Popen.side_effect = lambda *args, **kwargs: mock.Mock(
+            pid=next(pids))
+        self.addCleanup(setattr, broker.LRUQueue, '_LRUQueue__instance',
+                        None)
+        self.queue = broker.LRUQueue(
+            'inproc://backend-test', 'inproc://frontend-test',
+            '/nonexistent', False, 'laf_worker', 'test',
+            dict(self.options, stats_interval=0))
+        self.queue.heartbeater.stop()
+        self.queue.sweeper.stop()
+        self.queue.frontend.close()
+        self.queue.backend.close()
+        self.queue.frontend = mock.Mock()
+        self.queue.backend = mock.Mock()
+        self.addCleanup(lambda: self.queue.scaler and self.queue.scaler.stop())
+
+    def start(self, n_workers, pools_cfg=None):
+        """Start the workers, return their addresses.
+        """
+        self.queue.start_workers(n_workers, pools_cfg)
+        return self.workers()
+
+    def workers(self):
+        """Addresses of the local workers.
+        """
+        return [u'Worker-{0}'.format(pid).encode()
+                for pool in self.queue.pools.values() for pid in pool.procs]
+
+    def ready(self, laf_worker, slots=1):
+        """A worker announces its slots.
+        """
+        self.queue.handle_backend(
+            _frames(laf_worker, *protocol.ready(slots)))
+
+    def done(self, laf_worker, client):
+        """A worker is done with the request of a client.
+        """
+        self.queue.handle_backend(
+            _frames(laf_worker, *protocol.ready(done=client)))
+
+    def serve(self, laf_worker, client):
+        """A worker replies to a client, then is done with its request.
+        """
+        self.queue.handle_backend(_frames(
+            laf_worker, b'', client, b'', *protocol.encode_message(
+                {'resp': 'ok', 'code': http.client.OK}, protocol.JSON)))
+        self.done(laf_worker, client)
+
+    def request(self, client, lone='users', **fields):
+        """A client sends a request.
+        """
+        header = protocol.encode_header(dict(fields, lone=lone),
+                                        protocol.JSON)
+        self.queue.handle_frontend(
+            _frames(client, b'', header, protocol.encode({}, protocol.JSON)))
+
+    def dispatched(self):
+        """Workers and clients of the requests sent to the workers.
+        """
+        return [(frames[0], frames[2]) for ((frames,), _) in
+                self.queue.backend.send_multipart.call_args_list
+                if len(frames) == 6]
+
+    def answers(self):
+        """Clients and codes of the replies of the broker itself.
+        """
+        return [(frames[0], protocol.decode_message(frames[2:])['code'])
+                for ((frames,), _) in
+                self.queue.frontend.send_multipart.call_args_list]
+
+    def stopped(self):
+        """Workers told to exit.
+        """
+        return [frames[0] for ((frames,), _) in
+                self.queue.backend.send_multipart.call_args_list
+                if frames[2:] == [protocol.STOP]]
+
+
+class QueueTest(BrokerTestCase):
+    """Requests wait for a worker in a bounded queue.
+    """
+
+    options = {'queue_size': 2, 'queue_timeout': 5}
+
+    def setUp(self):
+        super().setUp()
+        (self.worker,) = self.start(1)
+        self.ready(self.worker)
+
+    def test_full(self):
+        """Requests beyond the queue are rejected with a retry delay.
+        """
+        for client in (b'a', b'b', b'c', b'd'):
+            self.request(client)
+        self.assertEqual(self.dispatched(), [(self.worker, b'a')])
+        ((frames,), _) = self.queue.frontend.send_multipart.call_args
+        reply = protocol.decode_message(frames[2:])
+        self.assertEqual((frames[0], reply['code']),
+                         (b'd', http.client.SERVICE_UNAVAILABLE))
+        self.assertGreaterEqual(reply['retry_after'], 1)
+        self.assertEqual(
+            _count(self.queue.metrics.rejected, pool='default'), 1)
+
+    def test_order(self):
+        """Queued requests are served in their order.
+        """
+        for client in (b'a', b'b', b'c'):
+            self.request(client)
+        self.serve(self.worker, b'a')
+        self.serve(self.worker, b'b')
+        self.assertEqual(self.dispatched(), [
+            (self.worker, b'a'), (self.worker, b'b'), (self.worker, b'c')])
+        self.assertEqual(self.answers(), [(b'a', http.client.OK),
+                                          (b'b', http.client.OK)])
+
+    def test_stale(self):
+        """Requests waiting too long for a worker are rejected.
+        """
+        self.request(b'a')
+        self.request(b'b')
+        self.now += 6
+        self.queue.sweep()
+        self.assertEqual(self.answers(),
+                         [(b'b', http.client.SERVICE_UNAVAILABLE)])
+        self.serve(self.worker, b'a')
+        self.assertEqual(self.dispatched(), [(self.worker, b'a')])
+
+
+
+class DispatchTest(BrokerTestCase):
+    """Requests go to the least recently used worker slot.
+    """
+
+    def test_lru(self):
+        """Workers freed first are used first.
+        """
+        workers = self.start(3)
+        for laf_worker in workers:
+            self.ready(laf_worker)
+        for client in (b'a', b'b', b'c'):
+            self.request(client)
+        self.serve(workers[1], b'b')
+        self.serve(workers[0], b'a')
+        self.request(b'd')
+        self.request(b'e')
+        self.assertEqual(self.dispatched(), [
+            (workers[0], b'a'), (workers[1], b'b'), (workers[2], b'c'),
+            (workers[1], b'd'), (workers[0], b'e')])
+
+    def test_slots(self):
+        """A worker appears once per free slot.
+        """
+        (laf_worker,) = self.start(1)
+        self.ready(laf_worker, slots=2)
+        for client in (b'a', b'b', b'c'):
+            self.request(client)
+        self.assertEqual(self.dispatched(), [(laf_worker, b'a'),
+                                             (laf_worker, b'b')])
+        self.serve(laf_worker, b'b')
+        self.assertEqual(self.dispatched()[-1], (laf_worker, b'c'))
+        pool = self.queue.pools['default']
+        self.assertEqual((pool.running, len(pool.idle)), (2, 0))
+
+    def test_lost_slots(self):
+        """A worker announcing itself again loses its requests.
+        """
+        (laf_worker,) = self.start(1)
+        self.ready(laf_worker, slots=2)
+        self.request(b'a')
+        self.ready(laf_worker, slots=2)
+        pool = self.queue.pools['default']
+        self.assertEqual(list(pool.idle), [laf_worker, laf_worker])
+        self.assertEqual(self.answers(),
+                         [(b'a', http.client.INTERNAL_SERVER_ERROR)])
+
+
+class ScaleTest(BrokerTestCase):
+    """Elastic pools follow the load.
+    """
+
+    options = {'min_workers': 1, 'max_workers': 2}
+
+    def setUp(self):
+        super().setUp()
+        (self.worker,) = self.start(1)
+        self.ready(self.worker)
+        self.pool = self.queue.pools['default']
+        self.assertTrue(self.pool.elastic)
+
+    def _tick(self, count):
+        for _ in range(count):
+            self.queue.autoscale()
+
+    def test_up(self):
+        """Queued requests grow the pool up to its maximum.
+        """
+        self.request(b'a')
+        self.request(b'b')
+        self._tick(broker.SCALE_UP_TICKS - 1)
+        self.assertEqual(len(self.workers()), 1)
+        self._tick(1)
+        self.assertEqual(len(self.workers()), 2)
+        self._tick(broker.SCALE_UP_TICKS * 2)
+        self.assertEqual(len(self.workers()), 2)
+        (added,) = set(self.workers()) - {self.worker}
+        self.ready(added)
+        self.assertEqual(self.dispatched()[-1], (added, b'b'))
+
+    def test_down(self):
+        """A quiet pool drains its idle workers down to its minimum.
+        """
+        self.queue.spawn_worker(self.pool)
+        (added,) = set(self.workers()) - {self.worker}
+        self.ready(added)
+        self._tick(broker.SCALE_DOWN_TICKS - 1)
+        self.assertEqual(self.stopped(), [])
+        self._tick(1)
+        self.assertEqual(self.stopped(), [self.worker])
+        self.assertEqual(self.pool.worker_count(), 1)
+        self._tick(broker.SCALE_DOWN_TICKS * 2)
+        self.assertEqual(self.stopped(), [self.worker])
+
+
+class DeadlineTest(BrokerTestCase):
+    """Requests past their deadline.
+    """
+
+    options = {'kill_grace': 1}
+
+    def test_threaded(self):
+        """A worker serving other requests is replaced, then killed.
+        """
+        (laf_worker,) = self.start(1)
+        self.ready(laf_worker, slots=2)
+        self.request(b'slow', deadline=self.now + 1)
+        self.request(b'fast')
+        self.now += 1.5
+        self.queue.sweep()
+        self.assertEqual(self.answers(),
+                         [(b'slow', http.client.GATEWAY_TIMEOUT)])
+        self.now += 1
+        with self.assertLogs(broker.__name__, 'ERROR'):
+            self.queue.sweep()
+        metrics = self.queue.metrics
+        self.assertEqual(_count(metrics.overruns, lone='users'), 1)
+        self.assertEqual(
+            _count(metrics.restarts, pool='default', reason='deadline'), 1)
+        (replacement,) = set(self.workers()) - {laf_worker}
+        self.ready(replacement)
+        self.queue.sweep()
+        self.kill.assert_not_called()
+        self.done(laf_worker, b'fast')
+        self.queue.sweep()
+        self.kill.assert_called_with(1000, signal.SIGKILL)
+
+    def test_killed(self):
+        """A worker serving only the request past its deadline is killed.
+        """
+        (laf_worker,) = self.start(1)
+        self.ready(laf_worker)
+        self.request(b'slow', deadline=self.now + 1)
+        self.now += 2.5
+        with self.assertLogs(broker.__name__, 'ERROR'):
+            self.queue.sweep()
+        self.kill.assert_called_once_with(1000, signal.SIGKILL)
+        self.now += broker.STABLE_UPTIME
+        self.queue.worker_exited(1000)
+        restarts = self.queue.metrics.restarts
+        self.assertEqual(
+            _count(restarts, pool='default', reason='deadline'), 1)
+        self.assertEqual(_count(restarts, pool='default', reason='exited'),
+                         0)
+        self.assertEqual(len(self.workers()), 1)
+
+
+class HeartbeatTest(BrokerTestCase):
+    """Workers missing their heartbeats.
+    """
+
+    def test_lost(self):
+        """A silent worker is killed, its restart counted once.
+        """
+        (laf_worker,) = self.start(1)
+        self.ready(laf_worker)
+        self.request(b'client')
+        with self.assertLogs(broker.__name__, 'ERROR'):
+            for _ in range(3):
+                self.now += 2
+                self.queue.check_heartbeats()
+        self.kill.assert_called_once_with(1000, signal.SIGKILL)
+        self.assertEqual(self.answers(),
+                         [(b'client', http.client.INTERNAL_SERVER_ERROR)])
+        self.now += broker.STABLE_UPTIME
+        self.queue.worker_exited(1000)
+        restarts = self.queue.metrics.restarts
+        self.assertEqual(
+            _count(restarts, pool='default', reason='heartbeat'), 1)
+        self.assertEqual(_count(restarts, pool='default', reason='exited'),
+                         0)
+        self.assertEqual(len(self.workers()), 1)
+
+    def _beats(self):
+        return [frames[0] for ((frames,), _) in
+                self.queue.backend.send_multipart.call_args_list
+                if frames[2:] == [protocol.HEARTBEAT]]
+
+    def test_alive(self):
+        """Workers heard of get the heartbeats of the broker.
+        """
+        (laf_worker,) = self.start(1)
+        self.ready(laf_worker)
+        for _ in range(5):
+            self.now += 2
+            self.queue.handle_backend(
+                _frames(laf_worker, b'', protocol.HEARTBEAT))
+            self.queue.check_heartbeats()
+        self.assertEqual(self._beats(), [laf_worker] * 5)
+        self.kill.assert_not_called()
+
+    def test_stalled(self):
+        """A broker which was stalled itself does not blame the workers.
+        """
+        (laf_worker,) = self.start(1)
+        self.ready(laf_worker)
+        self.now += 60
+        with self.assertLogs(broker.__name__, 'ERROR'):
+            self.queue.check_heartbeats()
+        self.kill.assert_not_called()
+        self.assertEqual(self._beats(), [laf_worker])
+
+    def test_remote_lost(self):
+        """A silent worker of another host is forgotten.
+        """
+        self.start(0)
+        remote = b'Worker-web1-1234'
+        self.queue.handle_backend(
+            _frames(remote, *protocol.ready(pool='default')))
+        self.request(b'client')
+        self.assertEqual(self.dispatched(), [(remote, b'client')])
+        with self.assertLogs(broker.__name__, 'ERROR'):
+            for _ in range(3):
+                self.now += 2
+                self.queue.check_heartbeats()
+        self.kill.assert_not_called()
+        self.assertNotIn(remote, self.queue.workers)
+        self.assertEqual(self.answers(),
+                         [(b'client', http.client.INTERNAL_SERVER_ERROR)])
+
+    def test_start_timeout(self):
+        """A worker which never announces itself is killed.
+        """
+        self.start(1)
+        started = self.now
+        while self.now - started <= broker.DEFAULT_START_TIMEOUT - 2:
+            self.now += 2
+            self.queue.check_heartbeats()
+        self.kill.assert_not_called()
+        with self.assertLogs(broker.__name__, 'ERROR'):
+            for _ in range(2):
+                self.now += 2
+                self.queue.check_heartbeats()
+        self.kill.assert_called_once_with(1000, signal.SIGKILL)
+
+
+
+class ReloadTest(BrokerTestCase):
+    """Rolling reloads replace the workers without losing capacity.
+    """
+
+    def test_replace(self):
+        """Old workers serve until their replacements are ready.
+        """
+        old = self.start(2)
+        for laf_worker in old:
+            self.ready(laf_worker)
+        pool = self.queue.pools['default']
+        self.request(b'a')
+        self.assertEqual(self.queue.reload(), 'ok')
+        new = [laf_worker for laf_worker in self.workers()
+               if laf_worker not in old]
+        self.assertEqual(len(new), 2)
+        self.assertEqual(pool.capacity(), 2)
+        self.assertEqual(self.stopped(), [])
+        self.ready(new[0])
+        self.assertEqual(len(pool.draining), 1)
+        self.assertEqual(pool.capacity(), 2)
+        self.ready(new[1])
+        self.assertEqual(pool.draining, set(old))
+        self.assertEqual(pool.capacity(), 2)
+        # The busy one is stopped once done
+        self.assertEqual(self.stopped(), [old[1]])
+        self.serve(old[0], b'a')
+        self.assertEqual(self.stopped(), [old[1], old[0]])
+        self.assertEqual(self.answers(), [(b'a', http.client.OK)])
+        self.assertEqual(
+            _count(self.queue.metrics.restarts, pool='default',
+                   reason='reloaded'), 2)
+
+    def test_zygote_died(self):
+        """A reload whose new zygote dies keeps the running workers.
+        """
+        self.queue.preload = True
+        with mock.patch.object(broker, 'set_subreaper'):
+            self.queue.start_workers(1)
+        self.queue.zygote_event({'event': 'spawned', 'pid': 2000})
+        self.queue.zygote_event({'event': 'ready'})
+        self.ready(b'Worker-2000')
+        self.assertEqual(self.queue.reload(), 'ok')
+        self.assertEqual(self.queue.status(), 'reloading')
+        self.assertEqual(self.Popen.call_count, 2)
+        with self.assertLogs(broker.__name__, 'ERROR'):
+            self.queue.zygote_died()
+        self.assertTrue(self.queue.status().startswith('Reload failed'))
+        pool = self.queue.pools['default']
+        self.assertEqual(list(pool.procs), [2000])
+        self.assertEqual((pool.retiring, pool.draining), (set(), set()))
+        self.request(b'a')
+        self.assertEqual(self.dispatched(), [(b'Worker-2000', b'a')])
+
+class CacheTest(BrokerTestCase):
+    """Replies kept for the GET requests of a lone.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.queue.cache = cache.ResponseCache()
+        (self.worker,) = self.start(1)
+        self.ready(self.worker)
+
+    def _kept(self):
+        self.queue.cache.put('key', 'users', 'a', [b'h', b'r'], 60,
+                             self.queue.cache.generation('users'))
+        self.assertIsNotNone(self.queue.cache.get('key'))
+
+    def test_changed(self):
+        """A @longrunning change done drops the replies again.
+        """
+        self._kept()
+        self.queue.handle_backend(
+            _frames(self.worker, *protocol.changed('users', 'a')))
+        self.assertIsNone(self.queue.cache.get('key'))
+
+    def test_write_done(self):
+        """A change served in its slot drops the replies once done.
+        """
+        self.request(b'client', method='post', pk='a')
+        self._kept()
+        self.done(self.worker, b'client')
+        self.assertIsNone(self.queue.cache.get('key'))
+
+
+
+class RemoteTest(BrokerTestCase):
+    """Workers of other hosts joining over tcp.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.keys = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.keys)
+        self.context = zmq.Context()
+        self.addCleanup(self.context.term)
+        self.router = self.context.socket(zmq.ROUTER)
+        self.addCleanup(self.router.close, 0)
+        self.queue.backend = mock.Mock(socket=self.router)
+        self.certs = dict()
+        for name in ('broker', 'known', 'unknown'):
+            self.certs[name] = zmq.auth.create_certificates(self.keys, name)
+        clients = os.path.join(self.keys, 'clients')
+        os.mkdir(clients)
+        shutil.copy(self.certs['known'][0], clients)
+        self.queue.bind_remote('tcp://127.0.0.1:*', self.certs['broker'][1],
+                               clients)
+        self.addCleanup(self.queue.authenticator.stop)
+
+    def _joins(self, env):
+        environ = dict(env, LAF_DEPLOYMENT='test', LAF_WORKER_HOST='web1',
+                       WORKER_SOCKET=self.router.last_endpoint.decode())
+        with mock.patch.dict(os.environ, environ):
+            laf_worker = worker.Worker('/nonexistent')
+        socket = laf_worker.connect(self.context)
+        self.addCleanup(socket.close, 0)
+        return bool(self.router.poll(500))
+
+    def test_known(self):
+        """A worker of a known host joins.
+        """
+        self.assertTrue(self._joins({
+            'LAF_CURVE_SERVERKEY': self.certs['broker'][0],
+            'LAF_CURVE_CERT': self.certs['known'][1]}))
+        self.assertEqual(self.router.recv_multipart()[2], protocol.READY)
+
+    def test_unknown(self):
+        """Workers of unknown hosts or without keys do not join.
+        """
+        self.assertFalse(self._joins({
+            'LAF_CURVE_SERVERKEY': self.certs['broker'][0],
+            'LAF_CURVE_CERT': self.certs['unknown'][1]}))
+        self.assertFalse(self._joins({}))
+
+    def test_loopback(self):
+        """Endpoints other hosts reach are told apart.
+        """
+        self.assertTrue(broker.is_loopback('ipc://@backend.ipc'))
+        self.assertTrue(broker.is_loopback('tcp://127.0.0.1:5555'))
+        self.assertFalse(broker.is_loopback('tcp://*:5555'))
+        self.assertEqual(broker.parse_hosts('10.0.0.1, 10.0.0.2,'),
+                         ['10.0.0.1', '10.0.0.2'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Multiplexed client of the broker shared by greenlets
+"""
+
+import unittest
+
+import zmq
+
+from laf.server import protocol
+from laf.server.app import brokerclient
+
+try:
+    # E0401: Unable to import 'gevent'
+    import gevent  # pylint: disable=E0401
+    from zmq import green as green_zmq  # pylint: disable=E0401
+except ImportError:
+    gevent = None
+
+
+@unittest.skipIf(gevent is None, 'gevent is not installed')
+class MultiplexedTest(unittest.TestCase):
+    """Replies find their request whatever their order.
+    """
+
+    def setUp(self):
+        self.context = green_zmq.Context()
+        self.broker = self.context.socket(zmq.ROUTER)
+        self.broker.setsockopt(zmq.LINGER, 0)
+        self.broker.bind('tcp://127.0.0.1:*')
+        url = self.broker.getsockopt(zmq.LAST_ENDPOINT).decode()
+        self.client = brokerclient.MultiplexedBrokerClient(url)
+        self.addCleanup(self.context.term)
+        self.addCleanup(self.broker.close)
+        self.addCleanup(self.client.close)
+
+    def _broker(self, count, parts=1):
+        """Answer count requests in the reverse order, in parts.
+        """
+        received = [self.broker.recv_multipart() for _ in range(count)]
+        for (address, correlation_id, _, _, payload) in reversed(received):
+            request = protocol.decode_message([payload])
+            for part in range(parts):
+                frames = protocol.encode_message(
+                    {'resp': request, 'part': part}, protocol.JSON,
+                    more=part < parts - 1)
+                self.broker.send_multipart([address, correlation_id, b''] +
+                                           frames)
+
+    def _request(self, number):
+        return protocol.decode_message(self.client.request(
+            protocol.encode_message(number, protocol.JSON)))
+
+    def test_out_of_order(self):
+        """Concurrent requests each get their own reply.
+        """
+        broker = gevent.spawn(self._broker, 3)
+        requests = [gevent.spawn(self._request, number)
+                    for number in range(3)]
+        gevent.joinall(requests + [broker], timeout=5, raise_error=True)
+        self.assertEqual([job.value['resp'] for job in requests], [0, 1, 2])
+        self.assertEqual(self.client._pending, {})  # pylint: disable=W0212
+
+    def test_streamed(self):
+        """The parts of a streamed reply are yielded in order.
+        """
+        broker = gevent.spawn(self._broker, 1, parts=3)
+        parts = [protocol.decode_message(reply)['part']
+                 for reply in self.client.replies(
+                     protocol.encode_message(7, protocol.JSON), timeout=5)]
+        broker.join()
+        self.assertEqual(parts, [0, 1, 2])
+
+    def test_timeout(self):
+        """A request without a reply in time is given up on.
+        """
+        with self.assertRaises(brokerclient.BrokerTimeout):
+            self.client.request(protocol.encode_message(1, protocol.JSON),
+                                timeout=0.05)
+        self.assertEqual(self.client._pending, {})  # pylint: disable=W0212
+        # Its late reply is dropped, the next request gets its own
+        broker = gevent.spawn(self._broker, 2)
+        self.assertEqual(self._request(2)['resp'], 2)
+        broker.join()
+
+
+class GetClientTest(unittest.TestCase):
+    """One client per process, of the kind its workers need.
+    """
+
+    def test_kind(self):
+        """The client is kept until another kind or url is asked for.
+        """
+        self.addCleanup(setattr, brokerclient, '_CLIENT', None)
+        url = 'tcp://127.0.0.1:1'
+        client = brokerclient.get_client(url)
+        self.assertIsInstance(client, brokerclient.BrokerClient)
+        self.assertIs(brokerclient.get_client(url), client)
+        other = brokerclient.get_client('tcp://127.0.0.1:2')
+        self.assertIsNot(other, client)
+        client.close()
+        other.close()
+        if gevent is not None:
+            multiplexed = brokerclient.get_client(url, multiplexed=True)
+            self.assertIsInstance(multiplexed,
+                                  brokerclient.MultiplexedBrokerClient)
+            multiplexed.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+"""Replies kept by the broker for idempotent requests
+"""
+
+import hashlib
+import json
+import unittest
+from unittest import mock
+
+from laf.server import cache
+from laf.server.app import processing
+from laf.server.app.request import Request
+
+
+def _frames(size=10):
+    return [b'h', b'x' * (size - 1)]
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """Least recently used replies, dropped when their lone changes.
+    """
+
+    def setUp(self):
+        self.cache = cache.ResponseCache(max_entries=3, max_size=1)
+        self.now = 1000.0
+        patcher = mock.patch.object(cache.time, 'time',
+                                    lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _put(self, key, lone='users', pk=None, size=10, ttl=60):
+        return self.cache.put(key, lone, pk, _frames(size), ttl,
+                              self.cache.generation(lone))
+
+    def test_get(self):
+        """Replies are served until they expire.
+        """
+        self.assertIsNone(self.cache.get('a'))
+        self.assertTrue(self._put('a', ttl=5))
+        self.assertEqual(self.cache.get('a'), _frames())
+        self.now += 5
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.size, 0)
+
+    def test_lru(self):
+        """The least recently used replies go first.
+        """
+        for key in 'abc':
+            self._put(key)
+        self.cache.get('a')
+        self._put('d')
+        self.assertEqual(list(self.cache.entries), ['c', 'a', 'd'])
+        self.assertEqual(self.cache.size, 30)
+
+    def test_size(self):
+        """The size of the replies is bounded too.
+        """
+        half = 1024 * 1024 // 2
+        self._put('a', size=half)
+        self._put('b', size=half)
+        self._put('c', size=10)
+        self.assertEqual(list(self.cache.entries), ['b', 'c'])
+        self.assertFalse(self._put('big', size=1024 * 1024 + 1))
+        self.assertIsNone(self.cache.get('big'))
+
+    def test_replace(self):
+        """A key kept again replaces its reply.
+        """
+        self._put('a', size=10)
+        self._put('a', size=20)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.size, 20)
+
+    def test_generation(self):
+        """Replies to requests sent before a change are not kept.
+        """
+        generation = self.cache.generation('users')
+        self.cache.invalidate('users', 'a')
+        self.assertFalse(self.cache.put('a', 'users', 'a', _frames(), 60,
+                                        generation))
+        self.assertTrue(self.cache.put('g', 'groups', None, _frames(), 60,
+                                       self.cache.generation('groups')))
+
+    def test_invalidate(self):
+        """A change drops its primary key and the listings of its lone.
+        """
+        self._put('get-a', pk='a')
+        self._put('get-b', pk='b')
+        self._put('list', pk=None)
+        self.cache.invalidate('users', 'a')
+        self.assertEqual(list(self.cache.entries), ['get-b'])
+        self.assertEqual(self.cache.tags, {('users', 'b'): {'get-b'}})
+
+    def test_invalidate_lone(self):
+        """A change without a primary key drops the whole lone.
+        """
+        self._put('get-a', pk='a')
+        self._put('list', pk=None)
+        self._put('group', lone='groups', pk='a')
+        self.cache.invalidate('users')
+        self.assertEqual(list(self.cache.entries), ['group'])
+
+    def test_clear(self):
+        """Clearing forgets every reply and the ones on their way.
+        """
+        generation = self.cache.generation('users')
+        self._put('a')
+        self.cache.clear()
+        self.assertEqual((len(self.cache), self.cache.size), (0, 0))
+        self.assertFalse(self.cache.put('a', 'users', None, _frames(), 60,
+                                        generation))
+
+
+class CacheKeyTest(unittest.TestCase):
+    """Replies are shared between callers only when allowed.
+    """
+
+    @staticmethod
+    def _key(user, scope=None, **fields):
+        req = Request(user=user, lone='users', verb='get', pk='a',
+                      obj={}, **fields)
+        return processing.cache_key(
+            req, 'v3', None if scope is None else {'scope': scope})
+
+    def test_scope(self):
+        """Keys are per user unless the replies are shared.
+        """
+        self.assertNotEqual(self._key('ann'), self._key('bob'))
+        self.assertEqual(self._key('ann', 'user'), self._key('ann'))
+        self.assertEqual(self._key('ann', 'shared'),
+                         self._key('bob', 'shared'))
+
+    def test_request(self):
+        """Different requests have different keys.
+        """
+        self.assertNotEqual(self._key('ann', queryvars={'a': 1}),
+                            self._key('ann', queryvars={'a': 2}))
+        self.assertEqual(self._key('ann', queryvars={'a': 1, 'b': 2}),
+                         self._key('ann', queryvars={'b': 2, 'a': 1}))
+
+    def test_unchanged(self):
+        """Keys are the ones of the replies cached before.
+        """
+        req = Request(user='ann', lone='users', verb='get', pk='a', obj={},
+                      queryvars={'b': [1, 2], 'a': object}, urlvars={})
+        fields = [req.lone, 'v3', req.verb, req.pk, req.subhandler,
+                  req.path, req.urlvars, req.queryvars, req.user, req.role,
+                  req.obo]
+        data = json.dumps(fields, sort_keys=True, default=str)
+        self.assertEqual(processing.cache_key(req, 'v3'),
+                         hashlib.sha1(data.encode()).hexdigest())
+
+
+if __name__ == '__main__':
+    unittest.main()
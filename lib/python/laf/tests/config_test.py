@@ -0,0 +1,166 @@
+"""Configuration files parsed once per change
+"""
+
+import http.client
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from laf.server.app import config
+from laf.server.app import error
+from laf.server.app import validationutils
+
+
+class ReadConfigFileTest(unittest.TestCase):
+    """Files are parsed again once their inode, mtime or size changed.
+    """
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.basedir)
+        self.addCleanup(config.reload_config_files)
+        self.path = os.path.join(self.basedir, 'family')
+        self.parse = mock.Mock(side_effect=lambda stream: stream.read())
+        self._write('first')
+
+    def _write(self, text, path=None):
+        with open(path or self.path, 'w') as stream:
+            stream.write(text)
+
+    def _read(self):
+        return config.read_config_file(self.path, self.parse)
+
+    def test_unchanged(self):
+        """An unchanged file is parsed once.
+        """
+        self.assertEqual(self._read(), 'first')
+        self.assertEqual(self._read(), 'first')
+        self.assertEqual(self.parse.call_count, 1)
+
+    def test_size(self):
+        """A file of another size is parsed again.
+        """
+        self._read()
+        self._write('second one')
+        self.assertEqual(self._read(), 'second one')
+
+    def test_mtime(self):
+        """A file rewritten with the same size is parsed again.
+        """
+        stat = os.stat(self.path)
+        self._read()
+        self._write('other')
+        os.utime(self.path, ns=(stat.st_atime_ns,
+                                stat.st_mtime_ns + 1000000))
+        self.assertEqual(self._read(), 'other')
+
+    def test_inode(self):
+        """A file replaced by another one is parsed again.
+        """
+        stat = os.stat(self.path)
+        self._read()
+        other = os.path.join(self.basedir, 'family.new')
+        self._write('fresh', other)
+        os.utime(other, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(other, self.path)
+        self.assertEqual(self._read(), 'fresh')
+
+    def test_parsers(self):
+        """Each parser of a file gets its own contents.
+        """
+        self._read()
+        upper = config.read_config_file(
+            self.path, lambda stream: stream.read().upper())
+        self.assertEqual(upper, 'FIRST')
+        self.assertEqual(self._read(), 'first')
+        self.assertEqual(self.parse.call_count, 1)
+
+    def test_reload(self):
+        """Every file is parsed again once the cache is dropped.
+        """
+        self._read()
+        config.reload_config_files()
+        self._read()
+        self.assertEqual(self.parse.call_count, 2)
+
+    def test_missing(self):
+        """A missing file is not cached.
+        """
+        os.unlink(self.path)
+        with self.assertRaises(FileNotFoundError):
+            self._read()
+        self._write('back')
+        self.assertEqual(self._read(), 'back')
+
+    def test_family(self):
+        """The family is the stripped contents of etc/family.
+        """
+        os.mkdir(os.path.join(self.basedir, 'etc'))
+        self._write('users\n', os.path.join(self.basedir, 'etc', 'family'))
+        self.assertEqual(config.get_laf_family(self.basedir), 'users')
+
+
+class CmConfigTest(unittest.TestCase):
+    """Operations needing a change management ticket.
+    """
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.basedir)
+        self.addCleanup(config.reload_config_files)
+        os.mkdir(os.path.join(self.basedir, 'etc'))
+
+    def _write(self, text):
+        with open(os.path.join(self.basedir,
+                               validationutils.CMCONFIG_FILE), 'w') as stream:
+            stream.write(text)
+
+    def _check(self, req_cm, lone, verb, operationid=None):
+        validationutils.check_cmconfig(self.basedir, req_cm, lone, verb,
+                                       'pk', {}, 'user', 'host',
+                                       operationid)
+
+    def test_parse(self):
+        """Operations are given as a list or a single one.
+        """
+        self._write('users: [create, delete]\ngroups: update\nhosts:\n')
+        path = os.path.join(self.basedir, validationutils.CMCONFIG_FILE)
+        self.assertEqual(
+            config.read_config_file(path, validationutils.parse_cmconfig),
+            {('users', 'create'), ('users', 'delete'),
+             ('groups', 'update')})
+
+    def test_ticket(self):
+        """Listed operations need a ticket, the others do not.
+        """
+        self._write('users: [create, deleteUser]\n')
+        self._check(None, 'users', 'update')
+        self._check(None, 'groups', 'create')
+        self._check('CM-1', 'users', 'create')
+        for (verb, operationid) in (('create', None),
+                                    ('delete', 'deleteUser')):
+            with self.subTest(verb=verb, operationid=operationid):
+                with self.assertRaises(error.APIError) as caught:
+                    self._check(None, 'users', verb, operationid)
+                self.assertEqual(caught.exception.status_code,
+                                 http.client.BAD_REQUEST)
+
+    def test_missing(self):
+        """Without a config no ticket is needed.
+        """
+        self._check(None, 'users', 'create')
+
+    def test_broken(self):
+        """A config which is not yaml fails the request.
+        """
+        self._write('users: [create\n')
+        with self.assertRaises(error.APIError) as caught:
+            self._check('CM-1', 'users', 'create')
+        self.assertEqual(caught.exception.message,
+                         'Error loading cm-config.yml file')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+"""Handling of the requests in the laf workers
+"""
+
+import http.client
+import time
+import unittest
+from unittest import mock
+
+from laf.client.loneexception import LoneException
+from laf.server import protocol
+from laf.server.app import handler
+from laf.server.app.loneinterface import LoneAPI, cache, timeout
+from laf.server.app.request import Request
+
+
+class Stream(LoneAPI):
+    """Lone whose list handler streams what it reads of the request.
+    """
+
+    def list(self, pk, count=2, fail=None):  # pylint: disable=W0613
+        """Stream count elements, failing after fail of them.
+        """
+        for index in range(count):
+            if index == fail:
+                raise LoneException('failed', http.client.CONFLICT)
+            yield {'i': index, 'txid': self.txid, 'user': self.user}
+
+
+class Slow(LoneAPI):
+    """Lone whose get handler outlives its time limit.
+    """
+
+    @timeout(0.05)
+    def get(self, pk, wait=1):  # pylint: disable=W0613
+        """Sleep for wait seconds.
+        """
+        time.sleep(wait)
+        return {'slept': wait}
+
+
+def _request(**obj):
+    return Request(user='someone', lone='stream', verb='list', obj=obj)
+
+
+class StreamTest(unittest.TestCase):
+    """Streamed responses run in the request and are journaled once sent.
+    """
+
+    def setUp(self):
+        self.lone = Stream({'mode': 'lone'})
+        self.steps = list()
+        patcher = mock.patch.object(handler, 'journal', self._journal)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _journal(self, request, configdict, step, payload, lone_obj):
+        # pylint: disable=W0613
+        self.steps.append((step, payload))
+
+    def test_request_state(self):
+        """The generator reads the request once process_req returned.
+        """
+        req = _request()
+        (out, code) = handler.process_req(dict(), self.lone, req)
+        self.assertEqual(code, http.client.OK)
+        self.assertTrue(handler.is_streamed(out))
+        self.assertEqual(self.steps, [('begin', {})])
+        self.assertEqual(handler.collect_stream(out),
+                         [{'i': 0, 'txid': req.txid, 'user': 'someone'},
+                          {'i': 1, 'txid': req.txid, 'user': 'someone'}])
+        self.assertEqual(self.steps,
+                         [('begin', {}), ('commit', {'streamed': 2})])
+        # The request context is left once the stream ended
+        self.assertIsNone(self.lone._request)  # pylint: disable=W0212
+
+    def test_abort(self):
+        """A stream failing partway is journaled as aborted.
+        """
+        (out, _) = handler.process_req(dict(), self.lone,
+                                       _request(count=3, fail=1))
+        with self.assertRaises(LoneException):
+            handler.collect_stream(out)
+        self.assertEqual([step for (step, _) in self.steps],
+                         ['begin', 'abort'])
+
+    def test_closed(self):
+        """A stream not sent to its end is journaled as aborted.
+        """
+        (out, _) = handler.process_req(dict(), self.lone, _request())
+        self.assertEqual(next(out)['i'], 0)
+        out.close()
+        self.assertEqual(self.steps[-1],
+                         ('abort', 'Stream closed after 1 elements'))
+
+    def test_listing(self):
+        """The elements of a listing are streamed the same way.
+        """
+        lone = self.lone
+        lone.list = lambda pk, **kw: {'total': 1, '_elem': iter(
+            [{'txid': lone.txid}])}
+        req = _request()
+        (out, _) = handler.process_req(dict(), lone, req)
+        self.assertEqual(handler.collect_stream(out),
+                         {'total': 1, '_elem': [{'txid': req.txid}]})
+        self.assertEqual(self.steps[-1], ('commit', {'streamed': 1}))
+
+
+class TimeLimitTest(unittest.TestCase):
+    """Handlers are stopped once out of time.
+    """
+
+    def test_get_time_limit(self):
+        """The handler limit is capped by the request deadline.
+        """
+        cases = [
+            (None, None, None),
+            (None, 3, 3),
+            (2, None, 2),
+            (2, 3, 2),
+            (5, 3, 3),
+            (5, -1, -1),
+        ]
+        for (limit, left, expected) in cases:
+            with self.subTest(limit=limit, left=left):
+                func = timeout(limit)(lambda pk: None)
+                self.assertEqual(handler.get_time_limit(func, left), expected)
+        self.assertEqual(handler.get_time_limit(lambda pk: None, 3), 3)
+
+    def test_expired(self):
+        """A handler out of time answers the one timeout reply.
+        """
+        lone = Slow({'mode': 'lone'})
+        req = Request(user='someone', lone='slow', verb='get', pk='a',
+                      obj={})
+        limit = handler.get_time_limit(handler.get_handler(req, lone))
+        with mock.patch.object(handler, 'journal') as journal:
+            started = time.time()
+            (out, code) = handler.process_req(dict(), lone, req, None, limit)
+        self.assertLess(time.time() - started, 0.5)
+        self.assertEqual((out, code),
+                         (protocol.TIMEOUT, http.client.GATEWAY_TIMEOUT))
+        self.assertEqual(journal.call_args[0][2:4],
+                         ('abort', protocol.TIMEOUT))
+
+
+class CacheTtlTest(unittest.TestCase):
+    """How long the reply of a handler may be served again.
+    """
+
+    def test_get_cache_ttl(self):
+        """@cache overrides the ttl of the operation.
+        """
+        cached = cache(30)(lambda pk: None)
+        cases = [
+            (lambda pk: None, None, None),
+            (lambda pk: None, 10, 10),
+            (cached, None, 30),
+            (cached, 10, 30),
+            (cache(0)(lambda pk: None), 10, 10),
+        ]
+        for (func, ttl, expected) in cases:
+            with self.subTest(cache_ttl=getattr(func, 'cache_ttl', None),
+                              ttl=ttl):
+                self.assertEqual(handler.get_cache_ttl(func, ttl), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
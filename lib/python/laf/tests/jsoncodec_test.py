@@ -0,0 +1,135 @@
+"""JSON codecs of the server
+"""
+
+import json
+import math
+import unittest
+
+from laf.server.app import jsoncodec
+
+# Documents every codec encodes to the json.dumps document
+DOCUMENTS = [
+    {'name': 'a', 'list': [1, 2.5, None, True, False], 'nested': {'x': {}}},
+    ['é', '日本', ' ', '"quoted"\n', '\\'],
+    {'int': 2 ** 63 - 1, 'neg': -2 ** 63, 'float': 0.1, 'exp': 1e-7},
+    {'big': 2 ** 64, 'bigger': -10 ** 30, 'in': [10 ** 19]},
+    {1: 'int key', 2.5: 'float key', None: 'null key'},
+    ('tuple', 'as', 'list'),
+    [],
+    'plain',
+    0,
+]
+
+
+def _codecs():
+    return [jsoncodec.get(name) for name in jsoncodec.names()]
+
+
+class CodecTest(unittest.TestCase):
+    """Every codec reads and writes what the standard library does.
+    """
+
+    def test_dumps(self):
+        """Documents decode to what json.dumps gives.
+        """
+        for codec in _codecs():
+            for document in DOCUMENTS:
+                with self.subTest(codec=codec.name, document=document):
+                    expected = json.loads(json.dumps(document))
+                    self.assertEqual(json.loads(codec.dumps(document)),
+                                     expected)
+                    self.assertEqual(json.loads(codec.dumpb(document)),
+                                     expected)
+                    self.assertIsInstance(codec.dumpb(document), bytes)
+
+    def test_loads(self):
+        """Strings, bytes and buffers decode the same way.
+        """
+        for codec in _codecs():
+            for document in DOCUMENTS:
+                text = json.dumps(document)
+                expected = json.loads(text)
+                for data in (text, text.encode(),
+                             memoryview(text.encode())):
+                    with self.subTest(codec=codec.name, data=data):
+                        self.assertEqual(codec.loads(data), expected)
+
+    def test_big_integers(self):
+        """Integers beyond 64 bits stay integers.
+        """
+        for codec in _codecs():
+            with self.subTest(codec=codec.name):
+                for data in ('[18446744073709551616]', b'{"a": -1e400}',
+                             '{"a": 1234567890123456789012}'):
+                    self.assertEqual(codec.loads(data), json.loads(data))
+                self.assertIsInstance(codec.loads('[10000000000000000000]')[0],
+                                      int)
+
+    def test_not_finite(self):
+        """NaN and infinities still encode.
+        """
+        for codec in _codecs():
+            with self.subTest(codec=codec.name):
+                decoded = json.loads(codec.dumps([math.inf, 1]))
+                self.assertEqual(decoded[1], 1)
+
+    def test_invalid(self):
+        """Invalid documents raise ValueError.
+        """
+        for codec in _codecs():
+            for data in ('{', b'[1,]', 'nope', b'\xff'):
+                with self.subTest(codec=codec.name, data=data):
+                    with self.assertRaises(ValueError):
+                        codec.loads(data)
+
+    def test_canonical(self):
+        """Canonical documents are the ones of json.dumps with sorted keys.
+        """
+        document = {'b': [{'y': 1, 'x': object}], 'a': None}
+        expected = json.dumps(document, sort_keys=True, default=str)
+        for codec in _codecs():
+            with self.subTest(codec=codec.name):
+                self.assertEqual(codec.dumps(document, canonical=True),
+                                 expected)
+
+    def test_unserializable(self):
+        """Objects JSON has no type for raise TypeError.
+        """
+        for codec in _codecs():
+            with self.subTest(codec=codec.name):
+                with self.assertRaises(TypeError):
+                    codec.dumps({'a': object()})
+
+
+class RegistryTest(unittest.TestCase):
+    """Codecs are registered by name.
+    """
+
+    def test_registry(self):
+        """The standard codec is always there, the fast one if it can.
+        """
+        self.assertIn(jsoncodec.JSON, jsoncodec.names())
+        self.assertIs(jsoncodec.get(jsoncodec.JSON), jsoncodec.STANDARD)
+        if jsoncodec.orjson is not None:
+            self.assertIs(jsoncodec.FAST, jsoncodec.get(jsoncodec.ORJSON))
+        else:
+            self.assertIs(jsoncodec.FAST, jsoncodec.STANDARD)
+        with self.assertRaises(ValueError) as caught:
+            jsoncodec.get('simplejson')
+        self.assertIn('json', str(caught.exception))
+
+    def test_standard(self):
+        """The module functions write what json.dumps does.
+        """
+        for document in DOCUMENTS:
+            with self.subTest(document=document):
+                self.assertEqual(jsoncodec.dumps(document),
+                                 json.dumps(document))
+                self.assertEqual(jsoncodec.dumpb(document),
+                                 json.dumps(document).encode())
+                self.assertEqual(jsoncodec.loads(json.dumps(document)),
+                                 json.loads(json.dumps(document)))
+
+
+if __name__ == '__main__':
+    unittest.main()
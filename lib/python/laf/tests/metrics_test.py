@@ -0,0 +1,110 @@
+"""Metrics and control socket of the broker
+"""
+
+import unittest
+from unittest import mock
+
+from laf.server import control
+from laf.server import metrics
+
+
+class RenderTest(unittest.TestCase):
+    """Prometheus text exposition of the metrics.
+    """
+
+    def test_counter(self):
+        """Samples are sorted by labels, their values escaped.
+        """
+        counter = metrics.Counter('laf_requests_total', 'Requests',
+                                  ('lone', 'code'))
+        counter.inc(lone='users', code=200)
+        counter.inc(2, lone='users', code=200)
+        counter.inc(lone='a"b\\c\nd', code=500)
+        self.assertEqual(metrics.render([counter]), '\n'.join([
+            '# HELP laf_requests_total Requests',
+            '# TYPE laf_requests_total counter',
+            'laf_requests_total{lone="a\\"b\\\\c\\nd",code="500"} 1',
+            'laf_requests_total{lone="users",code="200"} 3',
+        ]) + '\n')
+
+    def test_gauge(self):
+        """Gauges without labels hold a single value.
+        """
+        gauge = metrics.Gauge('laf_entries', 'Entries')
+        gauge.set(3)
+        gauge.set(2.5)
+        self.assertEqual(list(gauge.lines())[-1], 'laf_entries 2.5')
+        gauge.set(4.0)
+        self.assertEqual(list(gauge.lines())[-1], 'laf_entries 4')
+        gauge.clear()
+        self.assertEqual(len(list(gauge.lines())), 2)
+
+    def test_histogram(self):
+        """Buckets are cumulative, with a sum and a count.
+        """
+        histogram = metrics.Histogram('laf_wait_seconds', 'Wait',
+                                      ('pool',), buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value, pool='default')
+        self.assertEqual(list(histogram.lines())[2:], [
+            'laf_wait_seconds_bucket{pool="default",le="0.1"} 2',
+            'laf_wait_seconds_bucket{pool="default",le="1"} 3',
+            'laf_wait_seconds_bucket{pool="default",le="+Inf"} 4',
+            'laf_wait_seconds_sum{pool="default"} 3.65',
+            'laf_wait_seconds_count{pool="default"} 4',
+        ])
+
+
+class ControlTest(unittest.TestCase):
+    """Commands of the control socket.
+    """
+
+    def setUp(self):
+        # Not bound to a socket, only its commands are run
+        self.control = control.ControlSocket.__new__(control.ControlSocket)
+        self.control.queue = mock.Mock()
+
+    def test_commands(self):
+        """Each command runs its broker method.
+        """
+        queue = self.control.queue
+        cases = [
+            (['resize', 'heavy', '3'], queue.resize_pool, ('heavy', 3)),
+            (['drain', 'Worker-12'], queue.replace_worker, (b'Worker-12',)),
+            (['drain_host', 'h1'], queue.drain_host, ('h1',)),
+            (['undrain_host', 'h1'], queue.undrain_host, ('h1',)),
+            (['reload'], queue.reload, ()),
+            (['status'], queue.status, ()),
+            (['clear_cache'], queue.clear_cache, ()),
+        ]
+        for (words, method, args) in cases:
+            with self.subTest(words=words):
+                method.return_value = 'ok'
+                self.assertEqual(self.control.execute(words), 'ok')
+                method.assert_called_once_with(*args)
+
+    def test_unknown(self):
+        """Unknown commands and wrong arguments are reported.
+        """
+        for words in (['restart'], ['resize', 'heavy'], ['reload', 'now']):
+            with self.subTest(words=words):
+                self.assertEqual(self.control.execute(words),
+                                 'Unknown command {0}'.format(
+                                     ' '.join(words)))
+
+    def test_handle(self):
+        """Answers are json, failures tell what went wrong.
+        """
+        self.control.stream = mock.Mock()
+        self.control.queue.resize_pool.side_effect = KeyError('heavy')
+        with self.assertLogs(control.__name__, 'ERROR'):
+            self.control.handle([b'resize', b'heavy', b'2'])
+        self.control.stream.send.assert_called_once_with(
+            b'{"status": "\'heavy\'"}')
+        self.control.queue.metrics_text.return_value = 'laf 1\n'
+        self.control.handle([b'metrics'])
+        self.control.stream.send.assert_called_with(b'laf 1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
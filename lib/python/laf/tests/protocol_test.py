@@ -0,0 +1,123 @@
+"""Messages exchanged between the server, the broker and the workers
+"""
+
+import json
+import time
+import unittest
+
+import zmq
+
+from laf.server import protocol
+
+REQUEST = {'request': {'lone': 'users', 'verb': 'get', 'pk': 'a',
+                       'obj': {'n': 1, 'names': ['x', 'é']}},
+           'auth': None, 'version': 'v3'}
+
+
+class FramingTest(unittest.TestCase):
+    """Header and payload frames, with each codec.
+    """
+
+    def test_round_trip(self):
+        """Messages decode to what was encoded, whatever the codec.
+        """
+        for codec in protocol.CODECS:
+            with self.subTest(codec=codec):
+                frames = protocol.encode_message(REQUEST, codec,
+                                                 lone='users', deadline=1.5)
+                self.assertEqual(len(frames), 2)
+                self.assertEqual(frames[0][0], protocol.VERSION)
+                header = protocol.decode_header(frames[0])
+                self.assertEqual(header, {'lone': 'users', 'deadline': 1.5,
+                                          'codec': codec})
+                self.assertEqual(protocol.decode_message(frames), REQUEST)
+
+    def test_zmq_frames(self):
+        """Frames received without copying decode the same way.
+        """
+        frames = [zmq.Frame(frame)
+                  for frame in protocol.encode_message(REQUEST, lone='a')]
+        self.assertEqual(protocol.decode_header(frames[0])['lone'], 'a')
+        self.assertEqual(protocol.decode_message(frames), REQUEST)
+
+    def test_version_0(self):
+        """Bare json headers and single json frames are still read.
+        """
+        header = json.dumps({'lone': 'users'}).encode()
+        payload = json.dumps(REQUEST).encode()
+        self.assertEqual(protocol.decode_header(header),
+                         {'lone': 'users', 'codec': protocol.JSON})
+        self.assertEqual(protocol.decode_message([header, payload]),
+                         REQUEST)
+        self.assertEqual(protocol.decode_message([payload]), REQUEST)
+
+    def test_unsupported(self):
+        """Unknown versions and codecs are refused.
+        """
+        for frame in (b'', b'\x01', bytes((protocol.VERSION + 1,)) + b'j{}',
+                      bytes((protocol.VERSION,)) + b'z{}'):
+            with self.subTest(frame=frame):
+                with self.assertRaises(ValueError):
+                    protocol.decode_header(frame)
+
+    def test_codec_follows_header(self):
+        """The payload is decoded with the codec the header names.
+        """
+        frames = protocol.encode_message(REQUEST, protocol.JSON)
+        self.assertEqual(json.loads(frames[1]), REQUEST)
+        self.assertEqual(protocol.decode_message(frames), REQUEST)
+
+    def test_has_more(self):
+        """Parts of a streamed reply tell whether others follow.
+        """
+        self.assertTrue(protocol.has_more(
+            protocol.encode_message({'elem': []}, more=True)))
+        self.assertFalse(protocol.has_more(
+            protocol.encode_message({'elem': []})))
+        self.assertFalse(protocol.has_more([b'{}']))
+
+
+class ReadyTest(unittest.TestCase):
+    """READY frames of the workers.
+    """
+
+    @staticmethod
+    def _received(frames):
+        # As the broker gets them, behind the worker address
+        return [zmq.Frame(frame) for frame in [b'Worker-1'] + frames]
+
+    def test_ready(self):
+        """Credits, completed client and pool go through.
+        """
+        cases = [
+            (protocol.ready(), (1, None, None)),
+            (protocol.ready(4), (4, None, None)),
+            (protocol.ready(2, done=b'client'), (2, b'client', None)),
+            (protocol.ready(3, pool='heavy'), (3, None, 'heavy')),
+            ([b'', protocol.READY], (1, None, None)),
+        ]
+        for (frames, parsed) in cases:
+            with self.subTest(frames=frames):
+                self.assertEqual(protocol.parse_ready(self._received(frames)),
+                                 parsed)
+
+    def test_changed(self):
+        """The lone and primary key of a change go through.
+        """
+        for (lone, pk) in (('users', 'a'), ('users', None), ('hosts', 3)):
+            with self.subTest(lone=lone, pk=pk):
+                frames = self._received(protocol.changed(lone, pk))
+                self.assertEqual(frames[2].bytes, protocol.CHANGED)
+                self.assertEqual(protocol.parse_changed(frames), (lone, pk))
+
+    def test_time_left(self):
+        """Requests without a deadline have all the time.
+        """
+        self.assertIsNone(protocol.time_left(None))
+        self.assertAlmostEqual(protocol.time_left(time.time() + 10), 10,
+                               delta=1)
+        self.assertLess(protocol.time_left(time.time() - 1), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
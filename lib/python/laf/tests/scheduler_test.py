@@ -0,0 +1,172 @@
+"""Priority classes of the requests queued in the broker
+"""
+
+import collections
+import unittest
+
+from laf.server import scheduler
+from laf.server.scheduler import INTERACTIVE, WRITE, LONGRUNNING
+
+
+class Job():
+    """Queued request.
+    """
+
+    def __init__(self, pclass, enqueued=0.0, deadline=None):
+        self.pclass = pclass
+        self.enqueued = enqueued
+        self.deadline = deadline
+
+
+def _fill(pending, count=100):
+    for pclass in scheduler.PRIORITY_CLASSES:
+        for _ in range(count):
+            pending.append(Job(pclass))
+
+
+class ClassifyTest(unittest.TestCase):
+    """The operation, then the lone, then the method set the class.
+    """
+
+    def test_classify(self):
+        """Explicit classes win over the method.
+        """
+        lones = {'report': LONGRUNNING, 'bad': 'urgent'}
+        cases = [
+            ({'method': 'get'}, INTERACTIVE),
+            ({}, INTERACTIVE),
+            ({'method': 'post'}, WRITE),
+            ({'method': 'get', 'lone': 'report'}, LONGRUNNING),
+            ({'method': 'get', 'lone': 'report', 'priority': WRITE}, WRITE),
+            ({'method': 'delete', 'lone': 'bad'}, WRITE),
+            ({'method': 'get', 'priority': 'urgent'}, INTERACTIVE),
+        ]
+        for (fields, pclass) in cases:
+            with self.subTest(fields=fields):
+                self.assertEqual(scheduler.classify(fields, lones), pclass)
+
+    def test_parse_weights(self):
+        """Weights given override the default ones.
+        """
+        self.assertEqual(scheduler.parse_weights(None),
+                         scheduler.DEFAULT_WEIGHTS)
+        self.assertEqual(scheduler.parse_weights('write=5, longrunning=2'),
+                         {INTERACTIVE: 6, WRITE: 5, LONGRUNNING: 2})
+        for spec in ('urgent=1', 'write=0', 'write=x'):
+            with self.subTest(spec=spec):
+                with self.assertRaises(ValueError):
+                    scheduler.parse_weights(spec)
+
+
+class PendingQueueTest(unittest.TestCase):
+    """Order in which the queued requests are dispatched.
+    """
+
+    def test_strict(self):
+        """Higher classes always go first, FIFO within a class.
+        """
+        pending = scheduler.PendingQueue(scheduler.STRICT)
+        jobs = [Job(LONGRUNNING), Job(WRITE), Job(INTERACTIVE),
+                Job(WRITE), Job(INTERACTIVE)]
+        for job in jobs:
+            pending.append(job)
+        self.assertEqual(len(pending), 5)
+        order = [pending.popleft() for _ in jobs]
+        self.assertEqual(order, [jobs[2], jobs[4], jobs[1], jobs[3],
+                                 jobs[0]])
+        self.assertIsNone(pending.popleft())
+        self.assertEqual(len(pending), 0)
+
+    def test_weighted(self):
+        """Busy classes share the dispatches by weight, smoothly.
+        """
+        pending = scheduler.PendingQueue(scheduler.WEIGHTED)
+        _fill(pending)
+        order = [pending.popleft().pclass for _ in range(100)]
+        self.assertEqual(collections.Counter(order),
+                         {INTERACTIVE: 60, WRITE: 30, LONGRUNNING: 10})
+        # Interleaved rather than in bursts of a class
+        self.assertEqual(order[:10].count(INTERACTIVE), 6)
+        self.assertEqual(order[:10].count(LONGRUNNING), 1)
+        self.assertNotIn([INTERACTIVE] * 4,
+                         [order[i:i + 4] for i in range(100)])
+
+    def test_weighted_idle_class(self):
+        """The share of an idle class goes to the busy ones.
+        """
+        pending = scheduler.PendingQueue(scheduler.WEIGHTED,
+                                         {INTERACTIVE: 1, WRITE: 1,
+                                          LONGRUNNING: 1})
+        for _ in range(10):
+            pending.append(Job(WRITE))
+            pending.append(Job(LONGRUNNING))
+        order = [pending.popleft().pclass for _ in range(20)]
+        self.assertEqual(collections.Counter(order),
+                         {WRITE: 10, LONGRUNNING: 10})
+
+    def test_admit(self):
+        """Classes which may not be dispatched are left queued.
+        """
+        for policy in scheduler.POLICIES:
+            with self.subTest(policy=policy):
+                pending = scheduler.PendingQueue(policy)
+                _fill(pending, 2)
+                job = pending.popleft(lambda pclass: pclass == WRITE)
+                self.assertEqual(job.pclass, WRITE)
+                self.assertIsNone(pending.popleft(lambda pclass: False))
+                self.assertEqual(len(pending), 5)
+
+    def test_appendleft(self):
+        """A request put back is the next one of its class.
+        """
+        pending = scheduler.PendingQueue()
+        first = Job(WRITE)
+        pending.append(Job(WRITE))
+        pending.appendleft(first)
+        self.assertIs(pending.popleft(), first)
+
+    def test_expired(self):
+        """Requests past their deadline are taken out in order.
+        """
+        pending = scheduler.PendingQueue()
+        jobs = [Job(INTERACTIVE, deadline=5), Job(INTERACTIVE),
+                Job(WRITE, deadline=20), Job(WRITE, deadline=1)]
+        for job in jobs:
+            pending.append(job)
+        self.assertEqual(pending.pop_expired(10), [jobs[0], jobs[3]])
+        self.assertEqual(len(pending), 2)
+        self.assertEqual(list(pending), [jobs[1], jobs[2]])
+
+    def test_stale(self):
+        """Requests queued for too long are taken out.
+        """
+        pending = scheduler.PendingQueue()
+        jobs = [Job(INTERACTIVE, 1), Job(INTERACTIVE, 5), Job(WRITE, 2)]
+        for job in jobs:
+            pending.append(job)
+        self.assertEqual(pending.pop_stale(3), [jobs[0], jobs[2]])
+        self.assertEqual(list(pending), [jobs[1]])
+
+    def test_report(self):
+        """Wait times are reported, then counted again.
+        """
+        pending = scheduler.PendingQueue()
+        pending.append(Job(WRITE, 10))
+        pending.append(Job(WRITE, 12))
+        for _ in range(2):
+            pending.record_wait(pending.popleft(), 14)
+        report = pending.report()
+        self.assertEqual(report[WRITE]['dispatched'], 2)
+        self.assertEqual(report[WRITE]['wait_avg'], 3.0)
+        self.assertEqual(report[WRITE]['wait_max'], 4.0)
+        self.assertEqual(pending.report()[WRITE]['dispatched'], 0)
+
+    def test_unknown_policy(self):
+        """Only the known policies are accepted.
+        """
+        with self.assertRaises(ValueError):
+            scheduler.PendingQueue('fair')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""Conformance of the compiled validators with Draft4Validator
+"""
+
+import unittest
+
+from jsonschema import Draft4Validator, RefResolver
+from jsonschema.exceptions import ValidationError
+
+from laf.server.app import schemacompiler
+
+SPEC = {
+    'components': {
+        'schemas': {
+            'name': {'type': 'string', 'minLength': 1, 'maxLength': 8,
+                     'pattern': '^[a-z]+$'},
+            'size': {'type': 'integer', 'minimum': 0, 'maximum': 10,
+                     'exclusiveMaximum': True},
+            'node': {
+                'type': 'object',
+                'properties': {
+                    'name': {'$ref': '#/components/schemas/name'},
+                    'children': {
+                        'type': 'array',
+                        'items': {'$ref': '#/components/schemas/node'}}
+                },
+                'required': ['name'],
+                'additionalProperties': False
+            },
+        }
+    }
+}
+
+# Schemas and instances, valid and not, checked against Draft4Validator
+CASES = [
+    ({'type': 'string'}, ['a', 1, None, True, [], {}]),
+    ({'type': 'integer'}, [1, 1.0, True, '1', -3]),
+    ({'type': 'number'}, [1, 1.5, True, '1', None]),
+    ({'type': ['string', 'null']}, ['a', None, 1]),
+    ({'type': 'boolean'}, [True, False, 0, 1]),
+    ({'type': 'array'}, [[], (), {}, 'a']),
+    ({'type': 'object'}, [{}, [], 'a']),
+    ({'enum': ['a', 'b']}, ['a', 'c', 1, None]),
+    ({'enum': [1, True, None, 'x']}, [1, 1.0, True, False, 0, None, 'x', []]),
+    ({'enum': [[1], {'a': 1}]}, [[1], {'a': 1}, [True], 1]),
+    ({'minLength': 2, 'maxLength': 3}, ['a', 'ab', 'abcd', 5]),
+    ({'pattern': 'b+'}, ['abc', 'ac', 3]),
+    ({'minimum': 1, 'maximum': 3}, [0, 1, 3, 4, 2.5, 'a', True]),
+    ({'minimum': 1, 'exclusiveMinimum': True}, [1, 1.01, 0]),
+    ({'multipleOf': 3}, [9, 10, 0, 9.0, 'a']),
+    ({'multipleOf': 0.1}, [0.3, 0.35, 1, 1e308]),
+    ({'required': ['a', 'b']}, [{'a': 1, 'b': 2}, {'a': 1}, [], 'a']),
+    ({'minProperties': 1, 'maxProperties': 2},
+     [{}, {'a': 1}, {'a': 1, 'b': 1, 'c': 1}]),
+    ({'properties': {'a': {'type': 'integer'}, 'b': {}}},
+     [{'a': 1}, {'a': 'x'}, {'b': 'x'}, {}]),
+    ({'properties': {'a': {}}, 'additionalProperties': False},
+     [{'a': 1}, {'a': 1, 'b': 2}, {}]),
+    ({'properties': {'a': {}}, 'additionalProperties': {'type': 'string'}},
+     [{'a': 1, 'b': 'x'}, {'b': 2}]),
+    ({'patternProperties': {'^x': {'type': 'integer'}},
+      'additionalProperties': False},
+     [{'x1': 1}, {'x1': 'a'}, {'y': 1}, {}]),
+    ({'dependencies': {'a': ['b'], 'c': {'required': ['d']}}},
+     [{'a': 1, 'b': 1}, {'a': 1}, {'c': 1}, {'c': 1, 'd': 1}, {}]),
+    ({'items': {'type': 'integer'}, 'minItems': 1, 'maxItems': 2},
+     [[1], [], [1, 2, 3], [1, 'a'], 'a']),
+    ({'items': [{'type': 'integer'}, {'type': 'string'}],
+      'additionalItems': False},
+     [[1, 'a'], [1], [1, 'a', 2], ['a']]),
+    ({'items': [{'type': 'integer'}], 'additionalItems': {'type': 'string'}},
+     [[1, 'a', 'b'], [1, 2]]),
+    ({'uniqueItems': True},
+     [[1, 2], [1, 1], [1, True], [1, 1.0], [[1], [1]], [{'a': 1}, {'a': 2}]]),
+    ({'allOf': [{'type': 'integer'}, {'minimum': 2}]}, [1, 2, 'a']),
+    ({'anyOf': [{'type': 'integer'}, {'type': 'string'}]}, [1, 'a', None]),
+    ({'oneOf': [{'type': 'integer'}, {'minimum': 2}]}, [1, 3, 1.5, 'a']),
+    ({'not': {'type': 'integer'}}, [1, 'a']),
+    ({'$ref': '#/components/schemas/size'}, [0, 9, 10, -1, 'a']),
+    ({'$ref': '#/components/schemas/node'},
+     [{'name': 'a'},
+      {'name': 'a', 'children': [{'name': 'b', 'children': []}]},
+      {'name': 'a', 'children': [{'name': 'B'}]},
+      {'name': 'a', 'children': [{'size': 1}]},
+      {'name': 'a', 'other': 1}]),
+    ({'$ref': '#/components/schemas/name', 'type': 'integer'}, ['a', 1]),
+    ({'type': 'object',
+      'properties': {
+          'path': {'type': 'object',
+                   'properties': {
+                       'primary_key': {'$ref': '#/components/schemas/name'}},
+                   'required': ['primary_key'],
+                   'additionalProperties': False},
+          'body': {'type': 'object',
+                   'properties': {
+                       'name': {'$ref': '#/components/schemas/name'},
+                       'size': {'$ref': '#/components/schemas/size'}},
+                   'required': ['name']}},
+      'additionalProperties': False},
+     [{'path': {'primary_key': 'a'}, 'body': {'name': 'x', 'size': 1}},
+      {'path': {'primary_key': 'a'}, 'body': {'name': 'x', 'size': 11}},
+      {'path': {}, 'body': {'name': 'x'}},
+      {'path': {'primary_key': 'a'}, 'body': {'size': 1}},
+      {'path': {'primary_key': 'a'}, 'query': {}}]),
+]
+
+
+def _resolver():
+    return RefResolver(base_uri='', referrer=SPEC)
+
+
+class SchemaCompilerTest(unittest.TestCase):
+    """Compiled validators agree with Draft4Validator.
+    """
+
+    def test_conformance(self):
+        """Validity and errors are the ones of Draft4Validator.
+        """
+        for (schema, instances) in CASES:
+            compiled = schemacompiler.CompiledValidator(schema, _resolver())
+            reference = Draft4Validator(schema, resolver=_resolver())
+            for instance in instances:
+                with self.subTest(schema=schema, instance=instance):
+                    valid = reference.is_valid(instance)
+                    if not valid:
+                        # The generated code may only ever be unsure
+                        self.assertFalse(compiled.check(instance))
+                    self.assertEqual(compiled.is_valid(instance), valid)
+                    self.assertEqual(
+                        [err.message for err in compiled.iter_errors(
+                            instance)],
+                        [err.message for err in reference.iter_errors(
+                            instance)])
+                    self.assertEqual(self._error(compiled, instance),
+                                     self._error(reference, instance))
+
+    def test_exact(self):
+        """The generated code decides the usual cases alone.
+        """
+        compiled = schemacompiler.CompiledValidator(CASES[-1][0],
+                                                    _resolver())
+        for instance in CASES[-1][1]:
+            self.assertEqual(compiled.check(instance),
+                             Draft4Validator(CASES[-1][0],
+                                             resolver=_resolver()
+                                             ).is_valid(instance))
+
+    def test_fallback(self):
+        """Schemas which can not be compiled get a Draft4Validator.
+        """
+        for schema in ({'type': 'unknown'}, {'$ref': '#/nowhere'},
+                       {'id': 'x', 'type': 'string'}):
+            validator = schemacompiler.compile_validator(schema, _resolver())
+            self.assertIsInstance(validator, Draft4Validator)
+        validator = schemacompiler.compile_validator({'type': 'string'})
+        self.assertIsInstance(validator, schemacompiler.CompiledValidator)
+
+    @staticmethod
+    def _error(validator, instance):
+        """Message and paths of the error raised by validate.
+        """
+        try:
+            validator.validate(instance)
+        except ValidationError as err:
+            return (err.message, list(err.relative_path),
+                    list(err.relative_schema_path))
+        return None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""laf workers of other hosts and their supervisor
+"""
+
+import os
+import shutil
+import signal
+import stat
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from laf.server import broker
+from laf.server import supervisor
+
+# Exits with the status given for its run, its runs are counted in
+# its basedir
+WORKER_BIN = '''#!/bin/sh
+runs=$(ls "$1" | grep -c run)
+touch "$1/run$runs-$$"
+set -- {0}
+shift $runs
+exit ${{1:-0}}
+'''
+
+
+class WorkerHostTest(unittest.TestCase):
+    """Workers of other hosts are told apart by their identity.
+    """
+
+    def test_worker_host(self):
+        """The host is what comes before the pid.
+        """
+        cases = [
+            (b'Worker-1234', None),
+            (b'Worker-web1-1234', 'web1'),
+            (b'Worker-web-1.example.com-1234', 'web-1.example.com'),
+        ]
+        for (identity, host) in cases:
+            with self.subTest(identity=identity):
+                self.assertEqual(broker.worker_host(identity), host)
+
+
+class SupervisorTest(unittest.TestCase):
+    """Workers are restarted unless the broker stopped them.
+    """
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.basedir)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+
+    def _run(self, statuses, n_workers=1):
+        worker_bin = os.path.join(self.basedir, 'worker')
+        with open(worker_bin, 'w') as script:
+            script.write(WORKER_BIN.format(' '.join(map(str, statuses))))
+        os.chmod(worker_bin, stat.S_IRWXU)
+        os.mkdir(os.path.join(self.basedir, 'runs'))
+        laf_supervisor = supervisor.Supervisor(
+            worker_bin, os.path.join(self.basedir, 'runs'), n_workers,
+            {'LAF_POOL': 'default'})
+        with mock.patch.object(broker, 'RESPAWN_DELAY', 0.01):
+            laf_supervisor.run()
+        return len(os.listdir(os.path.join(self.basedir, 'runs')))
+
+    def test_stopped(self):
+        """Workers the broker stopped are not restarted.
+        """
+        self.assertEqual(self._run([0, 0], n_workers=2), 2)
+
+    def test_restarted(self):
+        """Recycled and crashed workers are restarted.
+        """
+        self.assertEqual(self._run([3, 1, 3, 0]), 4)
+
+    def test_crashloop(self):
+        """Workers dying young are restarted later and later.
+        """
+        with self.assertLogs(supervisor.__name__, 'ERROR'):
+            self.assertEqual(self._run([1, 1, 1, 0, 0], n_workers=2), 5)
+
+    def test_backoff(self):
+        """The delay doubles up to its maximum, a worker which lived
+        long enough resets it.
+        """
+        laf_supervisor = supervisor.Supervisor('worker', self.basedir, 1,
+                                               dict())
+        now = time.time()
+        with mock.patch.object(broker, 'RESPAWN_DELAY_MAX', 4.0), \
+                self.assertLogs(supervisor.__name__, 'ERROR'):
+            delays = list()
+            for _ in range(4):
+                self.assertTrue(laf_supervisor.restart_later(now))
+                delays.append(laf_supervisor.restart_delay)
+        self.assertEqual(delays, [1.0, 2.0, 4.0, 4.0])
+        self.assertEqual(len(laf_supervisor.restarts), 4)
+        self.assertFalse(laf_supervisor.restart_later(
+            now - broker.STABLE_UPTIME))
+        self.assertEqual(laf_supervisor.restart_delay, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+"""Encoding of the responses, whole or streamed
+"""
+
+import json
+import unittest
+from unittest import mock
+
+from laf.server.app import jsoncodec
+from laf.server.app import types
+from laf.server.app import yamlcodec
+
+ELEMS = [{'name': 'a', 'tags': ['x', 'y'], 'size': 1},
+         {'name': 'é', 'nested': {'list': [1, 2.5, None, True]}},
+         'plain', 3, [], {}]
+
+# Streamed responses: a bare iterator or a listing, and what the
+# client gets once it is sent whole
+CASES = [
+    (lambda: iter(ELEMS), ELEMS),
+    (lambda: iter([]), []),
+    (lambda: {'total': 6, 'next': None, '_elem': iter(ELEMS)},
+     {'total': 6, 'next': None, '_elem': ELEMS}),
+    (lambda: {'total': 0, '_elem': iter([])}, {'total': 0, '_elem': []}),
+    (lambda: {'_elem': iter(ELEMS)}, {'_elem': ELEMS}),
+    (lambda: {'_elem': iter([])}, {'_elem': []}),
+]
+
+
+def _codecs():
+    return [jsoncodec.get(name) for name in jsoncodec.names()]
+
+
+class StreamTest(unittest.TestCase):
+    """Streamed responses decode to what a whole one would.
+    """
+
+    def test_json(self):
+        """The chunks make up one json document.
+        """
+        for codec in _codecs():
+            encoder = types.JsonObj(codec)
+            for (stream, whole) in CASES:
+                with self.subTest(codec=codec.name, whole=whole):
+                    body = b''.join(encoder.encode_stream(stream()))
+                    self.assertEqual(json.loads(body), whole)
+                    if codec is jsoncodec.STANDARD:
+                        self.assertEqual(body, encoder.encode(whole))
+
+    def test_yaml(self):
+        """The chunks make up one yaml document.
+        """
+        encoder = types.YamlObj()
+        for (stream, whole) in CASES:
+            with self.subTest(whole=whole):
+                body = ''.join(encoder.encode_stream(stream()))
+                self.assertEqual(yamlcodec.load(body), whole)
+
+    def test_ndjson(self):
+        """The rest of a listing comes first, one element per line.
+        """
+        for codec in _codecs():
+            encoder = types.NdjsonObj(codec)
+            for (stream, whole) in CASES:
+                with self.subTest(codec=codec.name, whole=whole):
+                    body = b''.join(encoder.encode_stream(stream()))
+                    lines = encoder.decode(body)
+                    if isinstance(whole, dict):
+                        head = {key: value for key, value in whole.items()
+                                if key != '_elem'}
+                        elems = whole['_elem']
+                        if head:
+                            self.assertEqual(lines[0], head)
+                            lines = lines[1:]
+                    else:
+                        elems = whole
+                    self.assertEqual(lines, elems)
+
+    def test_ndjson_whole(self):
+        """A listing sent whole has the lines of the streamed one.
+        """
+        for codec in _codecs():
+            encoder = types.NdjsonObj(codec)
+            for (stream, whole) in CASES:
+                with self.subTest(codec=codec.name, whole=whole):
+                    self.assertEqual(
+                        encoder.encode(whole),
+                        b''.join(encoder.encode_stream(stream())))
+            self.assertEqual(encoder.decode(encoder.encode({'a': [1]})),
+                             [{'a': [1]}])
+
+    def test_chunks(self):
+        """Parts are gathered into chunks of about STREAM_BUFFER.
+        """
+        elems = [{'i': index} for index in range(100)]
+        with mock.patch.object(types, 'STREAM_BUFFER', 50):
+            chunks = list(types.JsonObj().encode_stream(iter(elems)))
+        self.assertGreater(len(chunks), 10)
+        self.assertTrue(all(len(chunk) < 50 + 12 for chunk in chunks))
+        self.assertEqual(json.loads(b''.join(chunks)), elems)
+
+    def test_lazy(self):
+        """Elements are only read as the chunks are.
+        """
+        read = list()
+
+        def elems():
+            for index in range(10):
+                read.append(index)
+                yield {'i': index}
+        with mock.patch.object(types, 'STREAM_BUFFER', 1):
+            chunks = types.NdjsonObj().encode_stream(elems())
+            next(chunks)
+            self.assertEqual(read, [0])
+
+
+class FactoryTest(unittest.TestCase):
+    """Encoders by mime type, with the configured JSON codec.
+    """
+
+    def tearDown(self):
+        types.TypesObj.use_json_codec(jsoncodec.JSON)
+
+    def test_factory(self):
+        """Unknown mime types have no encoder.
+        """
+        self.assertIsInstance(types.TypesObj.factory('application/yaml'),
+                              types.YamlObj)
+        self.assertIsNone(types.TypesObj.factory('text/html'))
+
+    def test_json_codec(self):
+        """The json and ndjson encoders use the codec chosen.
+        """
+        for name in jsoncodec.names():
+            with self.subTest(codec=name):
+                types.TypesObj.use_json_codec(name)
+                for mime_type in ('application/json',
+                                  'application/x-ndjson'):
+                    self.assertIs(types.TypesObj.factory(mime_type).codec,
+                                  jsoncodec.get(name))
+
+
+if __name__ == '__main__':
+    unittest.main()
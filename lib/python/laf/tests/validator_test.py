@@ -0,0 +1,143 @@
+"""Response validation policies
+"""
+
+import unittest
+from unittest import mock
+
+import flask
+from jsonschema.exceptions import ValidationError
+
+from laf.server.app import config
+from laf.server.app import validator
+
+
+class Schema():
+    """Validator of the responses, recording what it checked.
+    """
+
+    def __init__(self):
+        self.checked = list()
+
+    def validate(self, instance):
+        """Fail for a response without a name.
+        """
+        self.checked.append(instance)
+        if 'name' not in instance['200']:
+            raise ValidationError('name')
+
+
+class Executor():
+    """Executor running what it was given once asked.
+    """
+
+    def __init__(self):
+        self.jobs = list()
+
+    def submit(self, func, *args):
+        """Keep a job for later.
+        """
+        self.jobs.append((func, args))
+
+    def run(self):
+        """Run the kept jobs.
+        """
+        for (func, args) in self.jobs:
+            func(*args)
+
+
+def _validator(policy=None, lone='users'):
+    return validator.ResponseValidator(Schema(), lone, 'get', policy)
+
+
+def _count(result, lone='users'):
+    return validator.RESPONSE_VALIDATIONS.values.get((lone, 'get', result),
+                                                     0)
+
+
+class PolicyTest(unittest.TestCase):
+    """Policy of the operation, else of its lone, else of the server.
+    """
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        self.app.config['response_validation'] = (
+            config.get_response_validation_cfg({'response_validation': {
+                'policy': 'sampled', 'rate': 0.25,
+                'lones': {'reports': 'async', 'audit': {'policy': 'off'}}}}))
+        context = self.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        validator.RESPONSE_VALIDATIONS.clear()
+
+    def test_selection(self):
+        """Operations override lones which override the server.
+        """
+        cases = [
+            (_validator(), {'policy': 'sampled', 'rate': 0.25}),
+            (_validator(lone='reports'), {'policy': 'async', 'rate': 0.25}),
+            (_validator(lone='audit'), {'policy': 'off', 'rate': 0.25}),
+            (_validator({'policy': 'always', 'rate': 1.0}, lone='reports'),
+             {'policy': 'always', 'rate': 1.0}),
+        ]
+        for (resp_validator, policy) in cases:
+            with self.subTest(lone=resp_validator.lone,
+                              policy=resp_validator.policy):
+                self.assertEqual(validator.response_policy(resp_validator),
+                                 policy)
+
+    def test_unconfigured(self):
+        """Every response is validated by default.
+        """
+        del self.app.config['response_validation']
+        self.assertEqual(validator.response_policy(_validator()),
+                         {'policy': 'always', 'rate': 1.0})
+
+    def test_invalid(self):
+        """Unknown policies and rates out of range are refused.
+        """
+        for value in ('never', {'policy': 'sampled', 'rate': 2}):
+            with self.subTest(value=value):
+                with self.assertRaises(Exception):
+                    config.get_validation_policy(value)
+
+    def test_sampled(self):
+        """Sampled out responses are counted as skipped.
+        """
+        resp_validator = _validator()
+        with mock.patch.object(validator.random, 'random',
+                               side_effect=[0.1, 0.5]):
+            validator.validate_response(resp_validator, {}, 200, 'tx')
+            validator.validate_response(resp_validator, {}, 200, 'tx')
+        self.assertEqual(len(resp_validator.validator.checked), 1)
+        self.assertEqual(_count('invalid'), 1)
+        self.assertEqual(_count('skipped'), 1)
+
+    def test_async_copy(self):
+        """What is validated in the background is what was returned.
+        """
+        resp_validator = _validator({'policy': 'async', 'rate': 1.0})
+        executor = Executor()
+        response = {'name': 'a'}
+        with mock.patch.dict(validator._ASYNC,  # pylint: disable=W0212
+                             {'executor': executor, 'backlog': 0}):
+            validator.validate_response(resp_validator, response, 200, 'tx')
+            response.clear()
+            executor.run()
+        self.assertEqual(resp_validator.validator.checked,
+                         [{'200': {'name': 'a'}}])
+        self.assertEqual(_count('valid'), 1)
+
+    def test_async_dropped(self):
+        """Responses beyond the backlog are counted as dropped.
+        """
+        resp_validator = _validator({'policy': 'async', 'rate': 1.0})
+        with mock.patch.dict(validator._ASYNC,  # pylint: disable=W0212
+                             {'executor': Executor(),
+                              'backlog': validator.ASYNC_BACKLOG}):
+            validator.validate_response(resp_validator, {}, 200, 'tx')
+        self.assertEqual(_count('dropped'), 1)
+        self.assertEqual(_count('skipped'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
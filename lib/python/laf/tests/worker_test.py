@@ -0,0 +1,283 @@
+"""laf workers serving the requests of the broker
+"""
+
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+import os
+import signal
+import subprocess
+import sys
+import time
+import unittest
+from unittest import mock
+
+from laf.server import protocol
+from laf.server import worker
+
+
+# Starts the long running processes of a worker and prints their pids
+START_LONGRUNNING = """
+from laf.server import worker
+laf_worker = worker.Worker('/nonexistent')
+laf_worker.start_longrunning()
+pids = laf_worker.longrunning_pool._processes
+print(' '.join(str(pid) for pid in pids), flush=True)
+input()
+"""
+
+
+def _alive(pid):
+    """Whether a process runs, zombies do not.
+    """
+    try:
+        with open('/proc/{0}/stat'.format(pid)) as stat:
+            return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+def _worker(**env):
+    environ = {'LAF_DEPLOYMENT': 'test', 'WORKER_SOCKET': 'inproc://test'}
+    environ.update(env)
+    with mock.patch.dict(os.environ, environ):
+        return worker.Worker('/nonexistent')
+
+
+class Pool():
+    """Process pool keeping the submitted requests pending.
+    """
+
+    def __init__(self):
+        self.submitted = list()
+
+    def submit(self, func, *args):
+        """Keep a request, its future is completed by the test.
+        """
+        future = futures.Future()
+        self.submitted.append((func, args, future))
+        return future
+
+
+class LongrunningTest(unittest.TestCase):
+    """@longrunning requests handed to the long running processes.
+    """
+
+    def setUp(self):
+        self.worker = _worker(LAF_LONGRUNNING_PROCS='2',
+                              LAF_LONGRUNNING_BACKLOG='1')
+        self.pool = self.worker.longrunning_pool = Pool()
+
+    def test_backlog(self):
+        """Requests beyond the processes and their backlog are refused.
+        """
+        for index in range(3):
+            self.assertTrue(self.worker.submit_longrunning(index, None, 5))
+        self.assertFalse(self.worker.submit_longrunning(3, None, 5))
+        self.assertEqual([args for (_, args, _) in self.pool.submitted],
+                         [(0, None, 5), (1, None, 5), (2, None, 5)])
+
+    def test_done(self):
+        """Completed requests make room for others, failed or not.
+        """
+        for index in range(3):
+            self.worker.submit_longrunning(index, None, None)
+        self.pool.submitted[0][2].set_result(('ok', 200))
+        self.pool.submitted[1][2].set_exception(RuntimeError('failed'))
+        self.assertEqual(len(self.worker.longrunning), 1)
+        self.assertTrue(self.worker.submit_longrunning(3, None, None))
+
+    def test_changed(self):
+        """The broker is told once a @longrunning change is done.
+        """
+        lone = mock.Mock()
+        self.worker.worker_config = {'config': {}, 'lones': {'users': lone}}
+        sent = list()
+        for method in ('post', 'get'):
+            header = protocol.encode_header(
+                {'lone': 'users', 'pk': 'a', 'method': method})
+            req = protocol.encode({'request': {'lone': 'users', 'pk': 'a'},
+                                   'auth': None})
+            with mock.patch.object(worker.handler, 'get_handler',
+                                   return_value=object()), \
+                    mock.patch.object(worker.handler, 'is_async_request',
+                                      return_value=True):
+                self.worker.handle(b'client', header, req, sent.append)
+        self.assertEqual([frames[1] for frames in sent],
+                         [b'client', b'client'])
+        for (_, _, future) in self.pool.submitted:
+            future.set_result(('ok', 200))
+        self.assertEqual(sent[2:], [protocol.changed('users', 'a')])
+
+    def test_broken_pool(self):
+        """Dead long running processes retire the worker.
+        """
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool()
+        self.worker.longrunning_pool = broken
+        with mock.patch.object(self.worker, 'start_longrunning') as start:
+            with self.assertLogs(worker.__name__, 'ERROR'):
+                self.assertFalse(
+                    self.worker.submit_longrunning(0, None, None))
+            self.assertFalse(self.worker.submit_longrunning(1, None, None))
+        start.assert_not_called()
+        self.assertEqual(broken.submit.call_count, 1)
+        self.assertEqual(self.worker.recycle_reason(),
+                         'long running processes died')
+        socket = mock.Mock()
+        self.worker.check_recycle(socket)
+        socket.send_multipart.assert_called_once_with(
+            [b'', protocol.RETIRE])
+
+    def test_broken_running(self):
+        """Processes dying under a request retire the worker too.
+        """
+        self.worker.submit_longrunning(0, None, None)
+        with self.assertLogs(worker.__name__, 'ERROR'):
+            self.pool.submitted[0][2].set_exception(BrokenProcessPool())
+        self.assertTrue(self.worker.longrunning_broken)
+        self.assertFalse(self.worker.submit_longrunning(1, None, None))
+        self.assertEqual(len(self.pool.submitted), 1)
+
+
+class OrphanTest(unittest.TestCase):
+    """Long running processes die with their worker.
+    """
+
+    @unittest.skipUnless(os.path.isdir('/proc/self'), 'needs /proc')
+    def test_killed(self):
+        """Killing a worker kills its long running processes.
+        """
+        libdir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(worker.__file__))))
+        env = dict(os.environ, PYTHONPATH=libdir, LAF_DEPLOYMENT='test',
+                   WORKER_SOCKET='inproc://test', LAF_LONGRUNNING_PROCS='2')
+        proc = subprocess.Popen([sys.executable, '-c', START_LONGRUNNING],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, env=env)
+        self.addCleanup(proc.stdin.close)
+        self.addCleanup(proc.stdout.close)
+        children = [int(pid) for pid in proc.stdout.readline().split()]
+        self.assertEqual(len(children), 2)
+        self.assertTrue(all(_alive(pid) for pid in children))
+        os.kill(proc.pid, signal.SIGKILL)
+        proc.wait()
+        deadline = time.time() + 5
+        while any(_alive(pid) for pid in children) and (
+                time.time() < deadline):
+            time.sleep(0.05)
+        self.assertFalse([pid for pid in children if _alive(pid)])
+
+    def test_parent_gone(self):
+        """Without prctl the processes notice their parent is gone.
+        """
+        with mock.patch.object(worker.os, 'getppid', return_value=1), \
+                mock.patch.object(worker.os, '_exit',
+                                  side_effect=SystemExit) as exited:
+            with self.assertRaises(SystemExit):
+                worker._watch_parent(  # pylint: disable=W0212
+                    os.getpid())
+        exited.assert_called_once_with(1)
+
+
+class RecycleTest(unittest.TestCase):
+    """Workers ask to be replaced once past one of their limits.
+    """
+
+    def test_unlimited(self):
+        """Workers without limits are never recycled.
+        """
+        laf_worker = _worker()
+        laf_worker.requests = 10 ** 6
+        laf_worker.started -= 10 ** 6
+        self.assertIsNone(laf_worker.recycle_reason())
+
+    def test_requests(self):
+        """The request limit is spread by its jitter.
+        """
+        limits = {_worker(LAF_MAX_REQUESTS='100',
+                          LAF_MAX_REQUESTS_JITTER='10').max_requests
+                  for _ in range(50)}
+        self.assertTrue(limits <= set(range(100, 111)))
+        self.assertGreater(len(limits), 1)
+        laf_worker = _worker(LAF_MAX_REQUESTS='100')
+        laf_worker.requests = 99
+        self.assertIsNone(laf_worker.recycle_reason())
+        laf_worker.requests = 100
+        self.assertEqual(laf_worker.recycle_reason(), 'served 100 requests')
+
+    def test_age(self):
+        """Workers are recycled once old enough.
+        """
+        laf_worker = _worker(LAF_MAX_AGE='60')
+        self.assertIsNone(laf_worker.recycle_reason())
+        laf_worker.started = time.time() - 61
+        self.assertEqual(laf_worker.recycle_reason(), 'older than 60.0s')
+
+    def test_rss(self):
+        """Workers are recycled once using too much memory.
+        """
+        laf_worker = _worker(LAF_MAX_RSS='100')
+        with mock.patch.object(worker, 'rss_bytes',
+                               return_value=99 * 1024 * 1024):
+            self.assertIsNone(laf_worker.recycle_reason())
+        with mock.patch.object(worker, 'rss_bytes',
+                               return_value=150 * 1024 * 1024):
+            self.assertEqual(laf_worker.recycle_reason(),
+                             'using 150MB of memory')
+        self.assertGreater(worker.rss_bytes(), 0)
+
+    def test_retire_once(self):
+        """The broker is asked once to replace the worker.
+        """
+        laf_worker = _worker(LAF_MAX_REQUESTS='1')
+        socket = mock.Mock()
+        laf_worker.check_recycle(socket)
+        socket.send_multipart.assert_not_called()
+        laf_worker.requests = 1
+        laf_worker.check_recycle(socket)
+        laf_worker.check_recycle(socket)
+        socket.send_multipart.assert_called_once_with(
+            [b'', protocol.RETIRE])
+        self.assertTrue(laf_worker.retiring)
+
+
+class StreamTest(unittest.TestCase):
+    """Streamed responses are sent to the broker in parts.
+    """
+
+    def _stream(self, resp):
+        sent = list()
+        with mock.patch.object(worker, 'STREAM_CHUNK', 2):
+            _worker().stream(b'client', resp, protocol.JSON, sent.append,
+                             'tx')
+        for frames in sent:
+            self.assertEqual(frames[:3], [b'', b'client', b''])
+        return [(protocol.decode_message(frames[3:]),
+                 protocol.has_more(frames[3:])) for frames in sent]
+
+    def test_listing(self):
+        """The rest of the listing, then the elements by chunks.
+        """
+        parts = self._stream({'total': 3, '_elem': iter('abc')})
+        self.assertEqual(parts, [
+            ({'resp': {'total': 3}, 'code': 200, 'stream': True}, True),
+            ({'elem': ['a', 'b']}, True),
+            ({'elem': ['c']}, False),
+        ])
+
+    def test_failed(self):
+        """An element failing ends the stream with its error.
+        """
+        def elems():
+            yield 'a'
+            raise ValueError('broken')
+        with self.assertLogs(worker.__name__, 'ERROR'):
+            parts = self._stream(elems())
+        self.assertEqual(parts[0][0]['resp'], None)
+        self.assertEqual(parts[-1], ({'elem': ['a'],
+                                      'error': "ValueError('broken')"},
+                                     False))
+
+
+if __name__ == '__main__':
+    unittest.main()
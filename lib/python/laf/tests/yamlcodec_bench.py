@@ -0,0 +1,59 @@
+"""Throughput of the YAML codec against the pure Python PyYAML
+
+Run with python -m laf.tests.yamlcodec_bench
+"""
+
+import time
+
+import yaml
+
+from laf.server.app import yamlcodec
+
+
+def _payloads():
+    """Typical lone payloads: an object and a listing of them.
+    """
+    obj = {'pk': 'host0042', 'name': 'host0042.example.com',
+           'size': 42, 'ratio': 0.75, 'enabled': True, 'owner': None,
+           'tags': ['web', 'prod', 'emea'],
+           'attributes': {'os': 'linux', 'cpus': 16, 'memory': 65536}}
+    listing = {'_elem': [dict(obj, pk='host{0:04}'.format(i), size=i)
+                         for i in range(1000)],
+               '_links': {'_self': {'href': 'http://laf/lone'}}}
+    return (('object', obj), ('listing of 1000', listing))
+
+
+def _rate(func, arg, seconds=1.0):
+    """Calls per second of func over about seconds.
+    """
+    count = 0
+    start = time.perf_counter()
+    while True:
+        func(arg)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main():
+    """Print the encode and decode rates before and after.
+    """
+    print('libyaml: {0}'.format(yamlcodec.LIBYAML))
+    for (name, payload) in _payloads():
+        text = yaml.dump(payload)
+        size = len(text) / 1024.0 / 1024.0
+        cases = (
+            ('encode', 'yaml.dump', yaml.dump, payload),
+            ('encode', 'yamlcodec.dump', yamlcodec.dump, payload),
+            ('decode', 'yaml.load', lambda text: yaml.load(
+                text, Loader=yaml.Loader), text),
+            ('decode', 'yamlcodec.load', yamlcodec.load, text))
+        for (operation, label, func, arg) in cases:
+            rate = _rate(func, arg)
+            print('{0:16} {1} {2:15} {3:10.1f}/s {4:8.2f} MiB/s'.format(
+                name, operation, label, rate, rate * size))
+
+
+if __name__ == '__main__':
+    main()
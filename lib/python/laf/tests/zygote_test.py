@@ -0,0 +1,230 @@
+"""Zygote forking the workers and the broker talking to it
+"""
+
+import os
+import select
+import signal
+import sys
+import time
+import unittest
+from unittest import mock
+
+from laf.server import broker
+from laf.server import zygote
+from laf.server.app import jsoncodec
+from laf.tests.broker_test import BrokerTestCase
+
+# The broker tests fake os.kill
+_KILL = os.kill
+
+
+def _run_worker():
+    """Fake worker run, exits after LIFE seconds with status EXIT.
+    """
+    time.sleep(float(os.environ.get('LIFE', 0)))
+    sys.exit(int(os.environ.get('EXIT', 0)))
+
+
+def start_zygote():
+    """Fork a zygote whose workers are fake, return its pid, the pipe
+    the broker writes its commands to and the one it reads events from.
+    """
+    (commands_r, commands_w) = os.pipe()
+    (events_r, events_w) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.close(commands_w)
+            os.close(events_r)
+            with mock.patch.object(zygote.Zygote, 'preload'), \
+                    mock.patch.object(zygote.worker, 'Worker') as worker:
+                worker.return_value.run.side_effect = _run_worker
+                zygote.Zygote('/nonexistent', commands_r, events_w).run()
+            code = 0
+        finally:
+            os._exit(code)  # pylint: disable=W0212
+    os.close(commands_r)
+    os.close(events_w)
+    return (pid, commands_w, events_r)
+
+
+def _wait(pid, timeout=5):
+    """Reap a process, None if it still runs after timeout, 0 if it was
+    reaped already.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            (done, status) = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            return 0
+        if done:
+            return status
+        time.sleep(0.01)
+    return None
+
+
+class ZygoteTest(unittest.TestCase):
+    """The zygote answers the commands of the broker line by line.
+    """
+
+    def setUp(self):
+        (self.pid, self.commands, self.events) = start_zygote()
+        self.buffer = b''
+        self.addCleanup(self._stop)
+
+    def _stop(self):
+        for fd in (self.commands, self.events):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if _wait(self.pid) is None:
+            _KILL(self.pid, signal.SIGKILL)
+            os.waitpid(self.pid, 0)
+
+    def _event(self):
+        while b'\n' not in self.buffer:
+            self.assertTrue(select.select([self.events], [], [], 5)[0])
+            data = os.read(self.events, 65536)
+            self.assertTrue(data)
+            self.buffer += data
+        (line, self.buffer) = self.buffer.split(b'\n', 1)
+        return jsoncodec.loads(line)
+
+    def test_spawn(self):
+        """Commands split across writes are read whole.
+        """
+        self.assertEqual(self._event(), {'event': 'ready'})
+        command = jsoncodec.dumpb({'cmd': 'spawn', 'env': {'EXIT': '3'}})
+        os.write(self.commands, command[:10])
+        time.sleep(0.05)
+        os.write(self.commands, command[10:] + b'\n' + command + b'\n')
+        pids = set()
+        exited = dict()
+        while len(exited) < 2:
+            event = self._event()
+            if event['event'] == 'spawned':
+                pids.add(event['pid'])
+            else:
+                self.assertEqual(event['event'], 'exited')
+                exited[event['pid']] = event['status']
+        self.assertEqual(len(pids), 2)
+        self.assertEqual(set(exited), pids)
+        for status in exited.values():
+            self.assertEqual(os.WEXITSTATUS(status), 3)
+
+    def test_broker_gone(self):
+        """The zygote exits once the broker closed its pipe.
+        """
+        self.assertEqual(self._event(), {'event': 'ready'})
+        os.close(self.commands)
+        self.assertEqual(_wait(self.pid), 0)
+
+
+class BrokerZygoteTest(BrokerTestCase):
+    """The broker forks its workers through a real zygote.
+    """
+
+    def setUp(self):
+        super().setUp()
+        (self.zygote_pid, commands, events) = start_zygote()
+        self.zygote = mock.Mock(pid=self.zygote_pid,
+                                stdin=os.fdopen(commands, 'wb'),
+                                stdout=os.fdopen(events, 'rb'))
+        self.addCleanup(self._stop)
+        zygotes = [self.zygote]
+        spawn = self.Popen.side_effect
+        self.Popen.side_effect = lambda *args, **kwargs: (
+            zygotes.pop() if zygotes and 'LAF_ZYGOTE' in kwargs['env']
+            else spawn(*args, **kwargs))
+        self.queue.preload = True
+        self.queue.worker_env = {'LIFE': '2'}
+        self.forked = set()
+
+    def _stop(self):
+        for stream in (self.zygote.stdin, self.zygote.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        for pid in self.forked | {self.zygote_pid}:
+            try:
+                _KILL(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        _wait(self.zygote_pid)
+
+    def _pump(self, forks):
+        """Handle the events of the zygote until it forked forks workers.
+        """
+        fd = self.zygote.stdout.fileno()
+        pool = self.queue.pools['default']
+        while len(pool.procs) < forks or not self.queue.zygote_ready:
+            self.assertTrue(select.select([fd], [], [], 5)[0])
+            self.queue.handle_zygote(fd, None)
+        self.forked.update(pool.procs)
+
+    def _spawned(self):
+        """Workers started without the zygote.
+        """
+        return [kwargs for (_, kwargs) in self.Popen.call_args_list
+                if 'LAF_ZYGOTE' not in kwargs['env']]
+
+    def test_fork(self):
+        """Workers are forked by the zygote.
+        """
+        with mock.patch.object(broker, 'set_subreaper'):
+            self.queue.start_workers(2)
+        self._pump(2)
+        self.assertEqual(self.Popen.call_count, 1)
+        self.assertEqual(len(self.forked), 2)
+        self.assertNotIn(self.zygote_pid, self.forked)
+
+    def test_partial(self):
+        """Events split across reads are handled once whole.
+        """
+        (events_r, events_w) = os.pipe()
+        self.addCleanup(os.close, events_w)
+        self.queue.zygote = mock.Mock(stdout=os.fdopen(events_r, 'rb'))
+        self.addCleanup(self.queue.zygote.stdout.close)
+        event = jsoncodec.dumpb({'event': 'spawned', 'pid': 42})
+        os.write(events_w, event[:7])
+        self.assertEqual(self.queue.read_zygote(), [])
+        os.write(events_w, event[7:] + b'\n' + event[:3])
+        self.assertEqual(self.queue.read_zygote(),
+                         [{'event': 'spawned', 'pid': 42}])
+        os.write(events_w, event[3:] + b'\n')
+        self.assertEqual(self.queue.read_zygote(),
+                         [{'event': 'spawned', 'pid': 42}])
+
+    def test_killed(self):
+        """Workers a killed zygote did not fork are started from scratch.
+        """
+        with mock.patch.object(broker, 'set_subreaper'):
+            self.queue.start_workers(1)
+        self._pump(1)
+        pool = self.queue.pools['default']
+        # The request is left unanswered in the pipe
+        _KILL(self.zygote_pid, signal.SIGSTOP)
+        self.assertIsNone(self.queue.spawn_worker(pool))
+        self.assertEqual(pool.forking, 1)
+        _KILL(self.zygote_pid, signal.SIGKILL)
+        self.assertIsNotNone(_wait(self.zygote_pid))
+        with self.assertLogs(broker.__name__, 'ERROR'):
+            self.queue.handle_zygote(self.zygote.stdout.fileno(), None)
+        self.assertIsNone(self.queue.zygote)
+        self.assertEqual(pool.forking, 0)
+        self.assertEqual(len(self._spawned()), 1)
+        self.assertEqual(len(pool.procs), 2)
+        self.assertIsNotNone(self.queue.spawn_worker(pool))
+        self.assertEqual(len(self._spawned()), 2)
+        # Reaped, a new zygote forks the next workers
+        with self.assertLogs(broker.__name__, 'ERROR'):
+            self.queue.zygote_died()
+        self.assertIsNotNone(self.queue.zygote)
+
+
+if __name__ == '__main__':
+    unittest.main()